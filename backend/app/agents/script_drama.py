@@ -1,5 +1,5 @@
 """短剧创作 Agent：剧本 → 分镜 + 文生视频用 Prompt 列表"""
-from app.schemas import ScriptDramaResult, StoryboardItem
+from app.schemas import ScriptDramaResult, storyboard_list_adapter
 from app.services import (
     has_llm,
     generate_storyboard_from_script_drama_llm,
@@ -31,23 +31,8 @@ def run_script_drama_agent(user_input: str) -> ScriptDramaResult:
         if refined:
             storyboard_raw = refined
 
-    storyboard = [
-        StoryboardItem(
-            index=item["index"],
-            shot_type=item.get("shot_type", ""),
-            shot_desc=item["shot_desc"],
-            copy_text=item.get("copy", ""),
-            duration_sec=item.get("duration_sec"),
-            shot_arrangement=item.get("shot_arrangement", ""),
-            shooting_approach=item.get("shooting_approach", ""),
-            camera_technique=item.get("camera_technique", ""),
-            t2v_prompt=item.get("t2v_prompt", ""),
-            generation_method=item.get("generation_method", "t2v"),
-            character_name=item.get("character_name"),
-            character_names=item.get("character_names"),
-        )
-        for item in storyboard_raw
-    ]
+    # 原始 dict 的 copy 键即 StoryboardItem.copy_text 的别名，多余键忽略
+    storyboard = storyboard_list_adapter.validate_python(storyboard_raw)
 
     # 文生视频用 Prompt 列表：优先用导演级 t2v_prompt（含景别/角色/光线/运镜），否则用景别+画面+镜头手法拼
     prompts = [
@@ -7,7 +7,7 @@ import shutil
 import subprocess
 import uuid
 from pathlib import Path
-from typing import Optional
+from typing import Any, Callable, Optional, TypeVar
 
 import httpx
 from dotenv import load_dotenv
@@ -16,9 +16,11 @@ from dotenv import load_dotenv
 _env = Path(__file__).resolve().parent.parent / ".env"
 load_dotenv(_env)
 
-from fastapi import Depends, FastAPI, Header, HTTPException
+from fastapi import Depends, FastAPI, Header, HTTPException, Request
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse
+from pydantic import BaseModel, ValidationError
 
 from app.schemas import (
     CreateRequest,
@@ -62,7 +64,11 @@ from app.services.video_concat import (
 )
 from app.services.minimax_music import generate_bgm
 from app.services import iflytek_speech, volcano_speech
-from app.services.kling_video import get_kling_task_status_batch
+from app.services.kling_video import (
+    aclose_client as aclose_kling_client,
+    aget_kling_task_status_batch,
+    get_kling_task_status_batch,
+)
 
 # TTS 引擎：volcano | iflytek；默认 volcano（多情感、男女音色映射清晰）
 TTS_ENGINE = (os.getenv("TTS_ENGINE") or "volcano").strip().lower()
@@ -103,7 +109,12 @@ from app.services.video_post import (
     run_drawtext_script_to_video,
     apply_ambient_and_stickers,
 )
-from app.services.llm import infer_voice_for_drama, infer_voice_for_drama_line, infer_emotion_for_drama_lines
+from app.services.llm import (
+    infer_emotion_for_drama_lines,
+    infer_voice_for_drama,
+    infer_voice_for_drama_line,
+    prefetch_voices_for_drama_lines,
+)
 from app.services.store import (
     init_db,
     create_task,
@@ -147,6 +158,67 @@ MERGED_DIR.mkdir(parents=True, exist_ok=True)
 CHAR_REF_DIR = MERGED_DIR / "character_refs"
 CHAR_REF_DIR.mkdir(parents=True, exist_ok=True)
 
+_ModelT = TypeVar("_ModelT", bound=BaseModel)
+
+
+# 经 _json_body 解析的请求模型：FastAPI 看不到它们是请求体，由 _openapi_with_json_bodies 补进 OpenAPI components
+_JSON_BODY_MODELS: dict[str, type[BaseModel]] = {}
+
+
+def _json_body(model: type[_ModelT]) -> Callable:
+    """
+    大请求体依赖：直接 model_validate_json(原始 bytes)，由 pydantic-core 一次完成解析与校验，
+    省去 json.loads → dict → 校验 的中间对象（分镜 + base64 参考图可达数 MB）。校验失败仍返回 422。
+    路由需同时传 openapi_extra=_json_body_openapi(model)，/docs 与生成的客户端才有请求体定义。
+    """
+    _JSON_BODY_MODELS[model.__name__] = model
+
+    async def _dep(request: Request) -> _ModelT:
+        body = await request.body()
+        try:
+            return model.model_validate_json(body)
+        except ValidationError as e:
+            # 不回传原始 body：bytes 可能不是 UTF-8（默认 422 处理器编码时会变成 500），且可达数 MB；
+            # JSON 解析失败时 err["input"] 即整段原始 bytes，只保留截断后的文本前缀
+            errors = []
+            for err in e.errors(include_url=False):
+                err = {**err, "loc": ("body", *err["loc"])}
+                if isinstance(err.get("input"), (bytes, bytearray)):
+                    err["input"] = bytes(err["input"][:200]).decode("utf-8", errors="replace")
+                errors.append(err)
+            raise RequestValidationError(errors)
+
+    return _dep
+
+
+def _json_body_openapi(model: type[BaseModel]) -> dict:
+    """_json_body 路由的 openapi_extra：声明与普通 body 参数相同的 requestBody。"""
+    return {
+        "requestBody": {
+            "content": {"application/json": {"schema": {"$ref": f"#/components/schemas/{model.__name__}"}}},
+            "required": True,
+        }
+    }
+
+
+_default_openapi = app.openapi
+
+
+def _openapi_with_json_bodies() -> dict[str, Any]:
+    if app.openapi_schema:
+        return app.openapi_schema
+    schema = _default_openapi()
+    components = schema.setdefault("components", {}).setdefault("schemas", {})
+    for name, model in _JSON_BODY_MODELS.items():
+        model_schema = model.model_json_schema(ref_template="#/components/schemas/{model}")
+        for def_name, def_schema in model_schema.pop("$defs", {}).items():
+            components.setdefault(def_name, def_schema)
+        components.setdefault(name, model_schema)
+    return schema
+
+
+app.openapi = _openapi_with_json_bodies
+
 
 @app.on_event("startup")
 def on_startup():
@@ -157,6 +229,11 @@ def on_startup():
             logging.getLogger(__name__).info("路由: %s %s", sorted(r.methods)[0], r.path)
 
 
+@app.on_event("shutdown")
+async def on_shutdown():
+    await aclose_kling_client()
+
+
 @app.get("/")
 def root():
     return {"service": "short-video-drama-agents", "docs": "/docs"}
@@ -350,6 +427,42 @@ def _speaker_from_copy_prefix(copy: str) -> Optional[str]:
     return (m.group(1).strip() or None) if m else None
 
 
+def _voice_character_name(shot, copy: str, character_names: Optional[list[str]]) -> Optional[str]:
+    """本镜配音用的角色名：对白前缀说话人优先，单角色剧本兜底，否则取分镜出镜角色。"""
+    char_name = _speaker_from_copy_prefix(copy)
+    if not char_name and character_names and len(character_names) == 1:
+        char_name = character_names[0]
+    if not char_name:
+        char_name = _shot_character_name(shot)
+    return char_name
+
+
+def _prefetch_drama_voices(
+    storyboard: list,
+    character_names: Optional[list[str]],
+    voice_id: Optional[str],
+    shot_voice_ids: Optional[list[Optional[str]]],
+    script_snippet: str,
+    voice_cache: dict[str, str],
+    prebuilt_tts_paths: Optional[list[Optional[str]]] = None,
+) -> None:
+    """逐镜 TTS 前，把需要 LLM 选音色的各角色并发预判好写入 voice_cache（已指定音色/纯动作/已有预生成配音的镜跳过）。"""
+    if (voice_id or "").strip():
+        return
+    lines: list[tuple[str, Optional[str]]] = []
+    for i, shot in enumerate(storyboard):
+        if shot_voice_ids and i < len(shot_voice_ids) and (shot_voice_ids[i] or "").strip():
+            continue
+        if prebuilt_tts_paths and i < len(prebuilt_tts_paths) and prebuilt_tts_paths[i] and os.path.isfile(prebuilt_tts_paths[i]):
+            continue
+        copy = _shot_copy(shot)
+        tts_content = _strip_tts_speaker_prefix(copy, character_names)
+        if not tts_content or _is_action_only_no_speech(tts_content):
+            continue
+        lines.append((copy, _voice_character_name(shot, copy, character_names)))
+    prefetch_voices_for_drama_lines(lines, script_snippet=script_snippet, voice_cache=voice_cache)
+
+
 def _build_drama_tts_and_target_durations(
     storyboard_slice: list,
     character_references: Optional[list] = None,
@@ -376,6 +489,9 @@ def _build_drama_tts_and_target_durations(
         tail_pad = float(os.getenv("DRAMA_TTS_TAIL_PAD_SEC", "0.25") or 0.25)
         min_shot_sec = float(os.getenv("DRAMA_MIN_SHOT_SEC", "1.0") or 1.0)
         voice_cache: dict[str, str] = {}  # 同一剧本内同一角色复用音色，避免前后镜男女混乱
+        _prefetch_drama_voices(
+            storyboard_slice, character_names, voice_id, shot_voice_ids, script_summary or "", voice_cache,
+        )
         for i, shot in enumerate(storyboard_slice):
             copy = _shot_copy(shot)
             tts_content = _strip_tts_speaker_prefix(copy, character_names)
@@ -391,11 +507,7 @@ def _build_drama_tts_and_target_durations(
             if shot_voice_ids and i < len(shot_voice_ids) and (shot_voice_ids[i] or "").strip():
                 shot_voice = (shot_voice_ids[i] or "").strip()
             if not shot_voice:
-                char_name = _speaker_from_copy_prefix(copy)
-                if not char_name and character_names and len(character_names) == 1:
-                    char_name = character_names[0]
-                if not char_name:
-                    char_name = _shot_character_name(shot)
+                char_name = _voice_character_name(shot, copy, character_names)
                 shot_voice = (voice_id or "").strip() or infer_voice_for_drama_line(
                     copy, character_name=char_name, script_snippet=script_summary or "", voice_cache=voice_cache
                 )
@@ -782,6 +894,10 @@ def _add_bgm_and_voiceover(
                 )
             segments: list[tuple[Optional[str], float]] = []
             voice_cache: dict[str, str] = {}  # 同一剧本内同一角色复用音色，避免前后镜男女混乱
+            _prefetch_drama_voices(
+                storyboard, character_names, voice_id, shot_voice_ids, script_summary_for_emotion or "", voice_cache,
+                prebuilt_tts_paths=prebuilt_tts_paths,
+            )
             for i, shot in enumerate(storyboard):
                 copy = _shot_copy(shot)
                 d = segment_durations[i] if i < len(segment_durations) else 5.0
@@ -802,11 +918,7 @@ def _add_bgm_and_voiceover(
                 if shot_voice_ids and i < len(shot_voice_ids) and (shot_voice_ids[i] or "").strip():
                     shot_voice = (shot_voice_ids[i] or "").strip()
                 if not shot_voice:
-                    char_name = _speaker_from_copy_prefix(copy)
-                    if not char_name and character_names and len(character_names) == 1:
-                        char_name = character_names[0]
-                    if not char_name:
-                        char_name = _shot_character_name(shot)
+                    char_name = _voice_character_name(shot, copy, character_names)
                     shot_voice = (voice_id or "").strip() or infer_voice_for_drama_line(
                         copy,
                         character_name=char_name,
@@ -1020,8 +1132,8 @@ def list_voice_options():
     ]
 
 
-@app.post("/api/video")
-def generate_video(req: VideoRequest):
+@app.post("/api/video", openapi_extra=_json_body_openapi(VideoRequest))
+def generate_video(req: VideoRequest = Depends(_json_body(VideoRequest))):
     """步骤3：根据分镜生成视频（短剧用可灵）。"""
     ref_image = _resolve_character_reference(req)
     backend_public_url = os.getenv("BACKEND_PUBLIC_URL", "").strip() or None
@@ -1240,8 +1352,8 @@ def generate_video(req: VideoRequest):
     )
 
 
-@app.post("/api/video/regenerate-shot")
-def regenerate_shot(req: RegenerateShotRequest):
+@app.post("/api/video/regenerate-shot", openapi_extra=_json_body_openapi(RegenerateShotRequest))
+def regenerate_shot(req: RegenerateShotRequest = Depends(_json_body(RegenerateShotRequest))):
     """短剧：对单个镜头按（可选）覆盖的提示词重新生成，返回该镜的下载 URL。支持多角色按镜拉取参考图。"""
     if req.shot_index < 0 or req.shot_index >= len(req.storyboard):
         raise HTTPException(status_code=400, detail="shot_index 超出分镜范围")
@@ -1333,7 +1445,7 @@ def voiceover_only(req: VoiceoverOnlyRequest):
 
 
 @app.get("/api/video/kling-task-status")
-def kling_task_status(task_ids: str, use_omni: bool = True):
+async def kling_task_status(task_ids: str, use_omni: bool = True):
     """
     查询可灵任务状态，供前端按镜头展示：绿 succeed / 蓝 processing / 红 failed。
     task_ids 为逗号分隔的 task_id 列表。全部成功时 all_succeed 为 true，再调用 POST /api/video/concat-after-kling-tasks 进行剪辑。
@@ -1341,13 +1453,16 @@ def kling_task_status(task_ids: str, use_omni: bool = True):
     ids = [x.strip() for x in (task_ids or "").split(",") if x and x.strip()]
     if not ids:
         return {"items": [], "all_succeed": False}
-    items = get_kling_task_status_batch(ids, use_omni=use_omni)
+    # 前端按固定频率轮询：在事件循环上并发查询，不占用线程池
+    items = await aget_kling_task_status_batch(ids, use_omni=use_omni)
     all_succeed = all(item.get("status") == "succeed" for item in items)
     return {"items": items, "all_succeed": all_succeed}
 
 
-@app.post("/api/video/concat-after-kling-tasks")
-def concat_after_kling_tasks(req: ConcatAfterKlingTasksRequest):
+@app.post("/api/video/concat-after-kling-tasks", openapi_extra=_json_body_openapi(ConcatAfterKlingTasksRequest))
+def concat_after_kling_tasks(
+    req: ConcatAfterKlingTasksRequest = Depends(_json_body(ConcatAfterKlingTasksRequest)),
+):
     """
     可灵任务全部成功后再下载并剪辑成片。前端轮询 kling-task-status 直到 all_succeed 后调用本接口，
     使用任务返回的下载 URL 立即下载（减少过期/超时），再拼接、字幕、配音。
@@ -1566,7 +1681,8 @@ def api_list_tasks(
 ):
     """分页列出任务摘要。"""
     rows = list_tasks(pipeline=pipeline, limit=limit, offset=offset)
-    return [TaskSummary(**r) for r in rows]
+    # 行来自本库写入且已是 TaskSummary 结构的纯 dict：直接序列化返回，跳过逐行建模型与 response_model 二次校验
+    return JSONResponse(rows)
 
 
 @app.get("/api/tasks/{task_id}", response_model=TaskDetail)
@@ -1576,7 +1692,7 @@ def api_get_task(task_id: str):
     task = get_task(task_id)
     if not task:
         raise HTTPException(status_code=404, detail="任务不存在")
-    return TaskDetail(**task)
+    return TaskDetail.model_construct(**task)
 
 
 @app.patch("/api/tasks/{task_id}")
@@ -1708,8 +1824,13 @@ def api_me_redeem_membership(body: RedeemMembershipRequest, user_id: str = Depen
     return {"ok": True, "membership_id": membership_id, "tier_code": body.tier_code, "months": body.months, "points_spent": cost}
 
 
-@app.post("/api/create", response_model=CreateResponse, response_model_by_alias=True)
-def create(req: CreateRequest):
+@app.post(
+    "/api/create",
+    response_model=CreateResponse,
+    response_model_by_alias=True,
+    openapi_extra=_json_body_openapi(CreateRequest),
+)
+def create(req: CreateRequest = Depends(_json_body(CreateRequest))):
     """
     统一创作入口：根据用户输入自动判断类型并执行对应管线。
     - 剧本/短剧 → script_drama：返回分镜表 + 文生视频用 Prompt 列表
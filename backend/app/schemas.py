@@ -1,6 +1,6 @@
 """API 请求与响应的 Pydantic 模型"""
 from typing import Literal, Optional
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, TypeAdapter, field_validator
 
 
 class CreateRequest(BaseModel):
@@ -62,6 +62,10 @@ class StoryboardItem(BaseModel):
     model_config = {"populate_by_name": True}
 
 
+# 分镜列表专用校验器：LLM/模板产出的 dict 列表一次性校验为 StoryboardItem 列表
+storyboard_list_adapter: TypeAdapter[list[StoryboardItem]] = TypeAdapter(list[StoryboardItem])
+
+
 class ContentRequest(BaseModel):
     """步骤2：生成内容请求"""
     input: str = Field(..., description="用户输入")
@@ -74,6 +78,13 @@ class CharacterReferenceItem(BaseModel):
     role: Literal["主角", "配角"] = Field(..., description="主角 / 配角；可有多名主角、多名配角")
     image_base64: Optional[str] = Field(None, description="参考图：data:image/jpeg;base64,... 或留空表示仅占位")
 
+    @field_validator("image_base64", mode="after")
+    @classmethod
+    def _check_image_base64(cls, v: Optional[str]) -> Optional[str]:
+        if v is not None and v.startswith("data:") and not v.startswith("data:image/"):
+            raise ValueError("image_base64 须为图片 data URL（data:image/...）")
+        return v
+
 
 class VideoRequest(BaseModel):
     """步骤3：生成视频请求"""
@@ -239,7 +250,7 @@ class TaskSummary(BaseModel):
     """任务列表项（不含大字段）"""
     id: str
     pipeline: Literal["script_drama"]
-    input: str
+    input: str  # 列表中为截断后的输入摘要，完整输入见 TaskDetail
     input_preview: str = ""
     title: Optional[str] = None
     created_at: str
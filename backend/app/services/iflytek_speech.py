@@ -4,8 +4,10 @@ import hashlib
 import hmac
 import json
 import os
+import re
 import tempfile
 import threading
+import time
 import urllib.parse
 from datetime import datetime, timezone
 from typing import Optional
@@ -24,6 +26,20 @@ IFLYTEK_TTS_HOST = (os.getenv("IFLYTEK_TTS_HOST") or "cbm01.cn-huabei-1.xf-yun.c
 IFLYTEK_TTS_PATH = (os.getenv("IFLYTEK_TTS_PATH") or "/v1/private/mcd9m97e6").strip()
 TTS_WSS = f"wss://{IFLYTEK_TTS_HOST}{IFLYTEK_TTS_PATH}"
 
+# 鉴权 HMAC 的 key 只预处理一次，每次建连 copy() 后仅对签名原文做 update
+_AUTH_HMAC = (
+    hmac.new(IFLYTEK_API_SECRET.encode("utf-8"), digestmod=hashlib.sha256)
+    if IFLYTEK_API_SECRET
+    else None
+)
+
+# 讯飞并发连接配额：同时在途的合成会话数上限，超出的调用排队等待
+try:
+    IFLYTEK_MAX_CONCURRENCY = max(1, int(os.getenv("IFLYTEK_MAX_CONCURRENCY", "8")))
+except (TypeError, ValueError):
+    IFLYTEK_MAX_CONCURRENCY = 8
+_IFLY_SEM = threading.BoundedSemaphore(IFLYTEK_MAX_CONCURRENCY)
+
 # 单次请求文本上限（超拟人接口建议单次不超过约 1MB base64 对应原文，这里保守按 8000 字节分段）
 MAX_TEXT_BYTES = 8000
 
@@ -42,29 +58,40 @@ VOICE_OPTIONS = [
 ]
 
 
+# 音色别名（中文名 / 拼音片段）→ vcn：编译为一条正则，单次扫描即可命中
+_VCN_ALIASES: dict[str, str] = {name.replace(" ", ""): vcn for vcn, name, *_ in VOICE_OPTIONS}
+_VCN_ALIASES.update({
+    "lingyuyan": "x6_lingyuyan_pro",
+    "lingfeiyi": "x6_lingfeiyi_pro",
+    "lingxiaoxuan": "x6_lingxiaoxuan_pro",
+    "lingyuzhao": "x5_lingyuzhao_flow",
+    "lingxiaoyue": "x6_lingxiaoyue_pro",
+    "wennuan": "x6_wennuancixingnansheng_mini",
+    "温暖磁性": "x6_wennuancixingnansheng_mini",
+    "pangbai": "x6_pangbainan1_pro",
+    "旁白": "x6_pangbainan1_pro",
+})
+# 长别名优先，避免「旁白」抢先匹配「旁白男声」之类的前缀
+_VCN_PATTERN = re.compile("|".join(map(re.escape, sorted(_VCN_ALIASES, key=len, reverse=True))))
+_VCN_BY_ID = {vcn.lower(): vcn for vcn, *_ in VOICE_OPTIONS}
+
+
 def _voice_id_to_vcn(voice_id: Optional[str]) -> str:
     """将业务 voice_id（vcn id 或中文名）映射到讯飞超拟人 vcn。"""
     s = (voice_id or "").strip()
     if not s:
         return DEFAULT_VCN
     v = s.lower().replace(" ", "")
+    vcn = _VCN_BY_ID.get(v)
+    if vcn:
+        return vcn
+    m = _VCN_PATTERN.search(v)
+    if m:
+        return _VCN_ALIASES[m.group(0)]
+    # 传入的是中文名片段（如「聆小」）时按音色表顺序取第一个包含它的
     for vcn, name, *_ in VOICE_OPTIONS:
-        if vcn.lower() == v or name.replace(" ", "") in v or v in name.replace(" ", ""):
+        if v in name.replace(" ", ""):
             return vcn
-    if "lingyuyan" in v or "聆玉言" in v:
-        return "x6_lingyuyan_pro"
-    if "lingfeiyi" in v or "聆飞逸" in v:
-        return "x6_lingfeiyi_pro"
-    if "lingxiaoxuan" in v or "聆小璇" in v:
-        return "x6_lingxiaoxuan_pro"
-    if "lingyuzhao" in v or "聆玉昭" in v:
-        return "x5_lingyuzhao_flow"
-    if "lingxiaoyue" in v or "聆小玥" in v:
-        return "x6_lingxiaoyue_pro"
-    if "wennuan" in v or "温暖磁性" in v:
-        return "x6_wennuancixingnansheng_mini"
-    if "pangbai" in v or "旁白" in v:
-        return "x6_pangbainan1_pro"
     # 先判女声再判男声，否则 "female-yujie" 里的 "male" 会被误判成男声
     if "female" in v or "女" in v or "yujie" in v or "shaonv" in v or "tianmei" in v or "chengshu" in v:
         return "x6_lingxiaoxuan_pro"
@@ -75,17 +102,15 @@ def _voice_id_to_vcn(voice_id: Optional[str]) -> str:
 
 def _build_auth_url() -> str:
     """生成带鉴权参数的 wss URL（HMAC-SHA256，与 WebSocket 通用鉴权一致）。"""
-    if not IFLYTEK_API_KEY or not IFLYTEK_API_SECRET:
+    if not IFLYTEK_API_KEY or _AUTH_HMAC is None:
         raise ValueError("IFLYTEK_API_KEY / IFLYTEK_API_SECRET 未配置")
     now = datetime.now(timezone.utc)
     date = now.strftime("%a, %d %b %Y %H:%M:%S GMT")
     request_line = f"GET {IFLYTEK_TTS_PATH} HTTP/1.1"
     signature_origin = f"host: {IFLYTEK_TTS_HOST}\ndate: {date}\n{request_line}"
-    signature_sha = hmac.new(
-        IFLYTEK_API_SECRET.encode("utf-8"),
-        signature_origin.encode("utf-8"),
-        digestmod=hashlib.sha256,
-    ).digest()
+    mac = _AUTH_HMAC.copy()
+    mac.update(signature_origin.encode("utf-8"))
+    signature_sha = mac.digest()
     signature = base64.b64encode(signature_sha).decode("utf-8")
     authorization_origin = (
         f'api_key="{IFLYTEK_API_KEY}", '
@@ -93,7 +118,8 @@ def _build_auth_url() -> str:
         f'headers="host date request-line", '
         f'signature="{signature}"'
     )
-    authorization = base64.b64encode(authorization_origin.encode("utf-8")).decode("utf-8")
+    # 讯飞 WebSocket 鉴权要求 authorization 为 authorization_origin 的 base64，不能省略
+    authorization = base64.b64encode(authorization_origin.encode("utf-8")).decode("ascii")
     params = {
         "authorization": authorization,
         "date": date,
@@ -112,7 +138,7 @@ def text_to_speech(
 ) -> tuple[Optional[str], Optional[str]]:
     """
     讯飞超拟人 TTS，返回 (本地 mp3 路径, error_msg)。
-    文本超长会按 MAX_TEXT_BYTES 分段合成并拼接为单文件。
+    文本超长会按 MAX_TEXT_BYTES 分段，在同一 WebSocket 会话内流式发送并合成为单文件。
     """
     if not text or not text.strip():
         return None, "文本为空"
@@ -139,48 +165,41 @@ def text_to_speech(
         remaining = remaining[last:]
         chunks.append(chunk_bytes.decode("utf-8", errors="ignore"))
 
-    audio_parts: list[bytes] = []
-    for chunk_text in chunks:
-        if not chunk_text.strip():
-            continue
-        path, err = _synthesize_one(chunk_text, vcn=vcn, speed=speed, volume=volume, pitch=pitch)
-        if err or not path:
-            return None, err or "合成返回空"
-        try:
-            with open(path, "rb") as f:
-                audio_parts.append(f.read())
-        finally:
-            try:
-                os.unlink(path)
-            except Exception:
-                pass
-    if not audio_parts:
+    chunks = [c for c in chunks if c.strip()]
+    if not chunks:
         return None, "无音频数据"
-
-    out = tempfile.NamedTemporaryFile(suffix=".mp3", delete=False)
-    for part in audio_parts:
-        out.write(part)
-    out.close()
-    return out.name, None
+    return _synthesize_stream(chunks, vcn=vcn, speed=speed, volume=volume, pitch=pitch)
 
 
-def _synthesize_one(
+def _build_request_body(
     text: str,
-    vcn: str = DEFAULT_VCN,
-    speed: int = 50,
-    volume: int = 50,
-    pitch: int = 50,
-) -> tuple[Optional[str], Optional[str]]:
-    """单段文本超拟人合成，返回 (临时 mp3 路径, error_msg)。"""
-    auth_url = _build_auth_url()
-    # 超拟人 payload.text 为 base64 编码的原文
-    text_b64 = base64.b64encode(text.encode("utf-8")).decode("ascii")
-    request_body = {
+    seq: int,
+    status: int,
+    vcn: str,
+    speed: int,
+    volume: int,
+    pitch: int,
+) -> dict:
+    """构造单帧请求。status：0 首帧 / 1 中间帧 / 2 末帧；首帧携带 parameter，单帧会话直接发 2。"""
+    body: dict = {
         "header": {
             "app_id": IFLYTEK_APP_ID,
-            "status": 2,
+            "status": status,
         },
-        "parameter": {
+        "payload": {
+            "text": {
+                "encoding": "utf8",
+                "compress": "raw",
+                "format": "plain",
+                "status": status,
+                "seq": seq,
+                # 超拟人 payload.text 为 base64 编码的原文
+                "text": base64.b64encode(text.encode("utf-8")).decode("ascii"),
+            },
+        },
+    }
+    if seq == 0:
+        body["parameter"] = {
             "oral": {"oral_level": "mid"},
             "tts": {
                 "vcn": vcn,
@@ -199,80 +218,117 @@ def _synthesize_one(
                     "frame_size": 0,
                 },
             },
-        },
-        "payload": {
-            "text": {
-                "encoding": "utf8",
-                "compress": "raw",
-                "format": "plain",
-                "status": 2,
-                "seq": 0,
-                "text": text_b64,
-            },
-        },
-    }
-    payload = json.dumps(request_body, ensure_ascii=False)
+        }
+    return body
 
-    collected: list[tuple[int, bytes]] = []  # (seq, audio_bytes)
-    err_msg: Optional[str] = None
-    done = threading.Event()
 
-    def on_open(ws):
-        ws.send(payload)
+def _synthesize_stream(
+    chunks: list[str],
+    vcn: str = DEFAULT_VCN,
+    speed: int = 50,
+    volume: int = 50,
+    pitch: int = 50,
+) -> tuple[Optional[str], Optional[str]]:
+    """
+    多段文本在同一 WebSocket 会话内流式合成，返回 (临时 mp3 路径, error_msg)。
+    仅建连 / 鉴权一次：首帧 status=0，中间帧 status=1，末帧 status=2。
+    """
+    auth_url = _build_auth_url()
+    n = len(chunks)
+    payloads = []
+    for i, chunk_text in enumerate(chunks):
+        if i == n - 1:
+            status = 2
+        elif i == 0:
+            status = 0
+        else:
+            status = 1
+        body = _build_request_body(chunk_text, i, status, vcn, speed, volume, pitch)
+        payloads.append(json.dumps(body, ensure_ascii=False))
 
-    def on_message(ws, message):
-        nonlocal err_msg
-        try:
+    # 服务端 seq 基本单调递增：按序帧直接追加到 buf，乱序帧暂存 pending 待补齐后再并入；
+    # 多个文本帧共用一个会话时 seq 可能回退（重复 seq / 每个文本帧各自从头编号），所有帧均保留，不覆盖
+    buf = bytearray()
+    pending: dict[int, list[bytes]] = {}
+    expected_seq: Optional[int] = None
+    err_msg: Optional[str] = None
+    # 在调用方线程内同步收发（FastAPI 同步路由本身已在线程池中），不再为每次合成另起 run_forever 线程
+    # 超时随分段数放宽：单段 25s，与原先逐段合成的总等待上限一致
+    ws = None
+    _IFLY_SEM.acquire()
+    deadline = time.monotonic() + 25 * n
+    try:
+        ws = websocket.create_connection(auth_url, timeout=25)
+        for payload in payloads:
+            ws.send(payload)
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            ws.settimeout(remaining)
+            message = ws.recv()
+            if not message:
+                break
             obj = json.loads(message)
             header = obj.get("header", {})
             code = header.get("code", -1)
             if code != 0:
                 err_msg = header.get("message") or f"code={code}"
-                done.set()
-                return
+                break
             pl = obj.get("payload") or {}
             audio_block = pl.get("audio")
             if audio_block:
                 seq = audio_block.get("seq", 0)
                 audio_b64 = audio_block.get("audio")
                 if audio_b64:
-                    collected.append((seq, base64.b64decode(audio_b64)))
+                    if expected_seq is None or seq < expected_seq:
+                        # 首帧或 seq 回退：先把暂存帧按 seq 顺序并入，再从该 seq 重新接续
+                        for k in sorted(pending):
+                            buf += b"".join(pending[k])
+                        pending.clear()
+                        expected_seq = seq
+                    if seq == expected_seq:
+                        buf += base64.b64decode(audio_b64)
+                        expected_seq += 1
+                        while expected_seq in pending:
+                            buf += b"".join(pending.pop(expected_seq))
+                            expected_seq += 1
+                    else:
+                        pending.setdefault(seq, []).append(base64.b64decode(audio_b64))
                 if audio_block.get("status") == 2:
-                    done.set()
-        except Exception as e:
-            err_msg = str(e)
-            done.set()
-
-    def on_error(ws, error):
-        nonlocal err_msg
-        err_msg = str(error) if error else "WebSocket error"
-        done.set()
-
-    ws = websocket.WebSocketApp(
-        auth_url,
-        on_open=on_open,
-        on_message=on_message,
-        on_error=on_error,
-    )
-    t = threading.Thread(target=lambda: ws.run_forever())
-    t.daemon = True
-    t.start()
-    done.wait(timeout=25)
-    try:
-        ws.close()
-    except Exception:
+                    break
+    except websocket.WebSocketTimeoutException:
         pass
-    t.join(timeout=2)
+    except Exception as e:
+        err_msg = str(e) or "WebSocket error"
+    finally:
+        if ws is not None:
+            try:
+                ws.close()
+            except Exception:
+                pass
+        _IFLY_SEM.release()
 
     if err_msg:
         return None, err_msg
-    if not collected:
+    # 中间有缺帧时，剩余暂存帧按 seq 顺序补在末尾
+    for seq in sorted(pending):
+        buf += b"".join(pending[seq])
+    if not buf:
         return None, "未收到音频数据"
 
-    # 按 seq 排序后拼接
-    collected.sort(key=lambda x: x[0])
     out = tempfile.NamedTemporaryFile(suffix=".mp3", delete=False)
-    for _, part in collected:
-        out.write(part)
+    out.write(buf)
     out.close()
     return out.name, None
+
+
+def _synthesize_one(
+    text: str,
+    vcn: str = DEFAULT_VCN,
+    speed: int = 50,
+    volume: int = 50,
+    pitch: int = 50,
+) -> tuple[Optional[str], Optional[str]]:
+    """单段文本超拟人合成，返回 (临时 mp3 路径, error_msg)。"""
+    return _synthesize_stream([text], vcn=vcn, speed=speed, volume=volume, pitch=pitch)
@@ -1,12 +1,25 @@
 """可灵 Kling 视频生成：Omni-Video 图/主体参考生视频，用于商品短视频（物品一致性更好）。"""
+import asyncio
+import atexit
+import base64
+import hashlib
+import hmac
+import json
 import logging
 import os
-import ssl
+import random
+import threading
 import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 
 import httpx
-import jwt
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 logger = logging.getLogger(__name__)
 
@@ -19,26 +32,129 @@ KLING_DURATION = os.getenv("KLING_DURATION", "5")
 KLING_T2V_OMNI_DURATIONS = ("5", "10")
 KLING_ASPECT_RATIO = os.getenv("KLING_ASPECT_RATIO", "16:9")
 
+# 接口路径（相对 KLING_BASE，由共享客户端的 base_url 拼接）
+_T2V_CREATE_PATH = "/v1/videos/text2video"
+_OMNI_CREATE_PATH = "/v1/videos/omni-video"
+_T2V_QUERY_PREFIX = "/v1/videos/tasks/"
+_OMNI_QUERY_PREFIX = "/v1/videos/omni-video/"
+
 # 查询可灵时的 GET 请求：遇 SSL/连接错误自动重试，避免 WRONG_VERSION_NUMBER、UNEXPECTED_EOF 等瞬时错误
 KLING_QUERY_RETRIES = int(os.getenv("KLING_QUERY_RETRIES", "4"))
 KLING_QUERY_RETRY_DELAY_SEC = float(os.getenv("KLING_QUERY_RETRY_DELAY_SEC", "2"))
+# 重试间隔按指数增长（带 0~50% 随机抖动，避免多个轮询同时重试），单次不超过此上限
+KLING_QUERY_RETRY_MAX_SEC = float(os.getenv("KLING_QUERY_RETRY_MAX_SEC", "30"))
+# 共享客户端是否启用 HTTP/2（多路复用，多个并发轮询共用一条 TLS 连接）。默认关闭：部分环境下 h2/ALPN 协商
+# 会出现 WRONG_VERSION_NUMBER / UNEXPECTED_EOF，需确认网络环境支持后再设 KLING_HTTP2=1；需安装 httpx[http2]
+KLING_HTTP2 = (os.getenv("KLING_HTTP2") or "0").strip().lower() in ("1", "true", "yes")
+if KLING_HTTP2:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        logger.warning("KLING_HTTP2 已开启但未安装 h2（pip install 'httpx[http2]'），回退为 HTTP/1.1")
+        KLING_HTTP2 = False
+# 轮询任务时连续出现可重试的请求级失败达到此次数即放弃
+KLING_POLL_MAX_CONSECUTIVE_ERRORS = max(1, int(os.getenv("KLING_POLL_MAX_CONSECUTIVE_ERRORS", "3")))
+# 批量状态查询的短时缓存：前端多处/多人同时刷新同一批任务时复用结果，减少重复 GET；终态结果缓存更久
+KLING_QUERY_CACHE_TTL_SEC = float(os.getenv("KLING_QUERY_CACHE_TTL_SEC", "2"))
+KLING_QUERY_CACHE_TERMINAL_TTL_SEC = float(os.getenv("KLING_QUERY_CACHE_TERMINAL_TTL_SEC", "300"))
+# 批量查询任务状态时的并发线程数
+KLING_BATCH_QUERY_WORKERS = max(1, int(os.getenv("KLING_BATCH_QUERY_WORKERS", "8")))
+
+
+def _loads(content: bytes) -> dict:
+    """解析可灵响应体（有 orjson 时用 orjson）；非 JSON（如网关 HTML 错误页）返回 {}，由调用方回退到 r.text。"""
+    try:
+        data = orjson.loads(content) if orjson is not None else json.loads(content)
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def _dumps(payload: dict) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+
+# 进程内共享的可灵 HTTP 客户端：连接池复用 TCP/TLS，轮询与创建任务不再每次握手
+_client: Optional[httpx.Client] = None
+_client_pid: Optional[int] = None
+_client_lock = threading.Lock()
+
+
+def _get_client() -> httpx.Client:
+    """返回共享 httpx.Client（懒创建；fork 后的子进程会重建，不复用父进程的连接）。"""
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+    with _client_lock:
+        if _client is None or _client_pid != pid:
+            _client = httpx.Client(
+                base_url=KLING_BASE,
+                timeout=20.0,
+                http2=KLING_HTTP2,
+                limits=httpx.Limits(max_keepalive_connections=8, max_connections=16, keepalive_expiry=60.0),
+            )
+            _client_pid = pid
+    return _client
+
+
+def _close_client() -> None:
+    if _client is not None and _client_pid == os.getpid():
+        _client.close()
+
+
+atexit.register(_close_client)
+
+# 异步客户端供 ASGI 路由直接 await：连接与事件循环绑定，循环变化（如 asyncio.run 多次调用）时重建
+_aclient: Optional[httpx.AsyncClient] = None
+_aclient_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _get_aclient() -> httpx.AsyncClient:
+    """返回当前事件循环上的共享 httpx.AsyncClient（懒创建）。"""
+    global _aclient, _aclient_loop
+    loop = asyncio.get_running_loop()
+    if _aclient is None or _aclient_loop is not loop:
+        _aclient = httpx.AsyncClient(
+            base_url=KLING_BASE,
+            timeout=20.0,
+            http2=KLING_HTTP2,
+            limits=httpx.Limits(max_keepalive_connections=32, max_connections=64, keepalive_expiry=60.0),
+        )
+        _aclient_loop = loop
+    return _aclient
+
+
+async def aclose_client() -> None:
+    """关闭异步客户端（应用 shutdown 时在同一事件循环上调用）。"""
+    global _aclient, _aclient_loop
+    if _aclient is not None:
+        await _aclient.aclose()
+    _aclient = None
+    _aclient_loop = None
+
+
+def _retry_delay(attempt: int) -> float:
+    """第 attempt 次失败后的等待秒数：指数增长至上限，再乘 1~1.5 的随机抖动。"""
+    delay = min(KLING_QUERY_RETRY_MAX_SEC, KLING_QUERY_RETRY_DELAY_SEC * (2 ** attempt))
+    return delay * (1 + random.random() * 0.5)
 
 
 def _get_with_retry(url: str, headers: dict) -> tuple[Optional[httpx.Response], Optional[str]]:
-    """对可灵 GET 请求做有限次重试，遇 SSL/连接错误时等待后重试。返回 (response, error)，成功时 error 为 None。"""
+    """对可灵 GET 请求做有限次重试，遇传输层错误（httpx.TransportError：SSL 握手/连接/超时/协议错误）时等待后重试。返回 (response, error)，成功时 error 为 None。"""
     last_err: Optional[str] = None
     retries = max(1, KLING_QUERY_RETRIES)
     for attempt in range(retries):
         try:
-            # 使用 HTTP/1.1、关闭 http2，减少部分环境下的 SSL 兼容问题（WRONG_VERSION_NUMBER / UNEXPECTED_EOF）
-            with httpx.Client(timeout=20.0, http2=False) as client:
-                r = client.get(url, headers=headers)
-                return r, None
-        except (ssl.SSLError, OSError, httpx.ConnectError, httpx.ReadTimeout, httpx.WriteTimeout, httpx.ConnectTimeout) as e:
+            r = _get_client().get(url, headers=headers)
+            return r, None
+        except httpx.TransportError as e:
             last_err = str(e)
             if attempt < retries - 1:
-                delay = KLING_QUERY_RETRY_DELAY_SEC * (attempt + 1)
-                logger.warning("可灵查询请求 SSL/连接错误，%.0fs 后重试（%d/%d）: %s", delay, attempt + 1, retries, last_err[:120])
+                delay = _retry_delay(attempt)
+                logger.warning("可灵查询请求 SSL/连接错误，%.1fs 后重试（%d/%d）: %s", delay, attempt + 1, retries, last_err[:120])
                 time.sleep(delay)
             else:
                 logger.warning("可灵查询请求多次重试后仍失败: %s", last_err[:200])
@@ -47,35 +163,93 @@ def _get_with_retry(url: str, headers: dict) -> tuple[Optional[httpx.Response],
     return None, last_err
 
 
+async def _aget_with_retry(url: str, headers: dict) -> tuple[Optional[httpx.Response], Optional[str]]:
+    """_get_with_retry 的异步版本：重试等待用 asyncio.sleep，不占用线程。"""
+    last_err: Optional[str] = None
+    retries = max(1, KLING_QUERY_RETRIES)
+    for attempt in range(retries):
+        try:
+            r = await _get_aclient().get(url, headers=headers)
+            return r, None
+        except httpx.TransportError as e:
+            last_err = str(e)
+            if attempt < retries - 1:
+                delay = _retry_delay(attempt)
+                logger.warning("可灵查询请求 SSL/连接错误，%.1fs 后重试（%d/%d）: %s", delay, attempt + 1, retries, last_err[:120])
+                await asyncio.sleep(delay)
+            else:
+                logger.warning("可灵查询请求多次重试后仍失败: %s", last_err[:200])
+        except Exception as e:
+            return None, str(e)
+    return None, last_err
+
+
 def has_kling() -> bool:
     return bool(KLING_ACCESS_KEY and KLING_SECRET_KEY)
 
 
+# JWT 有效期 30 分钟；缓存签好的 token，剩余不足 60s 时才重新签发
+_TOKEN_TTL_SEC = 1800
+_TOKEN_REFRESH_MARGIN_SEC = 60
+_token_cache: Optional[tuple[str, int]] = None  # (token, exp)
+_token_lock = threading.Lock()
+# HS256 JWT 的固定部分预先算好：header 段恒为 {"alg":"HS256","typ":"JWT"}，签名 key 只预处理一次
+_JWT_HEADER_B64 = base64.urlsafe_b64encode(b'{"alg":"HS256","typ":"JWT"}').rstrip(b"=")
+_JWT_HMAC = hmac.new(KLING_SECRET_KEY.encode("utf-8"), digestmod=hashlib.sha256) if KLING_SECRET_KEY else None
+
+
 def _bearer_token() -> str:
-    """用 AK/SK 生成 JWT，与可灵官方文档一致：Header(alg,typ) + Payload(iss, exp, nbf)。"""
+    """用 AK/SK 生成 JWT，与可灵官方文档一致：Header(alg,typ) + Payload(iss, exp, nbf)。临近过期前复用缓存。"""
+    global _token_cache
     if not KLING_ACCESS_KEY or not KLING_SECRET_KEY:
         raise ValueError("KLING_ACCESS_KEY and KLING_SECRET_KEY must be set")
-    now = int(time.time())
-    headers = {"alg": "HS256", "typ": "JWT"}
-    payload = {
-        "iss": KLING_ACCESS_KEY,
-        "exp": now + 1800,   # 有效时间 30 分钟
-        "nbf": now - 5,      # 开始生效时间，当前时间 -5 秒
-    }
-    return jwt.encode(
-        payload,
-        KLING_SECRET_KEY,
-        algorithm="HS256",
-        headers=headers,
-    )
+    cached = _token_cache
+    if cached and cached[1] - int(time.time()) > _TOKEN_REFRESH_MARGIN_SEC:
+        return cached[0]
+    with _token_lock:
+        cached = _token_cache
+        now = int(time.time())
+        if cached and cached[1] - now > _TOKEN_REFRESH_MARGIN_SEC:
+            return cached[0]
+        payload = {
+            "iss": KLING_ACCESS_KEY,
+            "exp": now + _TOKEN_TTL_SEC,   # 有效时间 30 分钟
+            "nbf": now - 5,      # 开始生效时间，当前时间 -5 秒
+        }
+        payload_b64 = base64.urlsafe_b64encode(
+            json.dumps(payload, separators=(",", ":")).encode("utf-8")
+        ).rstrip(b"=")
+        signing_input = _JWT_HEADER_B64 + b"." + payload_b64
+        mac = _JWT_HMAC.copy()
+        mac.update(signing_input)
+        token = (signing_input + b"." + base64.urlsafe_b64encode(mac.digest()).rstrip(b"=")).decode("ascii")
+        _token_cache = (token, now + _TOKEN_TTL_SEC)
+        return token
+
+
+def _invalidate_token() -> None:
+    """鉴权失败（401）时丢弃缓存 token，下次请求重新签发。"""
+    global _token_cache
+    _token_cache = None
+
+
+_headers_cache: Optional[tuple[str, dict]] = None  # (token, headers)
 
 
 def _headers() -> dict:
+    """请求头随 token 缓存：token 未轮换时直接返回同一个 dict（调用方只读，httpx 不会修改传入的 headers）。"""
+    global _headers_cache
     token = _bearer_token()
-    return {
+    cached = _headers_cache
+    if cached and cached[0] == token:
+        return cached[1]
+    headers = {
         "Authorization": f"Bearer {token}",
         "Content-Type": "application/json",
     }
+    # 整体替换元组而非原地改 Authorization，避免并发线程读到半更新的 dict
+    _headers_cache = (token, headers)
+    return headers
 
 
 def _t2v_omni_duration(duration: str) -> str:
@@ -83,6 +257,31 @@ def _t2v_omni_duration(duration: str) -> str:
     return duration if duration in KLING_T2V_OMNI_DURATIONS else "5"
 
 
+def _error_from(data: dict) -> Optional[str]:
+    """可灵错误响应体中的错误描述（各接口字段名不一：message / error / error_msg）。"""
+    return data.get("message") or data.get("error") or data.get("error_msg")
+
+
+def _post_create_task(url: str, payload: dict) -> tuple[Optional[str], Optional[str]]:
+    """提交可灵创建任务请求，返回 (task_id, error_msg)；create_t2v_task / create_omni_video_task 共用。"""
+    try:
+        r = _get_client().post(url, content=_dumps(payload), headers=_headers(), timeout=30.0)
+        data = _loads(r.content) if r.content else {}
+        if r.status_code != 200:
+            if r.status_code == 401:
+                _invalidate_token()
+            return None, _error_from(data) or r.text or f"HTTP {r.status_code}"
+        inner = data.get("data")
+        task_id = (inner.get("task_id") if isinstance(inner, dict) else None) or data.get("task_id")
+        if task_id:
+            return str(task_id), None
+        return None, data.get("message") or "未返回 task_id"
+    except ValueError as e:
+        return None, "KLING_ACCESS_KEY 未配置或无效" if "KLING_ACCESS_KEY" in str(e) else str(e)
+    except Exception as e:
+        return None, str(e)
+
+
 def create_t2v_task(
     prompt: str,
     duration: str = KLING_DURATION,
@@ -95,7 +294,7 @@ def create_t2v_task(
     返回 (task_id, error_msg)，成功时 error_msg 为 None。
     """
     duration = _t2v_omni_duration(str(duration).strip())
-    url = f"{KLING_BASE}/v1/videos/text2video"
+    url = _T2V_CREATE_PATH
     payload = {
         "model_name": model_name,
         "prompt": prompt[:1700],
@@ -103,28 +302,7 @@ def create_t2v_task(
         "aspect_ratio": aspect_ratio,
         "duration": duration,
     }
-    try:
-        with httpx.Client(timeout=30.0) as client:
-            r = client.post(url, json=payload, headers=_headers())
-            data = r.json() if r.content else {}
-            if r.status_code != 200:
-                err = data.get("message") or data.get("error") or data.get("error_msg") or r.text or f"HTTP {r.status_code}"
-                return None, err
-            task_id = data.get("data", {}).get("task_id") or data.get("task_id")
-            if task_id:
-                return str(task_id), None
-            return None, data.get("message") or "未返回 task_id"
-    except ValueError as e:
-        return None, "KLING_ACCESS_KEY 未配置或无效" if "KLING_ACCESS_KEY" in str(e) else str(e)
-    except httpx.HTTPStatusError as e:
-        try:
-            body = e.response.json()
-            err = body.get("message") or body.get("error") or body.get("error_msg") or e.response.text
-        except Exception:
-            err = e.response.text or str(e)
-        return None, err or str(e)
-    except Exception as e:
-        return None, str(e)
+    return _post_create_task(url, payload)
 
 
 def create_omni_video_task(
@@ -141,7 +319,7 @@ def create_omni_video_task(
     返回 (task_id, error_msg)，成功时 error_msg 为 None。
     """
     duration = _t2v_omni_duration(str(duration).strip())
-    url = f"{KLING_BASE}/v1/videos/omni-video"
+    url = _OMNI_CREATE_PATH
     payload = {
         "model_name": model_name,
         "prompt": prompt[:1700],
@@ -155,80 +333,117 @@ def create_omni_video_task(
         image_list = [{"image_url": u.strip()} for u in image_url_list[:7] if u and str(u).strip()]
         if image_list:
             payload["image_list"] = image_list
-    try:
-        with httpx.Client(timeout=30.0) as client:
-            r = client.post(url, json=payload, headers=_headers())
-            data = r.json() if r.content else {}
-            if r.status_code != 200:
-                err = data.get("message") or data.get("error") or data.get("error_msg") or r.text or f"HTTP {r.status_code}"
-                return None, err
-            task_id = data.get("data", {}).get("task_id") or data.get("task_id")
-            if task_id:
-                return str(task_id), None
-            return None, data.get("message") or "未返回 task_id"
-    except ValueError as e:
-        return None, "KLING_ACCESS_KEY 未配置或无效" if "KLING_ACCESS_KEY" in str(e) else str(e)
-    except httpx.HTTPStatusError as e:
-        try:
-            body = e.response.json()
-            err = body.get("message") or body.get("error") or body.get("error_msg") or e.response.text
-        except Exception:
-            err = e.response.text or str(e)
-        return None, err or str(e)
-    except Exception as e:
-        return None, str(e)
+    return _post_create_task(url, payload)
+
+
+# 视频项内 URL 字段优先级：官方 url 为生成视频，watermark_url 为含水印版；优先用 url，无则用 watermark_url
+_VIDEO_ITEM_KEYS = ("url", "video_url", "watermark_url")
+# 容器（task_result / result / output / 顶层）上直接挂的 URL 字段
+_CONTAINER_URL_KEYS = ("video_url", "url")
+_LIST_ITEM_KEYS = ("url", "video_url")
+
+
+def _first_of(obj, keys: tuple[str, ...]) -> Optional[str]:
+    """按 keys 顺序取 obj 中第一个非空值（obj 非 dict 类时返回 None）。"""
+    get = getattr(obj, "get", None)
+    if get is None:
+        return None
+    for key in keys:
+        u = get(key)
+        if u:
+            return str(u).strip()
+    return None
+
+
+def _first_url(container) -> Optional[str]:
+    """从单个结果容器取 URL：dict 先看 videos[0] 再看自身字段；list 看首项。"""
+    if isinstance(container, dict):
+        videos = container.get("videos")
+        if isinstance(videos, list) and videos:
+            u = _first_of(videos[0], _VIDEO_ITEM_KEYS)
+            if u:
+                return u
+        return _first_of(container, _CONTAINER_URL_KEYS)
+    if isinstance(container, list) and container:
+        return _first_of(container[0], _LIST_ITEM_KEYS)
+    return None
 
 
 def _extract_video_url(d: dict) -> Optional[str]:
     """
     从可灵任务结果中提取视频下载 URL。
     官方响应体：data.task_result.videos[0].url（或 watermark_url），task_status 为 succeed 时存在。
+    依次查找 task_result、顶层字段、result，以及可灵部分接口（如 omni-video）使用的 output。
     """
     if not d:
         return None
-    tr = d.get("task_result")
-    if isinstance(tr, dict):
-        videos = tr.get("videos")
-        if isinstance(videos, list) and videos:
-            first = videos[0] or {}
-            # 官方：url 为生成视频 URL，watermark_url 为含水印版；优先用 url，无则用 watermark_url
-            u = first.get("url") or first.get("video_url") or first.get("watermark_url")
-            if u:
-                return str(u).strip()
-        u = tr.get("video_url") or tr.get("url")
-        if u:
-            return str(u).strip()
-    if isinstance(tr, list) and tr:
-        u = (tr[0] or {}).get("url") or (tr[0] or {}).get("video_url")
-        if u:
-            return str(u).strip()
-    u = d.get("video_url") or d.get("url")
-    if u:
-        return str(u).strip()
-    res = d.get("result")
-    if isinstance(res, dict):
-        vlist = res.get("videos")
-        if isinstance(vlist, list) and vlist:
-            first = vlist[0] or {}
-            u = first.get("url") or first.get("video_url") or first.get("watermark_url")
-            if u:
-                return str(u).strip()
-        u = res.get("video_url") or res.get("url")
-        if u:
-            return str(u).strip()
-    # 可灵部分接口（如 omni-video）可能放在 output 等字段
-    out = d.get("output")
-    if isinstance(out, dict):
-        vlist = out.get("videos")
-        if isinstance(vlist, list) and vlist:
-            first = vlist[0] or {}
-            u = first.get("url") or first.get("video_url") or first.get("watermark_url")
-            if u:
-                return str(u).strip()
-        u = out.get("video_url") or out.get("url")
-        if u:
-            return str(u).strip()
-    return None
+    return (
+        _first_url(d.get("task_result"))
+        or _first_of(d, _CONTAINER_URL_KEYS)
+        or _first_url(d.get("result"))
+        or _first_url(d.get("output"))
+    )
+
+
+# 可灵任务状态归一化（小写后查表）：部分接口成功时返回 completed 而非 succeed
+_DONE_STATUSES = frozenset({"succeed", "success", "completed"})
+_FAIL_STATUSES = frozenset({"fail", "failed"})
+_STATUS_NORMAL = {
+    "succeed": "succeed",
+    "success": "succeed",
+    "completed": "succeed",
+    "fail": "failed",
+    "failed": "failed",
+}
+
+
+def _retry_after_sec(r: httpx.Response) -> Optional[float]:
+    """解析响应头 Retry-After（仅支持秒数形式），无或无法解析时返回 None。"""
+    value = r.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+
+def _task_result_from_response(r: Optional[httpx.Response], req_err: Optional[str], label: str) -> dict:
+    """
+    将可灵查询响应解析为 { status, video_url?, error?, retryable?, retry_after? }；sync / async 查询共用。
+    retryable 标记连接错误 / 429 / 5xx 等可重试的请求级失败；retry_after 为服务端建议的等待秒数。
+    """
+    if req_err or r is None:
+        return {"status": "Fail", "error": req_err or "可灵查询无响应", "retryable": True}
+    data = _loads(r.content) if r.content else {}
+    if r.status_code != 200:
+        if r.status_code == 401:
+            _invalidate_token()
+        return {
+            "status": "Fail",
+            "error": _error_from(data) or r.text or f"HTTP {r.status_code}",
+            "retryable": r.status_code == 429 or r.status_code >= 500,
+            "retry_after": _retry_after_sec(r),
+        }
+    if data.get("code") is not None and data.get("code") != 0:
+        return {"status": "Fail", "error": data.get("message") or data.get("task_status_msg") or f"code={data.get('code')}"}
+    d = data.get("data") or data
+    status = (d.get("task_status") or d.get("status") or "").lower()
+    is_done = status in _DONE_STATUSES
+    video_url = _extract_video_url(d) if is_done else None
+    if is_done and not video_url and d is not data:
+        # 仅当结果包在 data.data 内时才回退到外层再找一遍；d 即外层时同一份 dict 无需重复搜索
+        video_url = _extract_video_url(data)
+    if is_done and not video_url:
+        logger.warning("%s已成功但未解析到 video_url，data keys=%s", label, list(d.keys()) if isinstance(d, dict) else type(d))
+    err = (d.get("task_status_msg") or data.get("message")) if status in _FAIL_STATUSES else None
+    # 已完成时统一返回 Success，便于前端显示「全部完成」并允许点击剪辑（无 url 时剪辑接口会再查一次并报错）
+    return {
+        "status": "Success" if is_done else (status or "Processing"),
+        "video_url": video_url,
+        "error": err,
+        "retry_after": _retry_after_sec(r),
+    }
 
 
 def query_kling_omni_task(task_id: str) -> dict:
@@ -236,32 +451,10 @@ def query_kling_omni_task(task_id: str) -> dict:
     查询可灵 Omni-Video 任务状态。必须用 GET /v1/videos/omni-video/{id}，不能用 /tasks/{id}。
     返回 { status, video_url?, error? }，与 query_kling_task 同结构。遇 SSL/连接错误会自动重试。
     """
-    url = f"{KLING_BASE}/v1/videos/omni-video/{task_id}"
+    url = _OMNI_QUERY_PREFIX + task_id
     try:
         r, req_err = _get_with_retry(url, _headers())
-        if req_err or r is None:
-            return {"status": "Fail", "error": req_err or "可灵查询无响应"}
-        data = r.json() if r.content else {}
-        if r.status_code != 200:
-            return {"status": "Fail", "error": data.get("message") or data.get("error") or (r.text or f"HTTP {r.status_code}")}
-        if data.get("code") is not None and data.get("code") != 0:
-            return {"status": "Fail", "error": data.get("message") or data.get("task_status_msg") or f"code={data.get('code')}"}
-        d = data.get("data") or data
-        status = (d.get("task_status") or d.get("status") or "").lower()
-        # 可灵部分接口成功时返回 completed 而非 succeed，需一并视为完成
-        is_done = status in ("succeed", "success", "completed")
-        video_url = _extract_video_url(d) if is_done else None
-        if is_done and not video_url:
-            video_url = _extract_video_url(data)
-        if is_done and not video_url:
-            logger.warning("可灵 Omni 任务已成功但未解析到 video_url，data keys=%s", list(d.keys()) if isinstance(d, dict) else type(d))
-        err = d.get("task_status_msg") or data.get("message")
-        # 已完成时统一返回 Success，便于前端显示「全部完成」并允许点击剪辑（无 url 时剪辑接口会再查一次并报错）
-        return {
-            "status": "Success" if is_done else (status or "Processing"),
-            "video_url": video_url,
-            "error": err if status in ("fail", "failed") else None,
-        }
+        return _task_result_from_response(r, req_err, "可灵 Omni 任务")
     except Exception as e:
         return {"status": "Fail", "error": str(e)}
 
@@ -271,30 +464,130 @@ def query_kling_task(task_id: str) -> dict:
     查询可灵文生视频(T2V)任务状态。用于 /v1/videos/text2video 创建的任务。
     返回 { status, video_url?, error? }。遇 SSL/连接错误会自动重试。
     """
-    url = f"{KLING_BASE}/v1/videos/tasks/{task_id}"
+    url = _T2V_QUERY_PREFIX + task_id
     try:
         r, req_err = _get_with_retry(url, _headers())
-        if req_err or r is None:
-            return {"status": "Fail", "error": req_err or "可灵查询无响应"}
-        data = r.json() if r.content else {}
-        if r.status_code != 200:
-            return {"status": "Fail", "error": data.get("message") or data.get("error") or r.text or f"HTTP {r.status_code}"}
-        if data.get("code") is not None and data.get("code") != 0:
-            return {"status": "Fail", "error": data.get("message") or data.get("task_status_msg") or f"code={data.get('code')}"}
-        d = data.get("data") or data
-        status = (d.get("task_status") or d.get("status") or "").lower()
-        is_done = status in ("succeed", "success", "completed")
-        video_url = _extract_video_url(d) if is_done else None
-        if is_done and not video_url:
-            video_url = _extract_video_url(data)
-        if is_done and not video_url:
-            logger.warning("可灵任务已成功但未解析到 video_url，data keys=%s", list(d.keys()) if isinstance(d, dict) else type(d))
-        err = (d.get("task_status_msg") or data.get("message")) if status in ("fail", "failed") else None
-        return {"status": "Success" if is_done else (status or "Processing"), "video_url": video_url, "error": err}
+        return _task_result_from_response(r, req_err, "可灵任务")
+    except Exception as e:
+        return {"status": "Fail", "error": str(e)}
+
+
+async def aquery_kling_omni_task(task_id: str) -> dict:
+    """query_kling_omni_task 的异步版本。"""
+    url = _OMNI_QUERY_PREFIX + task_id
+    try:
+        r, req_err = await _aget_with_retry(url, _headers())
+        return _task_result_from_response(r, req_err, "可灵 Omni 任务")
+    except Exception as e:
+        return {"status": "Fail", "error": str(e)}
+
+
+async def aquery_kling_task(task_id: str) -> dict:
+    """query_kling_task 的异步版本。"""
+    url = _T2V_QUERY_PREFIX + task_id
+    try:
+        r, req_err = await _aget_with_retry(url, _headers())
+        return _task_result_from_response(r, req_err, "可灵任务")
     except Exception as e:
         return {"status": "Fail", "error": str(e)}
 
 
+_query_cache: OrderedDict[tuple[str, bool], tuple[float, dict]] = OrderedDict()  # (task_id, use_omni) -> (过期时刻, 查询结果)，按写入先后排列
+_query_cache_lock = threading.Lock()
+_QUERY_CACHE_MAX = 1024
+
+
+def _cache_get(task_id: str, use_omni: bool) -> Optional[dict]:
+    with _query_cache_lock:
+        hit = _query_cache.get((task_id, use_omni))
+    if hit and hit[0] > time.monotonic():
+        return hit[1]
+    return None
+
+
+def _cache_put(task_id: str, use_omni: bool, raw: dict) -> None:
+    """
+    写入查询缓存。已成功且拿到 URL、或任务本身失败（小写 failed，区别于请求级的 Fail）视为终态。
+    达到 _QUERY_CACHE_MAX 时先清过期项，仍满则按写入先后淘汰最旧的项。
+    """
+    status = raw.get("status")
+    terminal = (status == "Success" and raw.get("video_url")) or status in ("fail", "failed")
+    ttl = KLING_QUERY_CACHE_TERMINAL_TTL_SEC if terminal else KLING_QUERY_CACHE_TTL_SEC
+    if ttl <= 0:
+        return
+    now = time.monotonic()
+    key = (task_id, use_omni)
+    with _query_cache_lock:
+        _query_cache.pop(key, None)
+        if len(_query_cache) >= _QUERY_CACHE_MAX:
+            for k in [k for k, (exp, _) in _query_cache.items() if exp <= now]:
+                del _query_cache[k]
+            while len(_query_cache) >= _QUERY_CACHE_MAX:
+                _query_cache.popitem(last=False)
+        _query_cache[key] = (now + ttl, raw)
+
+
+def _cached_query(task_id: str, use_omni: bool) -> dict:
+    """带短时缓存的单任务查询（批量状态接口使用）。"""
+    raw = _cache_get(task_id, use_omni)
+    if raw is None:
+        raw = query_kling_omni_task(task_id) if use_omni else query_kling_task(task_id)
+        _cache_put(task_id, use_omni, raw)
+    return raw
+
+
+async def _acached_query(task_id: str, use_omni: bool) -> dict:
+    """_cached_query 的异步版本。"""
+    raw = _cache_get(task_id, use_omni)
+    if raw is None:
+        raw = await (aquery_kling_omni_task(task_id) if use_omni else aquery_kling_task(task_id))
+        _cache_put(task_id, use_omni, raw)
+    return raw
+
+
+def _batch_item(tid: str, raw) -> dict:
+    """将单任务查询结果（或查询时抛出的异常）归一化为批量状态项：succeed / processing / failed。"""
+    if isinstance(raw, BaseException):
+        return {
+            "task_id": tid,
+            "status": "failed",
+            "task_status_msg": str(raw)[:200],
+        }
+    normalized = _STATUS_NORMAL.get((raw.get("status") or "").strip().lower(), "processing")
+    url = raw.get("video_url") if normalized == "succeed" else None
+    return {
+        "task_id": tid,
+        "status": normalized,
+        "url": url,
+        "task_status_msg": raw.get("error") or raw.get("task_status_msg"),
+    }
+
+
+def _partition_task_ids(task_ids: list) -> tuple[list[Optional[dict]], list[str]]:
+    """
+    一次遍历把输入分成：结果槽位（无效 id 直接填好失败项，有效 id 处为 None）与待查询的有效 id 列表。
+    有效 id 的顺序与槽位中 None 的顺序一致，查询后用 _fill_slots 按序回填。
+    """
+    slots: list[Optional[dict]] = []
+    valid: list[str] = []
+    for tid in task_ids:
+        t = (tid if isinstance(tid, str) else str(tid)).strip() if tid else ""
+        if t:
+            slots.append(None)
+            valid.append(t)
+        else:
+            slots.append({"task_id": tid or "", "status": "failed", "task_status_msg": "无效 task_id"})
+    return slots, valid
+
+
+def _fill_slots(slots: list[Optional[dict]], items: list[dict]) -> None:
+    """按顺序把查询结果填入 _partition_task_ids 留下的 None 槽位。"""
+    it = iter(items)
+    for i, slot in enumerate(slots):
+        if slot is None:
+            slots[i] = next(it)
+
+
 def get_kling_task_status_batch(
     task_ids: list[str],
     use_omni: bool = True,
@@ -306,61 +599,98 @@ def get_kling_task_status_batch(
     """
     if not task_ids:
         return []
-    query_fn = query_kling_omni_task if use_omni else query_kling_task
-    result: list[dict] = []
-    for tid in task_ids:
-        if not tid or not str(tid).strip():
-            result.append({"task_id": tid or "", "status": "failed", "task_status_msg": "无效 task_id"})
-            continue
-        tid = str(tid).strip()
+    def _query_one(tid: str) -> dict:
         try:
-            raw = query_fn(tid)
-            status = (raw.get("status") or "").strip()
-            status_lower = status.lower()
-            if status_lower in ("success", "succeed", "completed"):
-                normalized = "succeed"
-                url = raw.get("video_url")
-            elif status_lower in ("fail", "failed"):
-                normalized = "failed"
-                url = None
-            else:
-                normalized = "processing"
-                url = None
-            result.append({
-                "task_id": tid,
-                "status": normalized,
-                "url": url,
-                "task_status_msg": raw.get("error") or raw.get("task_status_msg"),
-            })
+            return _batch_item(tid, _cached_query(tid, use_omni))
         except Exception as e:
-            result.append({
-                "task_id": tid,
-                "status": "failed",
-                "task_status_msg": str(e)[:200],
-            })
+            return _batch_item(tid, e)
+
+    result, valid_tids = _partition_task_ids(task_ids)
+    if valid_tids:
+        # 各任务查询互相独立且以网络等待为主：线程池并发查询，共享 httpx 连接池；map 保持输入顺序
+        with ThreadPoolExecutor(max_workers=min(KLING_BATCH_QUERY_WORKERS, len(valid_tids))) as ex:
+            queried = list(ex.map(_query_one, valid_tids))
+        _fill_slots(result, queried)
     return result
 
 
+async def aget_kling_task_status_batch(
+    task_ids: list[str],
+    use_omni: bool = True,
+) -> list[dict]:
+    """
+    get_kling_task_status_batch 的异步版本：所有任务在同一事件循环上 asyncio.gather 并发查询，不占线程。
+    同时在途的查询数与同步版本一样受 KLING_BATCH_QUERY_WORKERS 限制，避免一次轮询打满连接池触发可灵 429。
+    """
+    if not task_ids:
+        return []
+    result, valid_tids = _partition_task_ids(task_ids)
+    if valid_tids:
+        sem = asyncio.Semaphore(KLING_BATCH_QUERY_WORKERS)
+
+        async def _query_one(tid: str) -> dict:
+            async with sem:
+                return await _acached_query(tid, use_omni)
+
+        raws = await asyncio.gather(*(_query_one(tid) for tid in valid_tids), return_exceptions=True)
+        _fill_slots(result, [_batch_item(tid, raw) for tid, raw in zip(valid_tids, raws)])
+    return result
+
+
+def _poll_outcome(task_id: str, result: dict, errors: int) -> tuple[bool, Optional[str], int]:
+    """
+    判定单次轮询结果，返回 (是否结束轮询, 视频 URL, 连续请求级失败次数)。
+    任务本身失败立即结束；可重试的请求级失败（连接错误 / 429 / 5xx）连续达到上限才结束。
+    """
+    status = _STATUS_NORMAL.get((result.get("status") or "").lower())
+    if status == "succeed":
+        url = result.get("video_url")
+        if url:
+            return True, url, 0
+        # 已成功但未解析到 URL 时再等一轮
+        return False, None, 0
+    if status == "failed":
+        err = result.get("error") or ""
+        errors += 1
+        if result.get("retryable") and errors < KLING_POLL_MAX_CONSECUTIVE_ERRORS:
+            logger.warning("可灵任务 %s 查询失败，稍后重试（%d/%d）: %s", task_id, errors, KLING_POLL_MAX_CONSECUTIVE_ERRORS, err[:200])
+            return False, None, errors
+        if err:
+            logger.warning("可灵任务 %s 失败: %s", task_id, err[:200])
+        return True, None, errors
+    return False, None, 0
+
+
 def get_kling_download_url(task_id: str, use_omni: bool = False) -> Optional[str]:
     """
     轮询可灵任务直至成功或失败，不限时（不设总时长上限），避免浪费资源包。
     use_omni=True 时用 GET /v1/videos/omni-video/{id}（Omni-Video 任务必须用此接口，否则拿不到结果）。
     成功则返回视频下载 URL；失败则返回 None。
     """
-    interval = int(os.getenv("KLING_TASK_POLL_INTERVAL_SEC", "8"))
+    # 自适应轮询：起始间隔较短，之后每轮 ×1.5 增长至上限，并加 ±10% 抖动错开并发轮询
+    interval = float(os.getenv("KLING_TASK_POLL_INTERVAL_SEC", "3"))
+    max_interval = float(os.getenv("KLING_TASK_POLL_INTERVAL_MAX_SEC", "30"))
     query_fn = query_kling_omni_task if use_omni else query_kling_task
+    errors = 0
     while True:
         result = query_fn(task_id)
-        status = (result.get("status") or "").lower()
-        if status in ("success", "succeed"):
-            url = result.get("video_url")
-            if url:
-                return url
-            # 已成功但未解析到 URL 时再等一轮
-        if status in ("fail", "failed"):
-            err = result.get("error") or ""
-            if err:
-                logger.warning("可灵任务 %s 失败: %s", task_id, err[:200])
-            break
-        time.sleep(interval)
-    return None
+        done, url, errors = _poll_outcome(task_id, result, errors)
+        if done:
+            return url
+        time.sleep(max(result.get("retry_after") or 0, interval * (0.9 + random.random() * 0.2)))
+        interval = min(max_interval, interval * 1.5)
+
+
+async def aget_kling_download_url(task_id: str, use_omni: bool = False) -> Optional[str]:
+    """get_kling_download_url 的异步版本：轮询间隔用 asyncio.sleep，长时间等待不占用线程。"""
+    interval = float(os.getenv("KLING_TASK_POLL_INTERVAL_SEC", "3"))
+    max_interval = float(os.getenv("KLING_TASK_POLL_INTERVAL_MAX_SEC", "30"))
+    query_fn = aquery_kling_omni_task if use_omni else aquery_kling_task
+    errors = 0
+    while True:
+        result = await query_fn(task_id)
+        done, url, errors = _poll_outcome(task_id, result, errors)
+        if done:
+            return url
+        await asyncio.sleep(max(result.get("retry_after") or 0, interval * (0.9 + random.random() * 0.2)))
+        interval = min(max_interval, interval * 1.5)
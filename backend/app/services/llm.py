@@ -1,14 +1,30 @@
 """可选 LLM 调用：用于生成脚本/分镜。支持 Kimi（Moonshot），未配置时使用模板。"""
+import atexit
+import functools
+import hashlib
 import math
 import json
+import logging
 import os
 import re
-from typing import Any, Optional
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Iterable, Iterator, Optional
 
 import httpx
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 from app.services.scene_prompts import get_scene_guidance_for_refine
 
+logger = logging.getLogger(__name__)
+
 # Kimi（Moonshot）API：与官方文档一致，支持 KIMI_API_KEY 或 MOONSHOT_API_KEY，base_url 与官方示例一致
 KIMI_API_KEY = (os.getenv("KIMI_API_KEY") or os.getenv("MOONSHOT_API_KEY") or "").strip()
 KIMI_BASE_URL = (os.getenv("KIMI_BASE_URL") or "https://api.moonshot.ai/v1").rstrip("/")
@@ -16,17 +32,103 @@ KIMI_BASE_URL = (os.getenv("KIMI_BASE_URL") or "https://api.moonshot.ai/v1").rst
 KIMI_MODEL = os.getenv("KIMI_MODEL", "kimi-k2-turbo-preview")
 # 短剧分镜建议用深度思考模型，输出导演级文生视频用 Prompt
 KIMI_MODEL_STORYBOARD = os.getenv("KIMI_MODEL_STORYBOARD", "kimi-thinking-preview")
+# 分镜生成对冲请求：开启后深度思考模型与 KIMI_MODEL 同时请求、取先返回的有效结果（尾延迟更低，但 token 消耗约翻倍）
+KIMI_HEDGE = (os.getenv("KIMI_HEDGE") or "0").strip().lower() in ("1", "true", "yes")
 
 # 兼容：其他 LLM（可选）
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 DASHSCOPE_API_KEY = os.getenv("DASHSCOPE_API_KEY")
 OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
 
+# 分镜精修：首批确定 style_bible 后，其余批次的最大并发请求数
+KIMI_REFINE_MAX_WORKERS = max(1, int(os.getenv("KIMI_REFINE_MAX_WORKERS", "4") or 4))
+# Kimi 响应磁盘缓存（开发/重复精修时省去相同请求的往返与额度）：默认关闭，KIMI_CACHE_ENABLE=1 开启
+KIMI_CACHE_ENABLE = (os.getenv("KIMI_CACHE_ENABLE") or "0").strip().lower() in ("1", "true", "yes")
+KIMI_CACHE_PATH = Path(os.getenv("KIMI_CACHE_PATH") or (Path(__file__).resolve().parent.parent.parent / "data" / "llm_cache.db"))
+KIMI_CACHE_TTL_SEC = float(os.getenv("KIMI_CACHE_TTL_SEC", str(7 * 86400)))
+# 超过条数上限时按最近访问时间淘汰（LRU）
+KIMI_CACHE_MAX_ENTRIES = max(1, int(os.getenv("KIMI_CACHE_MAX_ENTRIES", "2000") or 2000))
+# 情绪标注每次请求的最多镜头数：超过则分块并发请求，避免单次输出被 max_tokens 截断
+KIMI_EMOTION_BATCH_SIZE = max(1, int(os.getenv("KIMI_EMOTION_BATCH_SIZE", "20") or 20))
+# 台词情绪标注分块并发请求的最大数量
+KIMI_EMOTION_MAX_WORKERS = max(1, int(os.getenv("KIMI_EMOTION_MAX_WORKERS", "4") or 4))
+# 逐镜配音选音色：不同角色的首句对白并发请求 LLM 的最大数量
+KIMI_VOICE_MAX_WORKERS = max(1, int(os.getenv("KIMI_VOICE_MAX_WORKERS", "8") or 8))
+# 角色音色磁盘缓存：按角色名（忽略大小写）记住 LLM 选出的音色，跨剧本/重启复用，默认关闭
+KIMI_VOICE_CACHE_ENABLE = (os.getenv("KIMI_VOICE_CACHE_ENABLE") or "0").strip().lower() in ("1", "true", "yes")
+KIMI_VOICE_CACHE_PATH = Path(
+    os.getenv("KIMI_VOICE_CACHE_PATH") or (Path(__file__).resolve().parent.parent.parent / "data" / "voice_cache.db")
+)
+
+# 台词/分镜解析用到的正则统一在模块加载时编译，逐镜调用时直接用编译对象，免去 re 模块缓存查找
+# 台词计数：中文字直接按码点区间逐字比较；英文词与标点用 findall（C 层收集，不为每个命中构造 Match 对象）
+_EN_WORDS_RE = re.compile(r"[A-Za-z0-9]+")
+_PUNCT_RE = re.compile(r"[，,。.!！？?；;：:、】【「」“”\"'…—-]")
+_ACTION_ONLY_RE = re.compile(
+    r"^(微微?点头|点头|摇头|微笑|沉默|不语|皱眉|叹气|抬眼|低头|转身|示意|挥手|摆手|"
+    r"抬眼看去|目光扫过|目光掠过|眼神?[一]?动|轻轻?点头|轻轻?摇头|"
+    r"略一点头|颔首|摇头不语|笑而不语|沉默不语|默然|无语|—|－|-)\s*[。.]?$",
+    re.I,
+)
+_ACTION_ONLY_SHORT_RE = re.compile(r"^[微微轻略]?[点头摇头笑叹]+[不语默然]?\s*[。.]?$")
+# 上面两个正则能匹配到的全部非空白字符；含其它字符的文本不可能是纯动作，免跑正则
+_ACTION_ONLY_CHARS = frozenset("微点头摇笑沉默不语皱眉叹气抬眼低转身示意挥手摆看去目光扫过掠神一动轻略颔首而然无—－-。.")
+_NARRATOR_PREFIX_RE = re.compile(r"^旁白\s*[：:]\s*")
+_CHAR_PREFIX_RE = re.compile(r"^([A-Za-z\u4e00-\u9fa5]{1,6})\s*[：:]\s*")
+_SENTENCE_SPLIT_RE = re.compile(r"[。！？\n]+")
+_MULTISPACE_RE = re.compile(r"\s{2,}")
+_DUP_COMMA_RE = re.compile(r"[，,]\s*[，,]+")
+_LEAD_COMMA_RE = re.compile(r"^[，,]\s*")
+# 精修后 prompt 中要删掉的跨镜头指代词：长词在前，「沿上一镜」整体删除而不是先删「上一镜」残留「沿」
+_CROSS_SHOT_REFS = (
+    "沿上一个镜头",
+    "上一个镜头",
+    "沿上一镜",
+    "承接上一镜",
+    "延续上镜",
+    "继续上镜",
+    "上一镜",
+    "同一",
+)
+_CROSS_SHOT_REF_RE = re.compile("|".join(map(re.escape, _CROSS_SHOT_REFS)))
+# 分镜表的表头单元格与「-----」分隔行：逐行解析时一次集合查询 + 一次正则整串匹配即可识别
+_STORYBOARD_HEADER_CELLS = frozenset({"序号", "景别", "画面描述", "对白/旁白"})
+_DASH_ONLY_RE = re.compile(r"[ \-－—\t]+")
+_TEMPLATE_PROMPT_RE = re.compile(r"^\d+[,，]\s*[^，]+[。.]\s*(固定|移动|跟随)")
+
+
+def _loads(s: str | bytes) -> Any:
+    """解析 JSON（有 orjson 时用 orjson）；非法 JSON 抛 ValueError（orjson 与 json 的解析错误均为其子类）。"""
+    if orjson is not None:
+        return orjson.loads(s)
+    return json.loads(s)
+
+
+def _dumps_pretty(obj: Any) -> str:
+    """拼入提示词用的缩进 JSON，与 json.dumps(obj, ensure_ascii=False, indent=2) 输出一致。"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS).decode("utf-8")
+        except TypeError:
+            pass
+    return json.dumps(obj, ensure_ascii=False, indent=2)
+
+
+def _dumps_compact(obj: Any) -> str:
+    """拼入提示词用的紧凑 JSON（无缩进与分隔空格，省 token），与 json.dumps(obj, ensure_ascii=False, separators=(",", ":")) 一致。"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+        except TypeError:
+            pass
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
 
 def has_llm() -> bool:
     return bool(KIMI_API_KEY or OPENAI_API_KEY or DASHSCOPE_API_KEY)
 
 
+@functools.lru_cache(maxsize=4096)
 def _estimate_dialogue_duration_sec(text: str) -> float:
     """
     估算台词朗读所需时长（秒），用于给分镜 duration_sec 做合理兜底/校正：
@@ -39,14 +141,11 @@ def _estimate_dialogue_duration_sec(text: str) -> float:
     t = " ".join(str(text).split()).strip()
     if not t:
         return 0.0
-    zh_chars = len(re.findall(r"[\u4e00-\u9fff]", t))
-    en_words = len(re.findall(r"[A-Za-z0-9]+", t))
-    punct = len(re.findall(r"[，,。.!！？?；;：:、】【「」“”\"'…—-]", t))
-    zh_rate = float(os.getenv("DRAMA_SPEECH_ZH_CHARS_PER_SEC", "4.5") or 4.5)
-    en_rate = float(os.getenv("DRAMA_SPEECH_EN_WORDS_PER_SEC", "2.8") or 2.8)
-    pause = float(os.getenv("DRAMA_SPEECH_PUNCT_PAUSE_SEC", "0.10") or 0.10)
-    base = (zh_chars / max(1e-3, zh_rate)) + (en_words / max(1e-3, en_rate))
-    return max(0.8, base + punct * pause)
+    zh_chars = sum(1 for c in t if "\u4e00" <= c <= "\u9fff")
+    en_words = len(_EN_WORDS_RE.findall(t))
+    punct = len(_PUNCT_RE.findall(t))
+    base = (zh_chars / max(1e-3, DRAMA_SPEECH_ZH_CHARS_PER_SEC)) + (en_words / max(1e-3, DRAMA_SPEECH_EN_WORDS_PER_SEC))
+    return max(0.8, base + punct * DRAMA_SPEECH_PUNCT_PAUSE_SEC)
 
 
 def _is_action_only_no_speech(text: str) -> bool:
@@ -56,14 +155,12 @@ def _is_action_only_no_speech(text: str) -> bool:
     t = str(text).strip()
     if len(t) > 50:
         return False
-    action_only = (
-        r"^(微微?点头|点头|摇头|微笑|沉默|不语|皱眉|叹气|抬眼|低头|转身|示意|挥手|摆手|"
-        r"抬眼看去|目光扫过|目光掠过|眼神?[一]?动|轻轻?点头|轻轻?摇头|"
-        r"略一点头|颔首|摇头不语|笑而不语|沉默不语|默然|无语|—|－|-)\s*[。.]?$"
-    )
-    if re.match(action_only, t, re.I):
+    extra = set(t).difference(_ACTION_ONLY_CHARS)
+    if extra and not all(c.isspace() for c in extra):
+        return False
+    if _ACTION_ONLY_RE.match(t):
         return True
-    if re.match(r"^[微微轻略]?[点头摇头笑叹]+[不语默然]?\s*[。.]?$", t):
+    if _ACTION_ONLY_SHORT_RE.match(t):
         return True
     return False
 
@@ -73,8 +170,8 @@ def _strip_tts_speaker_prefix(text: str) -> str:
     if not text or not str(text).strip():
         return ""
     t = str(text).strip()
-    if re.match(r"^旁白\s*[：:]\s*", t):
-        t = re.sub(r"^旁白\s*[：:]\s*", "", t).strip()
+    if _NARRATOR_PREFIX_RE.match(t):
+        t = _NARRATOR_PREFIX_RE.sub("", t).strip()
     # 仅剥掉非常短的「角色名：」，避免误伤正常句子里的冒号
     for sep in ("：", ":"):
         if sep in t:
@@ -85,6 +182,16 @@ def _strip_tts_speaker_prefix(text: str) -> str:
     return t
 
 
+@functools.lru_cache(maxsize=2048)
+def _speaker_from_copy(copy_text: str) -> Optional[str]:
+    """从对白开头的「角色名：」（1~6 个中英文字符）取说话人，LLM 分镜与模板分镜共用；无前缀返回 None。"""
+    if not copy_text:
+        return None
+    m = _CHAR_PREFIX_RE.match(copy_text)
+    return (m.group(1).strip() or None) if m else None
+
+
+@functools.lru_cache(maxsize=4096)
 def _recommended_duration_sec_from_copy(copy_text: str) -> Optional[int]:
     """
     根据台词估算一个「不至于念不完」的时长下限（整数秒）。
@@ -93,15 +200,121 @@ def _recommended_duration_sec_from_copy(copy_text: str) -> Optional[int]:
     tts_text = _strip_tts_speaker_prefix(copy_text or "")
     if not tts_text or _is_action_only_no_speech(tts_text):
         return None
-    tail_pad = float(os.getenv("DRAMA_TTS_TAIL_PAD_SEC", "0.25") or 0.25)
-    # 分镜生成阶段按短剧镜头规范：最短 2 秒
-    min_shot_sec = max(2.0, float(os.getenv("DRAMA_MIN_SHOT_SEC", "1.0") or 1.0))
     base = _estimate_dialogue_duration_sec(tts_text)
-    need = max(min_shot_sec, base + max(0.0, tail_pad))
+    need = max(DRAMA_MIN_SHOT_SEC, base + max(0.0, DRAMA_TTS_TAIL_PAD_SEC))
     # duration_sec 字段为 int，向上取整避免「刚好念不完」
     return int(math.ceil(need))
 
 
+def _reload_speech_env() -> None:
+    """
+    读取台词时长估算参数到模块全局（模块加载时调用一次，估算函数不再逐次读环境变量）。
+    运行中修改了相关环境变量时可再次调用，会同时清空估算缓存。
+    """
+    global DRAMA_SPEECH_ZH_CHARS_PER_SEC, DRAMA_SPEECH_EN_WORDS_PER_SEC, DRAMA_SPEECH_PUNCT_PAUSE_SEC
+    global DRAMA_TTS_TAIL_PAD_SEC, DRAMA_MIN_SHOT_SEC
+    DRAMA_SPEECH_ZH_CHARS_PER_SEC = float(os.getenv("DRAMA_SPEECH_ZH_CHARS_PER_SEC", "4.5") or 4.5)
+    DRAMA_SPEECH_EN_WORDS_PER_SEC = float(os.getenv("DRAMA_SPEECH_EN_WORDS_PER_SEC", "2.8") or 2.8)
+    DRAMA_SPEECH_PUNCT_PAUSE_SEC = float(os.getenv("DRAMA_SPEECH_PUNCT_PAUSE_SEC", "0.10") or 0.10)
+    DRAMA_TTS_TAIL_PAD_SEC = float(os.getenv("DRAMA_TTS_TAIL_PAD_SEC", "0.25") or 0.25)
+    # 分镜生成阶段按短剧镜头规范：最短 2 秒
+    DRAMA_MIN_SHOT_SEC = max(2.0, float(os.getenv("DRAMA_MIN_SHOT_SEC", "1.0") or 1.0))
+    _estimate_dialogue_duration_sec.cache_clear()
+    _recommended_duration_sec_from_copy.cache_clear()
+
+
+_reload_speech_env()
+
+
+_kimi_client: Optional[httpx.Client] = None
+_kimi_client_pid: Optional[int] = None
+_kimi_client_lock = threading.Lock()
+
+
+def _get_kimi_client() -> httpx.Client:
+    """返回共享 httpx.Client（懒创建；fork 后的子进程会重建）。各次调用复用 keep-alive 连接，免去重复 DNS/TCP/TLS 握手。"""
+    global _kimi_client, _kimi_client_pid
+    pid = os.getpid()
+    if _kimi_client is not None and _kimi_client_pid == pid:
+        return _kimi_client
+    with _kimi_client_lock:
+        if _kimi_client is None or _kimi_client_pid != pid:
+            _kimi_client = httpx.Client(
+                timeout=60.0,
+                limits=httpx.Limits(max_keepalive_connections=8, max_connections=16, keepalive_expiry=60.0),
+            )
+            _kimi_client_pid = pid
+    return _kimi_client
+
+
+def _close_kimi_client() -> None:
+    if _kimi_client is not None and _kimi_client_pid == os.getpid():
+        _kimi_client.close()
+
+
+atexit.register(_close_kimi_client)
+
+
+_kimi_cache_lock = threading.Lock()
+
+
+def _kimi_cache_conn() -> sqlite3.Connection:
+    KIMI_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(KIMI_CACHE_PATH), timeout=5.0)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS kimi_cache (key TEXT PRIMARY KEY, content TEXT NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+    )
+    return conn
+
+
+def _kimi_cache_key(model: str, system_prompt: str, user_prompt: str, max_tokens: int) -> str:
+    raw = json.dumps([model, system_prompt, user_prompt, max_tokens], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _kimi_cache_get(key: str) -> Optional[str]:
+    """读取未过期的缓存内容并刷新访问时间；缓存不可用时返回 None，不影响正常请求。"""
+    now = time.time()
+    try:
+        with _kimi_cache_lock:
+            conn = _kimi_cache_conn()
+            try:
+                row = conn.execute(
+                    "SELECT content FROM kimi_cache WHERE key = ? AND created_at > ?", (key, now - KIMI_CACHE_TTL_SEC)
+                ).fetchone()
+                if row:
+                    conn.execute("UPDATE kimi_cache SET accessed_at = ? WHERE key = ?", (now, key))
+                    conn.commit()
+                return row[0] if row else None
+            finally:
+                conn.close()
+    except sqlite3.Error as e:
+        logger.warning("Kimi 缓存读取失败: %s", e)
+        return None
+
+
+def _kimi_cache_put(key: str, content: str) -> None:
+    now = time.time()
+    try:
+        with _kimi_cache_lock:
+            conn = _kimi_cache_conn()
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO kimi_cache (key, content, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    (key, content, now, now),
+                )
+                conn.execute("DELETE FROM kimi_cache WHERE created_at <= ?", (now - KIMI_CACHE_TTL_SEC,))
+                conn.execute(
+                    "DELETE FROM kimi_cache WHERE key IN (SELECT key FROM kimi_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                    (KIMI_CACHE_MAX_ENTRIES,),
+                )
+                conn.commit()
+            finally:
+                conn.close()
+    except sqlite3.Error as e:
+        logger.warning("Kimi 缓存写入失败: %s", e)
+
+
 def _kimi_chat(
     system_prompt: str,
     user_prompt: str,
@@ -126,14 +339,25 @@ def _kimi_chat(
         "Content-Type": "application/json",
     }
     timeout = 120.0 if (model or KIMI_MODEL) == "kimi-thinking-preview" else 60.0
+    cache_key = _kimi_cache_key(payload["model"], system_prompt, user_prompt, max_tokens) if KIMI_CACHE_ENABLE else None
+    if cache_key:
+        cached = _kimi_cache_get(cache_key)
+        if cached is not None:
+            return (cached, None)
     try:
-        with httpx.Client(timeout=timeout) as client:
-            r = client.post(url, json=payload, headers=headers)
-            r.raise_for_status()
-            data = r.json()
-            choice = data.get("choices", [{}])[0]
-            msg = choice.get("message") or {}
-            return ((msg.get("content") or "").strip(), None)
+        r = _get_kimi_client().post(url, json=payload, headers=headers, timeout=timeout)
+        r.raise_for_status()
+        data = _loads(r.content)
+        choice = data.get("choices", [{}])[0]
+        msg = choice.get("message") or {}
+        content = (msg.get("content") or "").strip()
+        usage = data.get("usage") or {}
+        cached_tokens = usage.get("cached_tokens") or (usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+        if cached_tokens:
+            logger.debug("Kimi 前缀缓存命中 %s/%s 输入 tokens", cached_tokens, usage.get("prompt_tokens"))
+        if cache_key and content:
+            _kimi_cache_put(cache_key, content)
+        return (content, None)
     except httpx.HTTPStatusError as e:
         code = e.response.status_code
         err = f"HTTP {code}：{e.response.url}"
@@ -148,9 +372,35 @@ def _kimi_chat(
         return (None, str(e))
 
 
-def generate_storyboard_from_script_drama_llm(script_text: str) -> tuple[Optional[list[dict]], Optional[str]]:
-    """用 Kimi 深度思考模型根据剧本生成分镜。返回 (分镜列表, 错误信息)，失败时 (None, 错误)。"""
-    system = """你是短剧分镜师兼导演。根据剧本/小说内容，**严格按原文情节与对白**逐镜输出分镜表。每行一条，格式为（共11列，用英文竖线|分隔）：
+def _kimi_chat_hedged(
+    system_prompt: str,
+    user_prompt: str,
+    primary: tuple[str, int],
+    fallback: tuple[str, int],
+) -> tuple[Optional[str], Optional[str]]:
+    """
+    同时以两个模型发起同一请求（primary/fallback 为 (model, max_tokens)），取最先返回的非空结果。
+    两者都失败时返回 fallback 的错误，与串行兜底一致。落败请求无法中途打断，会在后台自然结束（受 _kimi_chat 超时约束）。
+    """
+    ex = ThreadPoolExecutor(max_workers=2)
+    futures = {
+        ex.submit(_kimi_chat, system_prompt, user_prompt, max_tokens, model): model
+        for model, max_tokens in (primary, fallback)
+    }
+    errors: dict[str, Optional[str]] = {}
+    try:
+        for fut in as_completed(futures):
+            out, err = fut.result()
+            if out:
+                return (out, None)
+            errors[futures[fut]] = err
+    finally:
+        ex.shutdown(wait=False, cancel_futures=True)
+    return (None, errors.get(fallback[0]) or errors.get(primary[0]))
+
+
+# 短剧分镜生成 system 提示词（固定文本，剧本只放在 user 中）
+_STORYBOARD_DRAMA_SYSTEM = """你是短剧分镜师兼导演。根据剧本/小说内容，**严格按原文情节与对白**逐镜输出分镜表。每行一条，格式为（共11列，用英文竖线|分隔）：
 序号|景别|画面描述|对白/旁白|时长(秒)|镜头安排|拍摄方式|镜头手法|文生视频用Prompt|生成方式|本镜出镜角色名
 
 【剧本与分镜规划】（优先：合理、紧凑）
@@ -207,6 +457,10 @@ def generate_storyboard_from_script_drama_llm(script_text: str) -> tuple[Optiona
   示例（无对白）：「拾荒车（主体），凌晨荒原、天边鱼肚白、沙丘轮廓、远处公路延伸（场景），车身沿公路飞驰、卷起烟尘、车灯微亮（动作），冷色调黎明、略带雾霭、层次分明（风格），大景固定镜头、地平线稳定（镜头语言）。」示例（有对白）：「孟川近景（主体），雪后道院石阶（场景），正在说话、嘴唇随对白自然开合、下颌微动、目光温和（动作），冷灰晨光、电影感（风格），近景固定（镜头语言）。」禁止「1，大景。固定。」等模板。
 - **生成方式**（第10列）：文生视频、图生视频、首尾帧 三选一。文生视频=大场景/环境；图生视频=特写/近景/人物表情/精细构图；首尾帧=与上一镜连续动作或明显过渡。
 - 只输出真实镜头行，不要输出表头行或分隔行。"""
+
+
+def _storyboard_drama_prompts(script_text: str) -> tuple[str, str]:
+    """短剧分镜生成的 (system, user) 提示词：整段与流式两种调用共用。"""
     user = f"""请为以下剧本/小说逐镜生成分镜表。每行11列。
 要求：
 - **剧本规划合理、节奏紧凑**：先整体把握再落镜；每镜有明确功能，不堆砌、不拖沓；对白能合并就合并为一镜（2–4 句/镜），总镜数宁少勿碎（约 1 分钟 6–10 镜）。
@@ -215,39 +469,37 @@ def generate_storyboard_from_script_drama_llm(script_text: str) -> tuple[Optiona
 
 剧本：
 {script_text[:3000]}"""
-    out, last_error = _kimi_chat(
-        system,
-        user,
-        max_tokens=4096,
-        model=KIMI_MODEL_STORYBOARD,
-    )
-    if not out and KIMI_MODEL_STORYBOARD != KIMI_MODEL:
-        out, last_error = _kimi_chat(system, user, max_tokens=2048, model=KIMI_MODEL)
-    if not out:
-        return (None, last_error or "Kimi 未返回有效分镜")
-    result = []
-    for line in out.strip().split("\n"):
+    return _STORYBOARD_DRAMA_SYSTEM, user
+
+
+def _iter_storyboard_rows(lines: Iterable[str]) -> Iterator[dict]:
+    """
+    逐行解析 Kimi 输出的 11 列分镜表，跳过表头/分隔/占位行，每解析出一镜即产出一项（index 依次为 1, 2, 3, ...）。
+    输入可以是完整输出的各行，也可以是流式响应边收边产出的行。
+    """
+    count = 0
+    for line in lines:
         line = line.strip()
         if not line or "|" not in line:
             continue
+        # 从左侧拆出最多 11 段（第9列文生Prompt内可能含|），兼容 10 列旧格式
+        parts = [p.strip() for p in line.split("|", 10)]
         # 表头或说明行：首列非数字则跳过
-        first = line.split("|", 1)[0].strip()
-        if first and not first.isdigit() and "序号" not in first and "景别" not in first:
+        first = parts[0]
+        first_is_digit = first.isdigit()
+        if first and not first_is_digit and "序号" not in first and "景别" not in first:
             continue
-        if first in ("序号", "景别", "---", "—", "－"):
+        if first in _STORYBOARD_HEADER_CELLS:
             continue
-        # 从左侧拆出最多 11 段（第9列文生Prompt内可能含|），兼容 10 列旧格式
-        parts = [p.strip() for p in line.split("|", 10)]
         if len(parts) < 5:
             continue
-        try:
-            idx = int(parts[0]) if parts[0].isdigit() else len(result) + 1
-        except ValueError:
-            idx = len(result) + 1
+        # 不足 11 列的补空串，后续按列直接取值
+        if len(parts) < 11:
+            parts.extend([""] * (11 - len(parts)))
         shot_type = (parts[1] or "中景")[:80]
-        shot_desc = (parts[2] or "").strip()
-        copy = (parts[3] if len(parts) > 3 else "").strip()
-        raw_dur = int(parts[4]) if len(parts) > 4 and str(parts[4]).isdigit() else 4
+        shot_desc = parts[2]
+        copy = parts[3]
+        raw_dur = int(parts[4]) if parts[4].isdigit() else 4
         duration = max(2, min(10, raw_dur))
         # 校正：若台词按正常语速 2~4 秒念不完，则自动拉长该镜头（避免出现「4秒镜头塞不下台词」）
         try:
@@ -256,18 +508,16 @@ def generate_storyboard_from_script_drama_llm(script_text: str) -> tuple[Optiona
                 duration = max(duration, min(10, need_min))
         except Exception:
             pass
-        shot_arrangement = parts[5] if len(parts) > 5 else ""
-        shooting_approach = parts[6] if len(parts) > 6 else ""
-        camera_technique = parts[7] if len(parts) > 7 else ""
-        t2v_prompt = (parts[8] if len(parts) > 8 else "").strip()
-        gen_raw = (parts[9] if len(parts) > 9 else "").strip()
-        character_name_raw = (parts[10] if len(parts) > 10 else "").strip()
+        shot_arrangement = parts[5]
+        shooting_approach = parts[6]
+        camera_technique = parts[7]
+        t2v_prompt = parts[8]
+        gen_raw = parts[9]
+        character_name_raw = parts[10]
         # 过滤表头/占位行：景别列为「序号」「景别」「------」或画面描述为占位符
-        if shot_type in ("序号", "景别", "------", "—", "－") or (shot_type and all(c in " -－—\t" for c in shot_type)):
-            continue
-        if shot_desc in ("画面描述", "对白/旁白", "------------", "—", "－") or len(shot_desc) < 3:
+        if shot_type in _STORYBOARD_HEADER_CELLS or _DASH_ONLY_RE.fullmatch(shot_type):
             continue
-        if shot_desc and all(c in " -－—\t" for c in shot_desc):
+        if len(shot_desc) < 3 or shot_desc in _STORYBOARD_HEADER_CELLS or _DASH_ONLY_RE.fullmatch(shot_desc):
             continue
         # 若 t2v_prompt 是表头式模板（含「序号」「景别。拍摄方式」等）则视为无效
         if t2v_prompt and (
@@ -290,13 +540,14 @@ def generate_storyboard_from_script_drama_llm(script_text: str) -> tuple[Optiona
         character_names = []
         if character_name_raw and character_name_raw not in ("旁白", "无", "-", "—"):
             character_names = [n.strip()[:50] for n in character_name_raw.split(",") if n and n.strip()]
-        if not character_names and copy:
-            m = re.match(r"^([A-Za-z\u4e00-\u9fa5]{1,6})\s*[：:]\s*", copy)
-            if m:
-                character_names = [m.group(1).strip()]
+        if not character_names:
+            speaker = _speaker_from_copy(copy)
+            if speaker:
+                character_names = [speaker]
         character_name = character_names[0] if character_names else None
-        result.append({
-            "index": idx,
+        count += 1
+        yield {
+            "index": count,
             "shot_type": shot_type,
             "shot_desc": shot_desc[:300],
             "copy": copy[:200],
@@ -308,52 +559,71 @@ def generate_storyboard_from_script_drama_llm(script_text: str) -> tuple[Optiona
             "generation_method": generation_method,
             "character_name": character_name or None,
             "character_names": character_names if character_names else None,
-        })
-    # 过滤后重排序号为 1, 2, 3, ...
-    for i, r in enumerate(result, 1):
-        r["index"] = i
+        }
+
+
+def generate_storyboard_from_script_drama_llm(script_text: str) -> tuple[Optional[list[dict]], Optional[str]]:
+    """用 Kimi 深度思考模型根据剧本生成分镜。返回 (分镜列表, 错误信息)，失败时 (None, 错误)。"""
+    system, user = _storyboard_drama_prompts(script_text)
+    if KIMI_HEDGE and KIMI_MODEL_STORYBOARD != KIMI_MODEL:
+        out, last_error = _kimi_chat_hedged(
+            system,
+            user,
+            (KIMI_MODEL_STORYBOARD, 4096),
+            (KIMI_MODEL, 2048),
+        )
+    else:
+        out, last_error = _kimi_chat(
+            system,
+            user,
+            max_tokens=4096,
+            model=KIMI_MODEL_STORYBOARD,
+        )
+        if not out and KIMI_MODEL_STORYBOARD != KIMI_MODEL:
+            out, last_error = _kimi_chat(system, user, max_tokens=2048, model=KIMI_MODEL)
+    if not out:
+        return (None, last_error or "Kimi 未返回有效分镜")
+    result = list(_iter_storyboard_rows(out.splitlines()))
     return (result if result else None, None)
 
 
+# 模板拆镜规则：(关键词正则, 景别, 光线, 画面描述)，按顺序取第一个命中的类别
+_TEMPLATE_SHOT_RULES: tuple[tuple[re.Pattern, str, str, Any], ...] = (
+    (re.compile("凌晨|天边|荒原|地平线|月亮"), "全景", "晨光熹微",
+     lambda b: b[:80] if len(b) <= 80 else (b[:77] + "...")),
+    (re.compile("驾驶室|系统提示|提示音"), "中景", "车内冷光",
+     lambda b: "驾驶室内系统提示音或界面" if "提示" in b else b[:60]),
+    (re.compile("香烟|点燃"), "近景", "车内冷光",
+     lambda b: "角色点燃香烟吸一口" + ("，塞西" if "塞西" in b else "")),
+    (re.compile("转身|离开|走向|拖车室"), "中景", "车内光",
+     lambda b: "角色离开驾驶室走向拖车室" + ("，塞西" if "塞西" in b else "")),
+    (re.compile("一震|撞|拖车壁"), "中景", "昏暗拖车室内",
+     lambda b: "车身震动，角色撞在拖车壁上" + ("，穆林" if "穆林" in b else "")),
+    (re.compile("揉|眼冒金星|缓过神"), "近景", "昏暗拖车室内",
+     lambda b: "角色揉脑袋缓过神" + ("，穆林" if "穆林" in b else "")),
+)
+# 本镜生成方式：特写类动作用图生视频，连续动作/过渡用首尾帧
+_TEMPLATE_I2V_RE = re.compile("香烟|点燃|揉|眼冒金星|缓过神")
+_TEMPLATE_FL2V_RE = re.compile("转身|离开|走向|拖车室|一震|撞|拖车壁")
+
+
 def generate_storyboard_from_script_drama_template(script_text: str) -> list[dict]:
     """无 LLM 时从剧本按意群拆镜，从内容提炼画面描述与文生视频用 Prompt（景别+场景+角色+光线+运镜）。"""
-    import re
     # 按句号、问号、感叹号、换行拆成意群，避免一整段只出一镜
     raw = script_text.replace("\r\n", "\n").replace("\r", "\n")
-    chunks = re.split(r"[。！？\n]+", raw)
+    chunks = _SENTENCE_SPLIT_RE.split(raw)
     chunks = [c.strip() for c in chunks if len(c.strip()) > 2][:12]
     if not chunks:
         chunks = [script_text[:200]]
     result = []
     for i, block in enumerate(chunks, 1):
         copy = block[:200]
-        block_lower = block
         character_name_from_block = None
-        # 从内容推断景别与画面
-        if "凌晨" in block or "天边" in block or "荒原" in block or "地平线" in block or "月亮" in block:
-            shot_type = "全景"
-            shot_desc = block[:80] if len(block) <= 80 else (block[:77] + "...")
-            light = "晨光熹微"
-        elif "驾驶室" in block or "系统提示" in block or "提示音" in block:
-            shot_type = "中景"
-            shot_desc = "驾驶室内系统提示音或界面" if "提示" in block or "提示音" in block else block[:60]
-            light = "车内冷光"
-        elif "香烟" in block or "点燃" in block:
-            shot_type = "近景"
-            shot_desc = "角色点燃香烟吸一口" + ("，塞西" if "塞西" in block else "")
-            light = "车内冷光"
-        elif "转身" in block or "离开" in block or "走向" in block or "拖车室" in block:
-            shot_type = "中景"
-            shot_desc = "角色离开驾驶室走向拖车室" + ("，塞西" if "塞西" in block else "")
-            light = "车内光"
-        elif "一震" in block or "撞" in block or "拖车壁" in block:
-            shot_type = "中景"
-            shot_desc = "车身震动，角色撞在拖车壁上" + ("，穆林" if "穆林" in block else "")
-            light = "昏暗拖车室内"
-        elif "揉" in block or "眼冒金星" in block or "缓过神" in block:
-            shot_type = "近景"
-            shot_desc = "角色揉脑袋缓过神" + ("，穆林" if "穆林" in block else "")
-            light = "昏暗拖车室内"
+        # 从内容推断景别与画面：按规则表顺序取第一个命中的类别（每类一次正则扫描）
+        rule = next((r for r in _TEMPLATE_SHOT_RULES if r[0].search(block)), None)
+        if rule is not None:
+            _, shot_type, light, desc_fn = rule
+            shot_desc = desc_fn(block)
         elif "：" in block or ":" in block:
             role, _, rest = block.partition("：" if "：" in block else ":")
             shot_type = "中景"
@@ -366,19 +636,17 @@ def generate_storyboard_from_script_drama_template(script_text: str) -> list[dic
             light = "自然光"
             character_name_from_block = None
         # 本镜生成方式：根据内容选文生/图生/首尾帧
-        if "香烟" in block or "点燃" in block or "揉" in block or "眼冒金星" in block or "缓过神" in block or shot_type == "近景":
+        if shot_type == "近景" or _TEMPLATE_I2V_RE.search(block):
             generation_method = "i2v"
-        elif "转身" in block or "离开" in block or "走向" in block or "拖车室" in block or "一震" in block or "撞" in block or "拖车壁" in block:
+        elif _TEMPLATE_FL2V_RE.search(block):
             generation_method = "fl2v"
         else:
             generation_method = "t2v"
         # 五段式：主体+场景+动作+风格+镜头语言（详细）
         t2v_prompt = f"角色（主体），{shot_desc}（场景与动作），{light}、画面有层次（风格），{shot_type}、固定镜头（镜头语言）。"
         character_name = character_name_from_block
-        if not character_name and copy:
-            m = re.match(r"^([A-Za-z\u4e00-\u9fa5]{1,6})\s*[：:]\s*", copy)
-            if m:
-                character_name = m.group(1).strip()
+        if not character_name:
+            character_name = _speaker_from_copy(copy)
         # 模板分镜：按台词估算时长，避免固定 4 秒导致对白念不完
         duration_sec = 4
         try:
@@ -460,6 +728,50 @@ REFINE_T2V_SYSTEM_DRAMA = """你是短剧文生视频/图生视频的导演级 P
 - 让机位衔接自然：可以写“机位轻微推近/轻微摇移/对切”，但不要写“沿上一镜…”。但不要写太多术语。
 """
 
+# 精修 user 提示词中与批次无关的固定前缀（两种输出约定各一份），每批只拼接分镜 JSON 与上下文
+_REFINE_USER_RULES = (
+    "要求：每条单主体、单主动作、无敏感词、无自相矛盾，便于可灵/MiniMax 稳定生成。"
+    "**务必删除 prompt 中任何「画面出现/弹出文字、数字、字幕、标题、logo」等描述，只保留纯视觉动作与场景。"
+    "精修后的 prompt 中不要包含该镜的台词/对白文字，台词仅用于字幕与配音。**"
+    "有对白的镜头必须在动作中明确写出「嘴唇/口型随说话张合」或「嘴部明显在动」等。"
+    "另外：每条 prompt 必须单镜自洽，严禁出现「同一/上一镜/延续上镜/继续」等跨镜指代词；把连续性细节直接写出来。"
+    "\n\n分镜列表（JSON）：\n"
+)
+_REFINE_USER_HEAD = (
+    "请精修以下分镜的文生视频用 Prompt，**严格按系统约定输出一个 JSON 对象**："
+    '{"style_bible": {...}, "shots": [{"index": 1, "refined_t2v_prompt": "..."}]}。'
+    + _REFINE_USER_RULES
+)
+_REFINE_USER_HEAD_SHOTS_ONLY = (
+    "请精修以下分镜的文生视频用 Prompt，**严格按系统约定输出一个 JSON 对象**："
+    '{"shots": [{"index": 1, "refined_t2v_prompt": "..."}]}。'
+    + _REFINE_USER_RULES
+)
+
+# 全片 bible 已由第一批确定后，其余批次只需输出 shots：同一套规则，去掉「输出 bible」的步骤与格式，省下重复生成 bible 的输出 token
+REFINE_T2V_SYSTEM_DRAMA_SHOTS_ONLY = REFINE_T2V_SYSTEM_DRAMA.replace(
+    """2) 输出一份「全片连续性 bible」（style_bible），用于统一全片的时空、场景、光线色调、人物外观、道具与镜头语法。
+3) 再按 bible 为每一镜输出 refined_t2v_prompt""",
+    """2) 全片连续性 bible 已在用户消息中给出，不要重新输出或改写它。
+3) 按该 bible 为每一镜输出 refined_t2v_prompt""",
+).replace(
+    """{
+  "style_bible": {
+    "time_of_day": "...",
+    "weather": "...",
+    "main_location": "...",
+    "color_palette": "...",
+    "lighting_rules": "...",
+    "camera_grammar": "...",
+    "character_look_rules": "...",
+    "prop_continuity": "...",
+    "do_not_do": "..."
+  },
+  "shots": [""",
+    """{
+  "shots": [""",
+)
+
 
 def refine_storyboard_t2v_prompts_llm(
     storyboard: list[dict[str, Any]],
@@ -477,21 +789,10 @@ def refine_storyboard_t2v_prompts_llm(
         """尽量去掉跨镜头指代词，让单镜 prompt 更自洽（不依赖上下文）。"""
         if not text:
             return text
-        t = text
-        for bad in (
-            "同一",
-            "上一镜",
-            "上一个镜头",
-            "沿上一镜",
-            "沿上一个镜头",
-            "延续上镜",
-            "继续上镜",
-            "承接上一镜",
-        ):
-            t = t.replace(bad, "")
-        t = re.sub(r"\s{2,}", " ", t).strip()
-        t = re.sub(r"[，,]\s*[，,]+", "，", t)
-        t = re.sub(r"^[，,]\s*", "", t)
+        t = _CROSS_SHOT_REF_RE.sub("", text)
+        t = _MULTISPACE_RE.sub(" ", t).strip()
+        t = _DUP_COMMA_RE.sub("，", t)
+        t = _LEAD_COMMA_RE.sub("", t)
         return t
 
     def _style_bible_prefix(style_bible: Optional[dict[str, Any]]) -> str:
@@ -517,8 +818,8 @@ def refine_storyboard_t2v_prompts_llm(
                         s = s[i:j].strip()
                         break
         try:
-            return json.loads(s)
-        except json.JSONDecodeError:
+            return _loads(s)
+        except ValueError:
             return None
 
     def _normalize_refined(refined_obj: Any) -> tuple[Optional[dict[str, Any]], Optional[list[dict[str, Any]]]]:
@@ -556,36 +857,54 @@ def refine_storyboard_t2v_prompts_llm(
     refined_items_all: list[dict[str, Any]] = []
 
     # 根据分镜内容注入影视场景类型指引（战斗/竞速/情感等），见 scene-type-prompts-skill
-    scene_guidance = get_scene_guidance_for_refine(storyboard)
-
-    for bi, batch in enumerate(batches):
-        user = (
-            "请精修以下分镜的文生视频用 Prompt，**严格按系统约定输出一个 JSON 对象**："
-            '{"style_bible": {...}, "shots": [{"index": 1, "refined_t2v_prompt": "..."}]}。'
-            "要求：每条单主体、单主动作、无敏感词、无自相矛盾，便于可灵/MiniMax 稳定生成。"
-            "**务必删除 prompt 中任何「画面出现/弹出文字、数字、字幕、标题、logo」等描述，只保留纯视觉动作与场景。"
-            "精修后的 prompt 中不要包含该镜的台词/对白文字，台词仅用于字幕与配音。**"
-            "有对白的镜头必须在动作中明确写出「嘴唇/口型随说话张合」或「嘴部明显在动」等。"
-            "另外：每条 prompt 必须单镜自洽，严禁出现「同一/上一镜/延续上镜/继续」等跨镜指代词；把连续性细节直接写出来。"
-            "\n\n分镜列表（JSON）：\n"
-            + json.dumps(batch, ensure_ascii=False, indent=2)
-        )
-        if bi == 0 and script_snippet and script_snippet.strip():
-            user += f"\n\n剧本摘要（供上下文）：\n{script_snippet.strip()[:1200]}"
-        if bi == 0 and scene_guidance and scene_guidance.strip():
-            user += f"\n\n【本片涉及的影视场景类型与提示词指引（精修时请参考）】\n{scene_guidance.strip()}"
-        if style_bible_final:
-            user += "\n\n已确定的全片连续性 bible（请保持一致，不要自相矛盾，必要时可微调措辞但不改设定）：\n"
-            user += json.dumps(style_bible_final, ensure_ascii=False, indent=2)[:3500]
-
-        out, _ = _kimi_chat(system, user, max_tokens=4096)
-        refined_obj = _parse_llm_json(out or "")
-        style_bible, refined_list = _normalize_refined(refined_obj)
+    scene_guidance = (get_scene_guidance_for_refine(storyboard) or "").strip()
+    # 剧本摘要与场景指引只随第一批发送：裁剪/拼接一次，后续批次不再处理
+    snippet = (script_snippet or "").strip()[:1200]
+    first_batch_context = ""
+    if snippet:
+        first_batch_context += f"\n\n剧本摘要（供上下文）：\n{snippet}"
+    if scene_guidance:
+        first_batch_context += f"\n\n【本片涉及的影视场景类型与提示词指引（精修时请参考）】\n{scene_guidance}"
+
+    def _refine_batch(bi: int, batch: list[dict[str, Any]], bible_context: str) -> tuple[Optional[dict[str, Any]], Optional[list[Any]]]:
+        # bible 已确定时只要 shots（系统提示词同步换成不含 bible 输出的版本）
+        shots_only = bool(bible_context)
+        user = (_REFINE_USER_HEAD_SHOTS_ONLY if shots_only else _REFINE_USER_HEAD) + _dumps_pretty(batch)
+        if bi == 0:
+            user += first_batch_context
+        user += bible_context
+
+        out, _ = _kimi_chat(REFINE_T2V_SYSTEM_DRAMA_SHOTS_ONLY if shots_only else system, user, max_tokens=4096)
+        style_bible, refined_list = _normalize_refined(_parse_llm_json(out or ""))
         if not isinstance(refined_list, list) or not refined_list:
-            return None
-        if style_bible and not style_bible_final:
-            style_bible_final = style_bible
-        refined_items_all.extend(refined_list)
+            return style_bible, None
+        return style_bible, refined_list
+
+    # 第一批单独请求以确定全片 style_bible；其余批次都只依赖该 bible，彼此独立，线程池并发请求，墙钟从 N 批串行降到约 2 批
+    first_bible, first_list = _refine_batch(0, batches[0], "")
+    if not first_list:
+        return None
+    style_bible_final = first_bible
+    refined_items_all.extend(first_list)
+    if len(batches) > 1:
+        # bible 对其余批次都一样：只序列化一次
+        bible_context = ""
+        if first_bible:
+            bible_context = (
+                "\n\n已确定的全片连续性 bible（请保持一致，不要自相矛盾，必要时可微调措辞但不改设定）：\n"
+                + _dumps_pretty(first_bible)[:3500]
+            )
+        with ThreadPoolExecutor(max_workers=min(KIMI_REFINE_MAX_WORKERS, len(batches) - 1)) as ex:
+            rest = list(ex.map(
+                lambda ib: _refine_batch(ib[0], ib[1], bible_context),
+                enumerate(batches[1:], 1),
+            ))
+        for style_bible, refined_list in rest:
+            if not refined_list:
+                return None
+            if style_bible and not style_bible_final:
+                style_bible_final = style_bible
+            refined_items_all.extend(refined_list)
 
     # 按 index 建 map
     by_index = {
@@ -601,7 +920,7 @@ def refine_storyboard_t2v_prompts_llm(
         row = dict(s)
         idx = row.get("index", len(result) + 1)
         new_prompt = by_index.get(idx) or by_index.get(int(idx) if isinstance(idx, (int, float)) else 0)
-        if new_prompt and len(new_prompt) >= 30 and not re.match(r"^\d+[,，]\s*[^，]+[。.]\s*(固定|移动|跟随)", new_prompt.replace(" ", "")):
+        if new_prompt and len(new_prompt) >= 30 and not _TEMPLATE_PROMPT_RE.match(new_prompt.replace(" ", "")):
             p = _sanitize_cross_shot_refs(new_prompt)
             if style_prefix and style_prefix not in p:
                 p = (style_prefix + " " + p).strip()
@@ -621,6 +940,9 @@ VOICE_IDS_ALLOWED = frozenset({
     "junlang_nanyou", "tianxin_xiaoling", "qiaopi_mengmei", "wumei_yujie",
 })
 
+# 归一化（小写、空格转下划线）后的音色 ID -> 标准 ID，LLM 回复大小写/空格不一致时一次字典查询即可还原
+_VOICE_ID_BY_NORM: dict[str, str] = {vid.lower().replace(" ", "_"): vid for vid in VOICE_IDS_ALLOWED}
+
 # 按性别分组的音色，便于按角色性别选音、避免男女搞反
 VOICE_IDS_MALE = frozenset({
     "male-qn-qingse", "male-qn-jingying", "male-qn-badao", "male-qn-daxuesheng",
@@ -649,6 +971,37 @@ KNOWN_MALE_NAMES = frozenset({
     "穆林", "苏平", "塞西", "李华", "小明", "张哥", "王兄", "赵爷", "刘伯",
     "公子哥", "大少爷", "二少爷", "师父父",
 })
+# 角色名完全等于已知名时一次字典查询即得性别；否则按「名中含已知名」正则扫描，女性名单优先（与原先先女后男的顺序一致）
+_NAME_GENDER: dict[str, str] = {
+    **{n: "male" for n in KNOWN_MALE_NAMES},
+    **{n: "female" for n in KNOWN_FEMALE_NAMES},
+}
+_KNOWN_FEMALE_NAME_RE = re.compile("|".join(map(re.escape, sorted(KNOWN_FEMALE_NAMES, key=len, reverse=True))))
+_KNOWN_MALE_NAME_RE = re.compile("|".join(map(re.escape, sorted(KNOWN_MALE_NAMES, key=len, reverse=True))))
+# 称谓关键词（女性优先，避免「师兄」里的兄被当男）
+_FEMALE_TITLE_RE = re.compile("小姐|姑娘|丫鬟|夫人|娘娘|公主|妃|婆|婶")
+_MALE_TITLE_RE = re.compile("公子|少爷|师兄|师弟|师父|老爷|先生|爷|叔|伯|郎")
+# LLM 选音色后的性别校验：角色名明显男/女的关键词，以及音色 ID 中暗示性别的片段（均为子串匹配）
+_MALE_NAME_HINTS = ("孟川", "公子", "少爷", "师兄", "少年", "男子", "大侠")
+_FEMALE_NAME_HINTS = ("绿竹", "小雅", "青萝", "丫鬟", "姑娘", "小姐", "少女", "女子", "师姐")
+_MALE_VOICE_HINTS = ("male", "男", "Gentleman", "Youth", "Executive", "Lyrical", "junlang")
+_FEMALE_VOICE_HINTS = ("female", "女", "Girl", "Lady", "Anchor", "tianxin", "qiaopi", "wumei")
+_MALE_NAME_RE = re.compile("|".join(map(re.escape, _MALE_NAME_HINTS)))
+_FEMALE_NAME_RE = re.compile("|".join(map(re.escape, _FEMALE_NAME_HINTS)))
+_MALE_VOICE_HINT_RE = re.compile("|".join(map(re.escape, _MALE_VOICE_HINTS)))
+_FEMALE_VOICE_HINT_RE = re.compile("|".join(map(re.escape, _FEMALE_VOICE_HINTS)))
+
+
+def _known_name_gender(name: str) -> Optional[str]:
+    """按已知男女名单判断角色性别：名字等于或包含名单中的名字即命中，女性名单优先。返回 'female' | 'male' | None。"""
+    gender = _NAME_GENDER.get(name)
+    if gender:
+        return gender
+    if _KNOWN_FEMALE_NAME_RE.search(name):
+        return "female"
+    if _KNOWN_MALE_NAME_RE.search(name):
+        return "male"
+    return None
 
 
 def _voice_gender_from_name_keywords(name: str) -> Optional[str]:
@@ -657,11 +1010,11 @@ def _voice_gender_from_name_keywords(name: str) -> Optional[str]:
         return None
     n = name.strip()
     # 女性称谓/后缀优先（避免「师兄」里的兄被当男）
-    if any(k in n for k in ("小姐", "姑娘", "丫鬟", "夫人", "娘娘", "公主", "妃", "婆", "婶")):
+    if _FEMALE_TITLE_RE.search(n):
         return "female"
     if n.endswith("妹") or n.endswith("姐") or ("姐" in n and "师兄" not in n) or "妹" in n or ("女" in n and "男女" not in n):
         return "female"
-    if any(k in n for k in ("公子", "少爷", "师兄", "师弟", "师父", "老爷", "先生", "爷", "叔", "伯", "郎")):
+    if _MALE_TITLE_RE.search(n):
         return "male"
     if n.endswith("兄") or n.endswith("弟") or n.endswith("郎"):
         return "male"
@@ -671,6 +1024,147 @@ def _voice_gender_from_name_keywords(name: str) -> Optional[str]:
     return None
 
 
+_voice_disk_cache: Optional[dict[str, str]] = None
+_voice_disk_cache_lock = threading.Lock()
+
+
+def _voice_disk_cache_conn() -> sqlite3.Connection:
+    KIMI_VOICE_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(KIMI_VOICE_CACHE_PATH), timeout=5.0)
+    conn.execute("CREATE TABLE IF NOT EXISTS voice_cache (name TEXT PRIMARY KEY, voice_id TEXT NOT NULL)")
+    return conn
+
+
+def _voice_disk_cache_get(name: str) -> Optional[str]:
+    """按角色名（忽略大小写）查磁盘音色缓存；首次调用时整表读入内存，之后只查字典。"""
+    global _voice_disk_cache
+    with _voice_disk_cache_lock:
+        if _voice_disk_cache is None:
+            _voice_disk_cache = {}
+            try:
+                conn = _voice_disk_cache_conn()
+                try:
+                    _voice_disk_cache.update(conn.execute("SELECT name, voice_id FROM voice_cache").fetchall())
+                finally:
+                    conn.close()
+            except sqlite3.Error as e:
+                logger.warning("音色缓存读取失败: %s", e)
+        voice_id = _voice_disk_cache.get(name.lower())
+    return voice_id if voice_id in VOICE_IDS_ALLOWED else None
+
+
+def _voice_disk_cache_put(name: str, voice_id: str) -> None:
+    key = name.lower()
+    with _voice_disk_cache_lock:
+        if _voice_disk_cache is not None:
+            _voice_disk_cache.setdefault(key, voice_id)
+        try:
+            conn = _voice_disk_cache_conn()
+            try:
+                conn.execute("INSERT OR IGNORE INTO voice_cache (name, voice_id) VALUES (?, ?)", (key, voice_id))
+                conn.commit()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.warning("音色缓存写入失败: %s", e)
+
+
+# 选音色提示词共用的音色清单与选择规则（逐角色与批量两种请求格式共用）
+_VOICE_PICK_RULES = """男声（只能从以下选一个）：
+male-qn-qingse, male-qn-jingying, male-qn-badao, male-qn-daxuesheng,
+Chinese (Mandarin)_Gentleman, Chinese (Mandarin)_Gentle_Youth,
+Chinese (Mandarin)_Reliable_Executive, Chinese (Mandarin)_Lyrical_Voice, junlang_nanyou
+
+女声（只能从以下选一个）：
+female-shaonv, female-yujie, female-chengshu, female-tianmei,
+Chinese (Mandarin)_Warm_Girl, Chinese (Mandarin)_Crisp_Girl,
+Chinese (Mandarin)_News_Anchor, Chinese (Mandarin)_Sweet_Lady,
+tianxin_xiaoling, qiaopi_mengmei, wumei_yujie
+
+规则：先根据角色名和剧本**明确判断该角色是男是女**，女性角色必须从女声列表选，男性必须从男声列表选；再在对应性别中选最贴合气质的一个（如少女→female-shaonv/tianxin_xiaoling，御姐→female-yujie，公子/温润→Chinese (Mandarin)_Gentleman，沉稳→male-qn-jingying）。常见女性：绿竹、小雅、青萝、丫鬟、姑娘、小姐、XX姑娘；男性：孟川、公子、少爷、师兄、XX公子。"""
+
+_VOICE_PICK_SYSTEM = (
+    "你是配音选角助手。根据「角色名」「该句对白」和「剧本摘要」判断说话人性别与气质，**必须**在对应性别音色中选一个，不得搞错男女。\n"
+    "只回复一个音色ID，不要任何解释或标点。\n\n" + _VOICE_PICK_RULES
+)
+
+_VOICE_PICK_BATCH_SYSTEM = (
+    "你是配音选角助手。用户会给出一个 JSON 数组，每项含「name」（角色名）与「line」（该角色的一句代表对白），"
+    "可能附带剧本摘要。为**每个**角色判断性别与气质，**必须**在对应性别音色中选一个，不得搞错男女。\n"
+    "只输出 JSON 数组，每项为 {\"name\": 角色名原样, \"voice_id\": 音色ID}，不要任何解释。\n\n" + _VOICE_PICK_RULES
+)
+
+
+def _resolve_llm_voice(name: str, raw_voice_id: str) -> str:
+    """
+    校验 LLM 为角色 name 选出的音色：角色名与音色 ID 的性别线索冲突时改用对应性别默认音色，
+    非法 ID 按性别兜底。返回空字符串表示无法识别。
+    """
+    voice_id = raw_voice_id.strip().split("\n")[0].strip().strip(".").strip()
+    voice_lower = voice_id.lower().replace(" ", "_")
+    
+    # 先根据角色名判断性别
+    name_lower = name.lower()
+    is_male_name = _MALE_NAME_RE.search(name_lower) is not None
+    is_female_name = _FEMALE_NAME_RE.search(name_lower) is not None
+    
+    # 如果角色名明显是男性但 LLM 返回女性音色，拒绝
+    if is_male_name:
+        is_female_suggested = (
+            voice_id in VOICE_IDS_FEMALE or 
+            _FEMALE_VOICE_HINT_RE.search(voice_id) is not None
+        )
+        if is_female_suggested:
+            logger.warning("配音选择：角色'%s'是男性，但LLM返回女性音色'%s'，已拒绝", name, voice_id)
+            return "male-qn-jingying"
+    
+    # 如果角色名明显是女性但 LLM 返回男性音色，拒绝
+    if is_female_name:
+        is_male_suggested = (
+            voice_id in VOICE_IDS_MALE or 
+            _MALE_VOICE_HINT_RE.search(voice_id) is not None
+        )
+        if is_male_suggested:
+            logger.warning("配音选择：角色'%s'是女性，但LLM返回男性音色'%s'，已拒绝", name, voice_id)
+            return "female-yujie"
+    
+    # 现在可以安全接受 LLM 的建议了
+    if voice_id in VOICE_IDS_ALLOWED:
+        return voice_id
+    vid = _VOICE_ID_BY_NORM.get(voice_lower)
+    if vid:
+        return vid
+    
+    # 兜底：根据性别选择
+    if is_male_name:
+        return "male-qn-jingying"
+    if is_female_name:
+        return "female-yujie"
+    
+    # 最后的兜底
+    if voice_id in VOICE_IDS_MALE or _MALE_VOICE_HINT_RE.search(voice_id) is not None:
+        return "male-qn-jingying"
+    if voice_id in VOICE_IDS_FEMALE or _FEMALE_VOICE_HINT_RE.search(voice_id) is not None:
+        return "female-yujie"
+    return ""
+
+
+@functools.lru_cache(maxsize=2048)
+def _llm_pick_voice(name: str, sample: str, snippet: str) -> str:
+    """
+    用 LLM 为有角色名的对白选音色，并按角色名/音色 ID 中的性别线索校验。
+    同一 (角色名, 对白, 剧本摘要) 在进程内只请求一次；返回空字符串表示 LLM 结果无法识别。
+    """
+    user = f"角色名：{name}\n本句对白：{sample}"
+    if snippet:
+        user += f"\n剧本摘要（供判断角色性别与气质）：{snippet}"
+    out, _ = _kimi_chat(_VOICE_PICK_SYSTEM, user, max_tokens=80)
+    if not out:
+        # 请求失败不进 lru_cache（异常不会被缓存），下次仍会重试
+        raise RuntimeError("Kimi 未返回音色")
+    return _resolve_llm_voice(name, out)
+
+
 def infer_voice_for_drama_line(
     line_text: str,
     character_name: Optional[str] = None,
@@ -690,32 +1184,20 @@ def infer_voice_for_drama_line(
     if voice_cache is not None and name and name in voice_cache:
         return voice_cache[name]
 
+    def _remember(voice_id: str) -> str:
+        """有角色名时把选定音色写入 voice_cache 并返回。"""
+        if voice_cache is not None and name:
+            voice_cache[name] = voice_id
+        return voice_id
+
     # 有角色名时优先按已知名单或称谓关键词直接选性别，不依赖 LLM
     if name:
-        for n in KNOWN_FEMALE_NAMES:
-            if n in name or name == n:
-                out = "female-yujie"
-                if voice_cache is not None:
-                    voice_cache[name] = out
-                return out
-        for n in KNOWN_MALE_NAMES:
-            if n in name or name == n:
-                out = "male-qn-jingying"
-                if voice_cache is not None:
-                    voice_cache[name] = out
-                return out
-        # 称谓关键词：小姐/姑娘/公子/少爷等
-        gender = _voice_gender_from_name_keywords(name)
+        # 已知名单优先，其次称谓关键词：小姐/姑娘/公子/少爷等
+        gender = _known_name_gender(name) or _voice_gender_from_name_keywords(name)
         if gender == "female":
-            out = "female-yujie"
-            if voice_cache is not None:
-                voice_cache[name] = out
-            return out
+            return _remember("female-yujie")
         if gender == "male":
-            out = "male-qn-jingying"
-            if voice_cache is not None:
-                voice_cache[name] = out
-            return out
+            return _remember("male-qn-jingying")
 
     if not KIMI_API_KEY:
         return "male-qn-qingse"
@@ -723,110 +1205,115 @@ def infer_voice_for_drama_line(
     snippet = (script_snippet or "").strip()[:600]
 
     if name:
-        # 已知名单未命中，再用 LLM；结果仍用名单兜底，并写入 cache
-        system = """你是配音选角助手。根据「角色名」「该句对白」和「剧本摘要」判断说话人性别与气质，**必须**在对应性别音色中选一个，不得搞错男女。
-只回复一个音色ID，不要任何解释或标点。
-
-男声（只能从以下选一个）：
-male-qn-qingse, male-qn-jingying, male-qn-badao, male-qn-daxuesheng,
-Chinese (Mandarin)_Gentleman, Chinese (Mandarin)_Gentle_Youth,
-Chinese (Mandarin)_Reliable_Executive, Chinese (Mandarin)_Lyrical_Voice, junlang_nanyou
-
-女声（只能从以下选一个）：
-female-shaonv, female-yujie, female-chengshu, female-tianmei,
-Chinese (Mandarin)_Warm_Girl, Chinese (Mandarin)_Crisp_Girl,
-Chinese (Mandarin)_News_Anchor, Chinese (Mandarin)_Sweet_Lady,
-tianxin_xiaoling, qiaopi_mengmei, wumei_yujie
-
-规则：先根据角色名和剧本**明确判断该角色是男是女**，女性角色必须从女声列表选，男性必须从男声列表选；再在对应性别中选最贴合气质的一个（如少女→female-shaonv/tianxin_xiaoling，御姐→female-yujie，公子/温润→Chinese (Mandarin)_Gentleman，沉稳→male-qn-jingying）。常见女性：绿竹、小雅、青萝、丫鬟、姑娘、小姐、XX姑娘；男性：孟川、公子、少爷、师兄、XX公子。"""
-        user = f"角色名：{name}\n本句对白：{sample}"
-        if snippet:
-            user += f"\n剧本摘要（供判断角色性别与气质）：{snippet}"
-        out, _ = _kimi_chat(system, user, max_tokens=80)
+        # 已知名单未命中：先查磁盘缓存（跨剧本复用），再用 LLM；结果仍用名单兜底，并写入 cache
+        out = _voice_disk_cache_get(name) if KIMI_VOICE_CACHE_ENABLE else None
+        if not out:
+            try:
+                out = _llm_pick_voice(name, sample, snippet)
+            except RuntimeError:
+                out = ""
+            if out and KIMI_VOICE_CACHE_ENABLE:
+                _voice_disk_cache_put(name, out)
         if out:
-            voice_id = out.strip().split("\n")[0].strip().strip(".").strip()
-            voice_lower = voice_id.lower().replace(" ", "_")
-            
-            # 先根据角色名判断性别
-            name_lower = name.lower()
-            is_male_name = any(n in name_lower for n in ("孟川", "公子", "少爷", "师兄", "少年", "男子", "大侠"))
-            is_female_name = any(n in name_lower for n in ("绿竹", "小雅", "青萝", "丫鬟", "姑娘", "小姐", "少女", "女子", "师姐"))
-            
-            # 如果角色名明显是男性但 LLM 返回女性音色，拒绝
-            if is_male_name:
-                is_female_suggested = (
-                    voice_id in VOICE_IDS_FEMALE or 
-                    any(v in voice_id for v in ("female", "女", "Girl", "Lady", "Anchor", "tianxin", "qiaopi", "wumei"))
-                )
-                if is_female_suggested:
-                    logger.warning("配音选择：角色'%s'是男性，但LLM返回女性音色'%s'，已拒绝", name, voice_id)
-                    res = "male-qn-jingying"
-                    if voice_cache is not None and name:
-                        voice_cache[name] = res
-                    return res
-            
-            # 如果角色名明显是女性但 LLM 返回男性音色，拒绝
-            if is_female_name:
-                is_male_suggested = (
-                    voice_id in VOICE_IDS_MALE or 
-                    any(v in voice_id for v in ("male", "男", "Gentleman", "Youth", "Executive", "Lyrical", "junlang"))
-                )
-                if is_male_suggested:
-                    logger.warning("配音选择：角色'%s'是女性，但LLM返回男性音色'%s'，已拒绝", name, voice_id)
-                    res = "female-yujie"
-                    if voice_cache is not None and name:
-                        voice_cache[name] = res
-                    return res
-            
-            # 现在可以安全接受 LLM 的建议了
-            if voice_id in VOICE_IDS_ALLOWED:
-                if voice_cache is not None and name:
-                    voice_cache[name] = voice_id
-                return voice_id
-            for vid in VOICE_IDS_ALLOWED:
-                if vid.lower().replace(" ", "_") == voice_lower:
-                    if voice_cache is not None and name:
-                        voice_cache[name] = vid
-                    return vid
-            
-            # 兜底：根据性别选择
-            if is_male_name:
-                res = "male-qn-jingying"
-                if voice_cache is not None and name:
-                    voice_cache[name] = res
-                return res
-            if is_female_name:
-                res = "female-yujie"
-                if voice_cache is not None and name:
-                    voice_cache[name] = res
-                return res
-            
-            # 最后的兜底
-            if voice_id in VOICE_IDS_MALE or any(v in voice_id for v in ("male", "男", "Gentleman", "Youth", "Executive", "Lyrical", "junlang")):
-                res = "male-qn-jingying"
-                if voice_cache is not None and name:
-                    voice_cache[name] = res
-                return res
-            if voice_id in VOICE_IDS_FEMALE or any(v in voice_id for v in ("female", "女", "Girl", "Lady", "Anchor", "tianxin", "qiaopi", "wumei")):
-                res = "female-yujie"
-                if voice_cache is not None and name:
-                    voice_cache[name] = res
-                return res
-        
+            return _remember(out)
+
         # 无角色名时沿用原有逻辑
         return infer_voice_for_drama(line_text)
 
 
-def infer_voice_for_drama(script_text: str) -> str:
+def infer_voices_for_characters(
+    chars: list[dict[str, str]],
+    script_snippet: str = "",
+) -> dict[str, str]:
     """
-    根据短剧旁白/对白内容，用 LLM 推断主要叙述者或主角的性别与气质，返回 MiniMax 音色 ID。
-    用于成片配音时智能选择男声/女声及风格（青年/成熟、活泼/沉稳等）。
-    失败或未配置 LLM 时返回默认男声 male-qn-qingse。
+    一次性为多个角色选音色：chars 每项为 {"name": 角色名, "line": 代表对白}，返回 {角色名: 音色ID}。
+    已知名单/称谓关键词能判定性别的角色、磁盘缓存命中的角色本地直接给出；其余角色合并成一次 LLM 请求
+    （JSON 数组进、JSON 数组出），逐项沿用与单角色相同的男女校验。请求失败或未返回的角色不出现在结果中。
     """
-    if not (KIMI_API_KEY and script_text and script_text.strip()):
-        return "male-qn-qingse"
-    sample = script_text.strip()[:1500]
-    system = """你是配音选角助手。根据以下短剧旁白/对白内容，判断主要叙述者或主角的性别与气质。
+    result: dict[str, str] = {}
+    residue: list[dict[str, str]] = []
+    seen: set[str] = set()
+    for item in chars:
+        name = (item.get("name") or "").strip()
+        line = (item.get("line") or "").strip()
+        if not name or not line or name in seen:
+            continue
+        seen.add(name)
+        gender = _known_name_gender(name) or _voice_gender_from_name_keywords(name)
+        if gender:
+            result[name] = "female-yujie" if gender == "female" else "male-qn-jingying"
+            continue
+        cached = _voice_disk_cache_get(name) if KIMI_VOICE_CACHE_ENABLE else None
+        if cached:
+            result[name] = cached
+            continue
+        residue.append({"name": name, "line": line[:800]})
+    if not residue or not KIMI_API_KEY:
+        return result
+
+    user = _dumps_compact(residue)
+    snippet = (script_snippet or "").strip()[:600]
+    if snippet:
+        user += f"\n剧本摘要（供判断角色性别与气质）：{snippet}"
+    out, err = _kimi_chat(_VOICE_PICK_BATCH_SYSTEM, user, max_tokens=min(4096, 200 + 60 * len(residue)))
+    arr = _parse_json_array(out)
+    if arr is None:
+        logger.warning("批量选音色失败（%d 个角色）：%s", len(residue), err or "输出无法解析")
+        return result
+    wanted = seen - result.keys()
+    for entry in arr:
+        if not isinstance(entry, dict):
+            continue
+        name = str(entry.get("name") or "").strip()
+        if name not in wanted or name in result:
+            continue
+        voice_id = _resolve_llm_voice(name, str(entry.get("voice_id") or ""))
+        if voice_id:
+            result[name] = voice_id
+            if KIMI_VOICE_CACHE_ENABLE:
+                _voice_disk_cache_put(name, voice_id)
+    return result
+
+
+def prefetch_voices_for_drama_lines(
+    lines: list[tuple[str, Optional[str]]],
+    script_snippet: str = "",
+    voice_cache: Optional[dict[str, str]] = None,
+) -> None:
+    """
+    逐镜配音前批量预判音色：lines 为 (对白, 角色名)。每个尚未在 voice_cache 中的角色名取其首句对白，
+    先用 infer_voices_for_characters 一次请求选完；批量结果缺失的角色再用线程池并发调用 infer_voice_for_drama_line，
+    并把各次调用写入的缓存合并回 voice_cache。之后逐镜调用 infer_voice_for_drama_line 会直接命中缓存（同一角色以首句为准）。
+    """
+    if voice_cache is None or not KIMI_API_KEY:
+        return
+    first_lines: dict[str, str] = {}
+    for text, name in lines:
+        name = (name or "").strip()
+        if name and name not in voice_cache and name not in first_lines and text and text.strip():
+            first_lines[name] = text
+    if len(first_lines) < 2:
+        return
+    voice_cache.update(
+        infer_voices_for_characters([{"name": n, "line": t} for n, t in first_lines.items()], script_snippet=script_snippet)
+    )
+    first_lines = {n: t for n, t in first_lines.items() if n not in voice_cache}
+    if len(first_lines) < 2:
+        return
+
+    def _infer_one(item: tuple[str, str]) -> dict[str, str]:
+        name, text = item
+        local_cache: dict[str, str] = {}
+        infer_voice_for_drama_line(text, character_name=name, script_snippet=script_snippet, voice_cache=local_cache)
+        return local_cache
+
+    with ThreadPoolExecutor(max_workers=min(KIMI_VOICE_MAX_WORKERS, len(first_lines))) as ex:
+        for local_cache in ex.map(_infer_one, first_lines.items()):
+            voice_cache.update(local_cache)
+
+
+# 整剧主音色推断 system 提示词
+_DRAMA_VOICE_SYSTEM = """你是配音选角助手。根据以下短剧旁白/对白内容，判断主要叙述者或主角的性别与气质。
 只回复一个音色ID，不要任何解释或标点。
 
 可选音色ID（只能回复其中一个）：
@@ -852,24 +1339,85 @@ def infer_voice_for_drama(script_text: str) -> str:
 - 妩媚御姐：wumei_yujie
 
 根据内容中的人称（他/她）、语气、角色设定选择最贴合的单一音色ID。"""
+
+
+def infer_voice_for_drama(script_text: str) -> str:
+    """
+    根据短剧旁白/对白内容，用 LLM 推断主要叙述者或主角的性别与气质，返回 MiniMax 音色 ID。
+    用于成片配音时智能选择男声/女声及风格（青年/成熟、活泼/沉稳等）。
+    失败或未配置 LLM 时返回默认男声 male-qn-qingse。
+    """
+    if not (KIMI_API_KEY and script_text and script_text.strip()):
+        return "male-qn-qingse"
+    sample = script_text.strip()[:1500]
     user = f"短剧旁白/对白摘要：\n{sample}"
-    out, _ = _kimi_chat(system, user, max_tokens=80)
+    out, _ = _kimi_chat(_DRAMA_VOICE_SYSTEM, user, max_tokens=80)
     if not out:
         return "male-qn-qingse"
     voice_id = out.strip().split("\n")[0].strip().strip(".").strip()
     if voice_id in VOICE_IDS_ALLOWED:
         return voice_id
-    voice_lower = voice_id.lower().replace(" ", "_")
-    for vid in VOICE_IDS_ALLOWED:
-        if vid.lower().replace(" ", "_") == voice_lower:
-            return vid
-    return "male-qn-qingse"
+    return _VOICE_ID_BY_NORM.get(voice_id.lower().replace(" ", "_"), "male-qn-qingse")
 
 
 # 与火山 TTS 多情感音色对齐的情绪标签
 DRAMA_EMOTION_VALUES = frozenset({"happy", "sad", "angry", "surprised", "fear", "excited", "coldness", "neutral", "hate"})
 
 
+def _parse_json_array(out: Optional[str]) -> Optional[list]:
+    """解析 LLM 输出的 JSON 数组（可带 markdown 包裹）；无法解析或不是数组时返回 None。"""
+    if not out or not out.strip():
+        return None
+    out = out.strip()
+    if "```" in out:
+        for sep in ("```json", "```"):
+            if sep in out:
+                i = out.find(sep) + len(sep)
+                j = out.find("```", i)
+                if j > i:
+                    out = out[i:j].strip()
+                    break
+    try:
+        arr = _loads(out)
+    except ValueError:
+        return None
+    return arr if isinstance(arr, list) else None
+
+
+def _parse_emotion_array(out: Optional[str]) -> Optional[dict[int, Optional[str]]]:
+    """解析情绪标注输出（JSON 数组，可带 markdown 包裹）为 {镜头序号: 情绪}；无法解析返回 None。"""
+    arr = _parse_json_array(out)
+    if arr is None:
+        return None
+    by_index: dict[int, Optional[str]] = {}
+    for item in arr:
+        if not isinstance(item, dict):
+            continue
+        idx = item.get("index")
+        em = (item.get("emotion") or "").strip().lower()
+        if em not in DRAMA_EMOTION_VALUES:
+            em = "neutral" if em else None
+        by_index[int(idx) if idx is not None else 0] = em
+    return by_index
+
+
+# 台词情绪标注 system 提示词（各分块请求共用）
+_EMOTION_TAG_SYSTEM = """你是短剧配音情绪标注助手。根据每一句台词、前后句、说话人身份与剧本语境，判断该句应使用的**说话情绪**，使 TTS 合成有代入感、情感分明、不显平淡。
+
+规则：
+- 只输出一个 JSON 数组，每项形如 {"index": 镜头序号, "emotion": "情绪"}。
+- emotion 只能从以下选一：happy（开心/亲切）, sad（难过/委屈）, angry（生气/不耐烦）, surprised（惊讶）, fear（害怕/紧张）, excited（激动/兴奋）, coldness（冷淡/克制）, hate（厌恶）, neutral（平静/中性）。
+
+【严禁整段戏大量 neutral，必须情感分明、有起伏】
+- **至少三分之二镜头**应有明确非 neutral 情绪（happy / excited / coldness / sad / surprised / angry 等），整段戏要有明显起伏，避免整体偏平。
+- 邀请、请求、期待、热情告知、催促 → 必须用 happy 或 excited，禁止用 neutral。例如：请公子、同去、别院可宿、快来、美得很、想请、求求、拜托 → excited 或 happy。
+- 拒绝、婉拒、解释、推辞、冷淡回应、告辞 → 必须用 coldness 或 neutral。例如：不必了、太远、不能同行、转告、算了、告辞、免了 → coldness。
+- 问候、温和回应、礼节性 → 用 happy 或 neutral。例如：诸位师弟师妹早、多谢公子、幸会、有劳 → happy。
+- 少女/丫鬟跑着喊人、催促、兴奋通知 → excited。例如：公子公子、小姐、快来 → excited。
+- 遗憾、告别、舍不得、叹气 → sad 或 neutral。惊讶、意外、怎会 → surprised。生气、烦、放肆 → angry。
+- 无台词或纯动作的镜头填 neutral。"""
+
+
 def infer_emotion_for_drama_lines(
     shots: list[dict],
     script_snippet: str = "",
@@ -887,55 +1435,33 @@ def infer_emotion_for_drama_lines(
         prev = (shots[i - 1].get("copy") or shots[i - 1].get("copy_text") or "").strip() if i > 0 else ""
         nxt = (shots[i + 1].get("copy") or shots[i + 1].get("copy_text") or "").strip() if i + 1 < len(shots) else ""
         lines_for_llm.append({"index": i + 1, "line": copy[:200], "prev": prev[:120], "next": nxt[:120]})
-    system = """你是短剧配音情绪标注助手。根据每一句台词、前后句、说话人身份与剧本语境，判断该句应使用的**说话情绪**，使 TTS 合成有代入感、情感分明、不显平淡。
-
-规则：
-- 只输出一个 JSON 数组，每项形如 {"index": 镜头序号, "emotion": "情绪"}。
-- emotion 只能从以下选一：happy（开心/亲切）, sad（难过/委屈）, angry（生气/不耐烦）, surprised（惊讶）, fear（害怕/紧张）, excited（激动/兴奋）, coldness（冷淡/克制）, hate（厌恶）, neutral（平静/中性）。
-
-【严禁整段戏大量 neutral，必须情感分明、有起伏】
-- **至少三分之二镜头**应有明确非 neutral 情绪（happy / excited / coldness / sad / surprised / angry 等），整段戏要有明显起伏，避免整体偏平。
-- 邀请、请求、期待、热情告知、催促 → 必须用 happy 或 excited，禁止用 neutral。例如：请公子、同去、别院可宿、快来、美得很、想请、求求、拜托 → excited 或 happy。
-- 拒绝、婉拒、解释、推辞、冷淡回应、告辞 → 必须用 coldness 或 neutral。例如：不必了、太远、不能同行、转告、算了、告辞、免了 → coldness。
-- 问候、温和回应、礼节性 → 用 happy 或 neutral。例如：诸位师弟师妹早、多谢公子、幸会、有劳 → happy。
-- 少女/丫鬟跑着喊人、催促、兴奋通知 → excited。例如：公子公子、小姐、快来 → excited。
-- 遗憾、告别、舍不得、叹气 → sad 或 neutral。惊讶、意外、怎会 → surprised。生气、烦、放肆 → angry。
-- 无台词或纯动作的镜头填 neutral。"""
-    user = "请为以下每镜台词标注情绪，输出 JSON 数组，不要 markdown 包裹。要求：**情感分明、起伏明显**，至少三分之二镜头标非 neutral，邀请/热情用 happy 或 excited、拒绝/冷淡用 coldness，严禁大量标 neutral。\n"
+    user_head = "请为以下每镜台词标注情绪，输出 JSON 数组，不要 markdown 包裹。要求：**情感分明、起伏明显**，至少三分之二镜头标非 neutral，邀请/热情用 happy 或 excited、拒绝/冷淡用 coldness，严禁大量标 neutral。\n"
     if script_snippet and script_snippet.strip():
-        user += f"剧本摘要（供语境与人物关系）：\n{script_snippet.strip()[:600]}\n\n"
-    user += "每镜台词（含前后句，便于判断情绪起伏）：\n" + json.dumps(lines_for_llm, ensure_ascii=False, indent=2)
-    out, _ = _kimi_chat(system, user, max_tokens=1024)
-    if not out or not out.strip():
-        return [None] * len(shots)
-    out = out.strip()
-    if "```" in out:
-        for sep in ("```json", "```"):
-            if sep in out:
-                i = out.find(sep) + len(sep)
-                j = out.find("```", i)
-                if j > i:
-                    out = out[i:j].strip()
-                    break
-    try:
-        arr = json.loads(out)
-    except json.JSONDecodeError:
-        return [None] * len(shots)
-    if not isinstance(arr, list):
+        user_head += f"剧本摘要（供语境与人物关系）：\n{script_snippet.strip()[:600]}\n\n"
+    user_head += "每镜台词（含前后句，便于判断情绪起伏）：\n"
+
+    def _infer_chunk(chunk: list[dict]) -> Optional[dict[int, Optional[str]]]:
+        out, _ = _kimi_chat(_EMOTION_TAG_SYSTEM, user_head + _dumps_compact(chunk), max_tokens=1024)
+        return _parse_emotion_array(out)
+
+    # 长分镜按固定条数分块（每条自带前后句，分块不丢上下文），避免单次输出超过 max_tokens 被截断后整体失败；各块并发请求
+    chunks = [lines_for_llm[i:i + KIMI_EMOTION_BATCH_SIZE] for i in range(0, len(lines_for_llm), KIMI_EMOTION_BATCH_SIZE)]
+    if len(chunks) == 1:
+        parsed = [_infer_chunk(chunks[0])]
+    else:
+        with ThreadPoolExecutor(max_workers=min(KIMI_EMOTION_MAX_WORKERS, len(chunks))) as ex:
+            parsed = list(ex.map(_infer_chunk, chunks))
+    if all(p is None for p in parsed):
         return [None] * len(shots)
-    by_index = {}
-    for item in arr:
-        if not isinstance(item, dict):
+    # 按块回填：每块只取本块镜头的序号（含 0 起编号的兜底），失败块的镜头保持 None，不会误取相邻块的结果
+    result: list[Optional[str]] = [None] * len(shots)
+    for chunk, by_index in zip(chunks, parsed):
+        if not by_index:
             continue
-        idx = item.get("index")
-        em = (item.get("emotion") or "").strip().lower()
-        if em not in DRAMA_EMOTION_VALUES:
-            em = "neutral" if em else None
-        by_index[int(idx) if idx is not None else 0] = em
-    result = []
-    for i in range(len(shots)):
-        em = by_index.get(i + 1) or by_index.get(i)
-        result.append(em if em in DRAMA_EMOTION_VALUES else None)
+        for item in chunk:
+            n = item["index"]
+            em = by_index.get(n) or by_index.get(n - 1)
+            result[n - 1] = em if em in DRAMA_EMOTION_VALUES else None
     # 加强：LLM 标成 neutral 的镜头，若台词有关键词情绪则用关键词覆盖，避免情感过平
     try:
         from app.services import volcano_speech
@@ -953,6 +1479,16 @@ def infer_emotion_for_drama_lines(
     return result
 
 
+# 视频生成方式推荐 system 提示词
+_VIDEO_MODE_SYSTEM = """你是视频生成策略助手。根据分镜与剧本，从以下四种方式中选一种最合适的，只输出一行：模式|一句话理由。
+- smart_multiframe：智能多帧。多张关键帧图片，每两帧之间用提示词描述过渡（发生了什么），首尾帧(FL2V)串联成一段视频；适合多镜头、每镜有明确画面且需要连贯过渡时。
+- t2v_single：单段文生视频。仅当分镜只有 1 条时用。
+- t2v_multi：多段文生再拼接。每镜单独一条文生视频，生成多段再拼接；适合多段独立镜头、无关键帧图时。
+- i2v_multi：先生图再图生视频。每镜先文生图再图生视频，画面更可控；适合对画面质量要求高、场景描述具体的分镜。
+
+输出格式严格为：模式|理由。例如：smart_multiframe|多镜有明确画面，智能多帧用关键帧+过渡提示词串联。"""
+
+
 def suggest_video_mode_llm(
     storyboard: list[dict],
     script_summary: str,
@@ -968,13 +1504,6 @@ def suggest_video_mode_llm(
         f"{i+1}. 画面：{s.get('shot_desc','')} | 文案：{(s.get('copy') or '')[:80]}"
         for i, s in enumerate(storyboard[:10])
     )
-    system = """你是视频生成策略助手。根据分镜与剧本，从以下四种方式中选一种最合适的，只输出一行：模式|一句话理由。
-- smart_multiframe：智能多帧。多张关键帧图片，每两帧之间用提示词描述过渡（发生了什么），首尾帧(FL2V)串联成一段视频；适合多镜头、每镜有明确画面且需要连贯过渡时。
-- t2v_single：单段文生视频。仅当分镜只有 1 条时用。
-- t2v_multi：多段文生再拼接。每镜单独一条文生视频，生成多段再拼接；适合多段独立镜头、无关键帧图时。
-- i2v_multi：先生图再图生视频。每镜先文生图再图生视频，画面更可控；适合对画面质量要求高、场景描述具体的分镜。
-
-输出格式严格为：模式|理由。例如：smart_multiframe|多镜有明确画面，智能多帧用关键帧+过渡提示词串联。"""
     user = f"""管线类型：{pipeline}
 剧本摘要（前 300 字）：
 {script_summary[:300]}
@@ -983,7 +1512,7 @@ def suggest_video_mode_llm(
 {shots_text}
 
 请选择最合适的生成方式并输出：模式|理由（一行）。"""
-    out, _ = _kimi_chat(system, user, max_tokens=150)
+    out, _ = _kimi_chat(_VIDEO_MODE_SYSTEM, user, max_tokens=150)
     if not out or "|" not in out:
         return None
     line = out.strip().split("\n")[0]
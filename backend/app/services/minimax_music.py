@@ -1,13 +1,23 @@
 """MiniMax 音乐生成：BGM/背景音乐，用于成片配乐。"""
+import atexit
 import os
 import shutil
 import subprocess
 import tempfile
+import threading
 from pathlib import Path
 from typing import Optional
 
 import httpx
 
+try:
+    # 可选：本地兜底 BGM 在进程内合成并编码，免去每次拉起 ffmpeg 子进程
+    import lameenc
+    import numpy as np
+except ImportError:
+    lameenc = None
+    np = None
+
 MINIMAX_API_KEY = (os.getenv("MINIMAX_API_KEY") or "").strip()
 MINIMAX_BASE = (os.getenv("MINIMAX_BASE") or "https://api.minimaxi.com").rstrip("/")
 MUSIC_MODEL = "music-2.5"
@@ -17,6 +27,36 @@ BGM_PROVIDER = (os.getenv("BGM_PROVIDER") or "minimax").strip().lower()  # minim
 LOCAL_BGM_PATH = (os.getenv("LOCAL_BGM_PATH") or "").strip()
 
 
+_client: Optional[httpx.Client] = None
+_client_pid: Optional[int] = None
+_client_lock = threading.Lock()
+
+
+def _get_client() -> httpx.Client:
+    """返回共享 httpx.Client（懒创建；fork 后的子进程会重建）。生成请求与音频下载复用 keep-alive 连接，免去重复 TLS 握手。"""
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+    with _client_lock:
+        if _client is None or _client_pid != pid:
+            _client = httpx.Client(
+                timeout=120.0,
+                follow_redirects=True,
+                limits=httpx.Limits(max_keepalive_connections=4, max_connections=8, keepalive_expiry=60.0),
+            )
+            _client_pid = pid
+    return _client
+
+
+def _close_client() -> None:
+    if _client is not None and _client_pid == os.getpid():
+        _client.close()
+
+
+atexit.register(_close_client)
+
+
 def _headers() -> dict:
     if not MINIMAX_API_KEY:
         raise ValueError("MINIMAX_API_KEY not set")
@@ -46,13 +86,47 @@ def _try_local_bgm_copy() -> tuple[Optional[str], Optional[str]]:
         return None, str(e)
 
 
+_SYNTH_SAMPLE_RATE = 24000
+
+
+def _synth_pink_noise_mp3(dur: int) -> bytes:
+    """
+    进程内合成与 ffmpeg 方案同参数的氛围底噪：白噪声在频域按 1/√f 成形为粉噪声并只保留 80–1800 Hz，
+    峰值缩放到约 0.03（对应 amplitude=0.05 × volume=0.6），再编码为 24 kHz 单声道 128 kbps mp3。
+    """
+    n = dur * _SYNTH_SAMPLE_RATE
+    rng = np.random.default_rng()
+    spectrum = rng.standard_normal(n // 2 + 1) + 1j * rng.standard_normal(n // 2 + 1)
+    freqs = np.fft.rfftfreq(n, d=1.0 / _SYNTH_SAMPLE_RATE)
+    band = (freqs >= 80) & (freqs <= 1800)
+    spectrum[~band] = 0
+    spectrum[band] /= np.sqrt(freqs[band])
+    pink = np.fft.irfft(spectrum, n)
+    pink *= 0.03 / max(float(np.abs(pink).max()), 1e-9)
+    encoder = lameenc.Encoder()
+    encoder.set_bit_rate(128)
+    encoder.set_in_sample_rate(_SYNTH_SAMPLE_RATE)
+    encoder.set_channels(1)
+    encoder.set_quality(7)
+    return bytes(encoder.encode((pink * 32767).astype(np.int16).tobytes()) + encoder.flush())
+
+
 def _try_local_bgm_synth(duration_sec: int) -> tuple[Optional[str], Optional[str]]:
     """
-    用 ffmpeg 合成一段简单“氛围底噪”作为 BGM（兜底方案，不依赖外部 API）。
+    合成一段简单“氛围底噪”作为 BGM（兜底方案，不依赖外部 API）：
+    已安装 numpy + lameenc 时进程内合成，否则用 ffmpeg。
     """
     dur = int(duration_sec or 0)
     if dur <= 0:
         dur = 20
+    if np is not None:
+        try:
+            data = _synth_pink_noise_mp3(dur)
+            with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as out:
+                out.write(data)
+            return out.name, None
+        except Exception:
+            pass  # 进程内合成失败时退回 ffmpeg
     tmp = tempfile.NamedTemporaryFile(suffix=".mp3", delete=False)
     tmp.close()
     lavfi = f"anoisesrc=color=pink:amplitude=0.05:duration={dur}"
@@ -106,13 +180,43 @@ def _fallback_bgm(duration_sec: Optional[int] = None) -> tuple[Optional[str], Op
     return _try_local_bgm_synth(duration_sec or 20)
 
 
+# 十六进制音频按块解码写盘的块大小（字符数，须为偶数）
+_HEX_CHUNK_CHARS = 131072
+
+
+def _save_audio(raw: str, output_format: str) -> str:
+    """
+    把接口返回的音频写入临时 mp3 并返回路径：url 直接流式下载落盘，hex 分块解码落盘，
+    避免整段音频在内存中再多出一份完整拷贝。写入失败时删除临时文件并抛出异常。
+    """
+    out = tempfile.NamedTemporaryFile(suffix=".mp3", delete=False)
+    try:
+        with out:
+            if output_format == "url":
+                # 返回的是 URL，边下载边写入本地
+                with _get_client().stream("GET", raw, timeout=60.0) as resp:
+                    resp.raise_for_status()
+                    for chunk in resp.iter_bytes(65536):
+                        out.write(chunk)
+            else:
+                for i in range(0, len(raw), _HEX_CHUNK_CHARS):
+                    out.write(bytes.fromhex(raw[i:i + _HEX_CHUNK_CHARS]))
+    except Exception:
+        try:
+            os.unlink(out.name)
+        except Exception:
+            pass
+        raise
+    return out.name
+
+
 def generate_bgm(
     prompt: str = "轻快, 短视频背景音乐, 无歌词, instrumental",
     lyrics: str = "[Inst]\n纯音乐",
     duration_sec: Optional[int] = None,
     sample_rate: int = 44100,
     bitrate: int = 256000,
-    output_format: str = "hex",
+    output_format: str = "url",
 ) -> tuple[Optional[str], Optional[str]]:
     """
     生成 BGM 音频。返回 (本地 mp3 路径, error_msg)。
@@ -136,32 +240,19 @@ def generate_bgm(
         "stream": False,
     }
     try:
-        with httpx.Client(timeout=120.0) as client:
-            r = client.post(url, json=payload, headers=_headers())
-            data = r.json() if r.content else {}
-            base = data.get("base_resp", {})
-            code = base.get("status_code")
-            if r.status_code != 200:
-                err = base.get("status_msg") or r.text or f"HTTP {r.status_code}"
-                return None, err
-            if code != 0:
-                return None, base.get("status_msg") or f"status_code={code}"
-            raw = data.get("data", {}).get("audio")
-            if not raw:
-                return None, "无音频数据"
-            if output_format == "url":
-                # 返回的是 URL，下载后保存到本地
-                with httpx.Client(timeout=60.0, follow_redirects=True) as c:
-                    resp = c.get(raw)
-                    resp.raise_for_status()
-                    content = resp.content
-            else:
-                import binascii
-                content = binascii.unhexlify(raw)
-            out = tempfile.NamedTemporaryFile(suffix=".mp3", delete=False)
-            out.write(content)
-            out.close()
-            return out.name, None
+        r = _get_client().post(url, json=payload, headers=_headers())
+        data = r.json() if r.content else {}
+        base = data.get("base_resp", {})
+        code = base.get("status_code")
+        if r.status_code != 200:
+            err = base.get("status_msg") or r.text or f"HTTP {r.status_code}"
+            return None, err
+        if code != 0:
+            return None, base.get("status_msg") or f"status_code={code}"
+        raw = data.get("data", {}).get("audio")
+        if not raw:
+            return None, "无音频数据"
+        return _save_audio(raw, output_format), None
     except ValueError as e:
         # key 未配置时也兜底
         if "MINIMAX_API_KEY" in str(e):
@@ -4,6 +4,7 @@
 """
 from __future__ import annotations
 
+import functools
 import re
 from dataclasses import dataclass, field
 from typing import Any
@@ -206,58 +207,126 @@ SCENE_REGISTRY: dict[str, SceneTypeDef] = {
 }
 
 
-def detect_scene_type(shot: dict[str, Any]) -> str:
-    """
-    根据单条分镜的 shot_desc、copy、t2v_prompt 检测最匹配的场景类型。
-    返回 SCENE_TYPE_* 常量，未匹配时返回 SCENE_TYPE_DEFAULT。
-    优先级：按关键词命中数量与顺序，先命中先返回（战斗/竞速等强类型优先）。
-    """
+# 强类型优先顺序（避免被「对话」等泛词抢走）
+_SCENE_PRIORITY_ORDER: tuple[str, ...] = (
+    SCENE_TYPE_BATTLE,
+    SCENE_TYPE_RACING,
+    SCENE_TYPE_CHASE,
+    SCENE_TYPE_DISASTER,
+    SCENE_TYPE_MUSICAL,
+    SCENE_TYPE_SPORTS,
+    SCENE_TYPE_CEREMONY,
+    SCENE_TYPE_COURT,
+    SCENE_TYPE_MEDICAL,
+    SCENE_TYPE_CAMPUS,
+    SCENE_TYPE_PERIOD_WUXIA,
+    SCENE_TYPE_SCI_FI,
+    SCENE_TYPE_SUSPENSE,
+    SCENE_TYPE_EMOTIONAL,
+    SCENE_TYPE_ACTION,
+    SCENE_TYPE_NATURE,
+    SCENE_TYPE_DIALOGUE,
+    SCENE_TYPE_DAILY,
+)
+
+
+def _build_scene_keyword_ranks() -> dict[str, int]:
+    """关键词 -> 所属场景在优先顺序中的名次；同一关键词出现在多类时取名次最靠前者。"""
+    ranks: dict[str, int] = {}
+    for rank, code in enumerate(_SCENE_PRIORITY_ORDER):
+        defn = SCENE_REGISTRY.get(code)
+        if not defn:
+            continue
+        for kw in defn.keywords:
+            if kw and kw not in ranks:
+                ranks[kw] = rank
+    return ranks
+
+
+_SCENE_KEYWORD_RANKS = _build_scene_keyword_ranks()
+
+try:
+    import ahocorasick  # pyahocorasick，可选
+
+    _SCENE_AC = ahocorasick.Automaton()
+    for _kw, _rank in _SCENE_KEYWORD_RANKS.items():
+        _SCENE_AC.add_word(_kw, _rank)
+    _SCENE_AC.make_automaton()
+except ImportError:
+    _SCENE_AC = None
+
+# 未安装 pyahocorasick 时的回退：首字 -> [(名次, 关键词)]（按名次升序），
+# 先用首字字符集定位候选位置，再只比对以该字开头的关键词
+_SCENE_KEYWORDS_BY_HEAD: dict[str, list[tuple[int, str]]] = {}
+for _kw, _rank in sorted(_SCENE_KEYWORD_RANKS.items(), key=lambda kv: kv[1]):
+    _SCENE_KEYWORDS_BY_HEAD.setdefault(_kw[0], []).append((_rank, _kw))
+_SCENE_KEYWORD_HEAD_RE = re.compile("[" + "".join(re.escape(c) for c in _SCENE_KEYWORDS_BY_HEAD) + "]")
+
+
+def _best_scene_rank(text: str) -> int:
+    """一次线性扫描 text，返回命中关键词中最靠前的优先名次；无命中返回 len(_SCENE_PRIORITY_ORDER)。"""
+    best = len(_SCENE_PRIORITY_ORDER)
+    if _SCENE_AC is not None:
+        for _end, rank in _SCENE_AC.iter(text):
+            if rank < best:
+                best = rank
+                if best == 0:
+                    break
+        return best
+    for m in _SCENE_KEYWORD_HEAD_RE.finditer(text):
+        i = m.start()
+        for rank, kw in _SCENE_KEYWORDS_BY_HEAD[text[i]]:
+            if rank >= best:
+                break
+            if text.startswith(kw, i):
+                best = rank
+                break
+        if best == 0:
+            break
+    return best
+
+
+# 按优先名次平铺的并行表（SoA）：热路径只做下标访问，不再逐镜取 SceneTypeDef 属性；名次 len(_SCENE_PRIORITY_ORDER) 表示未识别
+_SCENE_SHOT_GUIDANCE: tuple[str, ...] = tuple(
+    (SCENE_REGISTRY[code].prompt_guidance or "").strip() if code in SCENE_REGISTRY else ""
+    for code in _SCENE_PRIORITY_ORDER
+)
+_SCENE_REFINE_GUIDANCE: tuple[str, ...] = tuple(
+    f"【{SCENE_REGISTRY[code].name_cn}】{SCENE_REGISTRY[code].prompt_guidance}"
+    if code in SCENE_REGISTRY and SCENE_REGISTRY[code].prompt_guidance else ""
+    for code in _SCENE_PRIORITY_ORDER
+)
+
+
+@functools.lru_cache(maxsize=4096)
+def _detect_scene_rank_from_text(text: str) -> int:
+    """按已拼接并小写的分镜文本返回场景优先名次；同一文本（重复镜头、多次精修）直接命中缓存。"""
+    return _best_scene_rank(text)
+
+
+def _shot_scene_rank(shot: dict[str, Any]) -> int:
     text_parts = [
         (shot.get("shot_desc") or "").strip(),
         (shot.get("copy") or shot.get("copy_text") or "").strip(),
         (shot.get("t2v_prompt") or "").strip(),
     ]
-    combined = " ".join(p for p in text_parts if p).lower()
-
-    # 强类型优先顺序（避免被「对话」等泛词抢走）
-    priority_order = [
-        SCENE_TYPE_BATTLE,
-        SCENE_TYPE_RACING,
-        SCENE_TYPE_CHASE,
-        SCENE_TYPE_DISASTER,
-        SCENE_TYPE_MUSICAL,
-        SCENE_TYPE_SPORTS,
-        SCENE_TYPE_CEREMONY,
-        SCENE_TYPE_COURT,
-        SCENE_TYPE_MEDICAL,
-        SCENE_TYPE_CAMPUS,
-        SCENE_TYPE_PERIOD_WUXIA,
-        SCENE_TYPE_SCI_FI,
-        SCENE_TYPE_SUSPENSE,
-        SCENE_TYPE_EMOTIONAL,
-        SCENE_TYPE_ACTION,
-        SCENE_TYPE_NATURE,
-        SCENE_TYPE_DIALOGUE,
-        SCENE_TYPE_DAILY,
-    ]
+    return _detect_scene_rank_from_text(" ".join(p for p in text_parts if p).lower())
 
-    for code in priority_order:
-        defn = SCENE_REGISTRY.get(code)
-        if not defn:
-            continue
-        for kw in defn.keywords:
-            if kw in combined:
-                return code
-    return SCENE_TYPE_DEFAULT
+
+def detect_scene_type(shot: dict[str, Any]) -> str:
+    """
+    根据单条分镜的 shot_desc、copy、t2v_prompt 检测最匹配的场景类型。
+    返回 SCENE_TYPE_* 常量，未匹配时返回 SCENE_TYPE_DEFAULT。
+    优先级：按 _SCENE_PRIORITY_ORDER 取命中关键词中名次最靠前的类型（战斗/竞速等强类型优先）。
+    """
+    rank = _shot_scene_rank(shot)
+    return _SCENE_PRIORITY_ORDER[rank] if rank < len(_SCENE_PRIORITY_ORDER) else SCENE_TYPE_DEFAULT
 
 
 def get_scene_guidance_for_shot(shot: dict[str, Any]) -> str:
     """返回该镜头对应场景类型的 prompt_guidance，用于精修时注入。若无则返回空字符串。"""
-    code = detect_scene_type(shot)
-    if code == SCENE_TYPE_DEFAULT:
-        return ""
-    defn = SCENE_REGISTRY.get(code)
-    return (defn.prompt_guidance or "").strip()
+    rank = _shot_scene_rank(shot)
+    return _SCENE_SHOT_GUIDANCE[rank] if rank < len(_SCENE_PRIORITY_ORDER) else ""
 
 
 def get_scene_guidance_for_refine(storyboard: list[dict[str, Any]]) -> str:
@@ -265,16 +334,19 @@ def get_scene_guidance_for_refine(storyboard: list[dict[str, Any]]) -> str:
     根据整组分镜统计场景类型，汇总成一段「场景指引」文案，供 refine_storyboard_t2v_prompts_llm
     的 user 或 system 追加使用。仅包含本片出现的场景类型，避免冗长。
     """
-    seen: set[str] = set()
+    n_types = len(_SCENE_PRIORITY_ORDER)
+    seen: set[int] = set()
     parts: list[str] = []
     for shot in storyboard:
-        code = detect_scene_type(shot)
-        if code in seen or code == SCENE_TYPE_DEFAULT:
+        rank = _shot_scene_rank(shot)
+        if rank in seen or rank >= n_types:
             continue
-        seen.add(code)
-        defn = SCENE_REGISTRY.get(code)
-        if defn and defn.prompt_guidance:
-            parts.append(f"【{defn.name_cn}】{defn.prompt_guidance}")
+        seen.add(rank)
+        if _SCENE_REFINE_GUIDANCE[rank]:
+            parts.append(_SCENE_REFINE_GUIDANCE[rank])
+        if len(seen) >= n_types:
+            # 所有场景类型都已出现，后续镜头不会再追加指引
+            break
     if not parts:
         return ""
     return "\n\n".join(parts)
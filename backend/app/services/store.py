@@ -1,10 +1,19 @@
 """数据持久化：创作任务 SQLite 存储。"""
+import functools
 import json
+import os
 import sqlite3
-from datetime import datetime, timezone
+import threading
+import time
+from datetime import date, timedelta
 from pathlib import Path
+from secrets import token_hex
 from typing import Any, Optional
-from uuid import uuid4
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # 数据库文件放在 backend/data 下
 BACKEND_ROOT = Path(__file__).resolve().parent.parent.parent
@@ -12,22 +21,197 @@ DATA_DIR = BACKEND_ROOT / "data"
 DB_PATH = DATA_DIR / "creative.db"
 
 
+def _dumps(obj: Any) -> bytes:
+    """
+    任务结果等 JSON 字段的序列化（有 orjson 时用 orjson），解析结果与 json.dumps(obj, ensure_ascii=False) 一致。
+    返回 UTF-8 bytes 直接绑定入库（SQLite 按 BLOB 存储，列声明仍为 TEXT 无需迁移），读出时 _loads 直接解析 bytes，
+    省去 str 与 bytes 之间的整段编解码；历史 TEXT 行照常读取。
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            pass
+    return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+
+def _loads(s: str | bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(s)
+    return json.loads(s)
+
+
 def _ensure_data_dir() -> Path:
     DATA_DIR.mkdir(parents=True, exist_ok=True)
     return DATA_DIR
 
 
-def _get_conn() -> sqlite3.Connection:
+# journal_mode=WAL 写入数据库文件后持久生效，每个进程只需设置一次；其余 PRAGMA 为连接级，每次连接都要设
+_wal_enabled = False
+_wal_lock = threading.Lock()
+
+
+def _apply_pragmas(conn: sqlite3.Connection) -> None:
+    """WAL 下读写互不阻塞、提交只需一次 fsync；busy_timeout 让并发写等待而不是立即报 database is locked。"""
+    global _wal_enabled
+    if not _wal_enabled:
+        with _wal_lock:
+            if not _wal_enabled:
+                conn.execute("PRAGMA journal_mode=WAL")
+                _wal_enabled = True
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=5000")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-20000")
+    conn.execute("PRAGMA foreign_keys=ON")
+
+
+# 连接级预编译语句缓存（按 SQL 文本命中）；热查询的 SQL 统一放在模块常量里，保证各处文本一致
+_STATEMENT_CACHE_SIZE = 256
+
+_INPUT_PREVIEW_CHARS = 80
+
+
+def _input_preview(input_text: str) -> str:
+    """任务输入摘要：超过 _INPUT_PREVIEW_CHARS 个字符截断并加省略号。"""
+    if len(input_text) > _INPUT_PREVIEW_CHARS:
+        return input_text[:_INPUT_PREVIEW_CHARS] + "..."
+    return input_text
+
+
+# 任务列表由 SQLite 直接拼成一个 JSON 数组，Python 端只解析一次，不再逐行建 dict
+# 先只在索引上完成排序与 OFFSET 跳过（覆盖索引，不读表页），再按 rowid 回表取当页行，避免翻页时读入被跳过行的大字段
+_LIST_TASKS_JSON = (
+    "SELECT json_group_array(json_object("
+    "'id', id, 'pipeline', pipeline, 'input', input_preview, 'input_preview', input_preview, "
+    "'title', title, 'created_at', created_at, 'updated_at', updated_at, "
+    "'merged_download_url', merged_download_url)) "
+    "FROM (SELECT t.id, t.pipeline, t.input_preview, t.title, t.created_at, t.updated_at, t.merged_download_url "
+    "FROM (SELECT rowid AS rid, created_at FROM tasks {where}ORDER BY created_at DESC LIMIT ? OFFSET ?) AS p "
+    "JOIN tasks AS t ON t.rowid = p.rid ORDER BY p.created_at DESC, p.rid)"
+)
+_SQL_LIST_TASKS = _LIST_TASKS_JSON.format(where="")
+_SQL_LIST_TASKS_BY_PIPELINE = _LIST_TASKS_JSON.format(where="WHERE pipeline = ? ")
+_SQL_GET_TASK = (
+    "SELECT id, pipeline, input, title, content_result, video_result, merged_download_url, "
+    "character_references, created_at, updated_at FROM tasks WHERE id = ?"
+)
+# update_task 可选字段（顺序即位掩码位序），按掩码预生成全部 UPDATE 语句，SQL 文本稳定以命中语句缓存
+_UPDATE_TASK_FIELDS = ("title", "content_result", "video_result", "merged_download_url", "character_references")
+_UPDATE_TASK_SQL = tuple(
+    "UPDATE tasks SET "
+    + ", ".join(["updated_at = ?"] + [f"{f} = ?" for i, f in enumerate(_UPDATE_TASK_FIELDS) if mask >> i & 1])
+    + " WHERE id = ?"
+    for mask in range(1 << len(_UPDATE_TASK_FIELDS))
+)
+_SQL_LIST_TIERS = (
+    "SELECT id, code, name, level, daily_task_quota, max_storyboard_shots, "
+    "can_export_merged_video, price_per_month_credits, description, created_at, updated_at "
+    "FROM membership_tiers ORDER BY level ASC"
+)
+_SQL_GET_EFFECTIVE_TIER = """
+    WITH m AS (
+        SELECT um.tier_code, um.expires_at
+        FROM user_memberships um
+        JOIN membership_tiers t ON t.code = um.tier_code
+        WHERE um.user_id = ? AND um.is_active = 1 AND um.expires_at > ?
+        ORDER BY um.expires_at DESC LIMIT 1
+    )
+    SELECT mt.id, mt.code, mt.name, mt.level, mt.daily_task_quota, mt.max_storyboard_shots,
+           mt.can_export_merged_video, mt.price_per_month_credits, mt.description, m.expires_at
+    FROM membership_tiers mt
+    LEFT JOIN m ON m.tier_code = mt.code
+    WHERE mt.code = COALESCE((SELECT tier_code FROM m), 'free')
+    LIMIT 1
+"""
+_SQL_GET_BALANCE = "SELECT balance FROM user_points WHERE user_id = ?"
+_SQL_HAS_SIGNED_IN = (
+    "SELECT 1 FROM point_transactions WHERE user_id = ? AND type = 'sign_in' AND created_at >= ? AND created_at < ? LIMIT 1"
+)
+_SQL_INSERT_POINT_TX = (
+    "INSERT INTO point_transactions (id, user_id, amount, type, ref_id, description, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)"
+)
+_SQL_DEDUCT_BALANCE = "UPDATE user_points SET balance = balance - ?, updated_at = ? WHERE user_id = ? AND balance >= ?"
+_SQL_LIST_POINT_TX = (
+    "SELECT id, user_id, amount, type, ref_id, description, created_at FROM point_transactions "
+    "WHERE user_id = ? ORDER BY created_at DESC LIMIT ? OFFSET ?"
+)
+_SQL_GET_DAILY_USAGE = "SELECT content_count, video_count FROM daily_usage WHERE user_id = ? AND usage_date = ?"
+_SQL_INCREMENT_DAILY_USAGE = (
+    "INSERT INTO daily_usage (user_id, usage_date, content_count, video_count) VALUES (?, ?, ?, ?) "
+    "ON CONFLICT(user_id, usage_date) DO UPDATE SET "
+    "content_count = content_count + ?, video_count = video_count + ?"
+)
+
+# 每个线程复用一条连接（连同其语句缓存），免去每次调用都 mkdir + connect + 设 PRAGMA；fork 后的子进程或 DB_PATH 变化时重建
+_tls = threading.local()
+
+
+def _connect(check_same_thread: bool = True) -> sqlite3.Connection:
     _ensure_data_dir()
-    conn = sqlite3.connect(str(DB_PATH))
+    # isolation_level=None：单条写语句自动提交；多语句写入显式 BEGIN IMMEDIATE 包成一个事务
+    conn = sqlite3.connect(
+        str(DB_PATH),
+        isolation_level=None,
+        check_same_thread=check_same_thread,
+        cached_statements=_STATEMENT_CACHE_SIZE,
+    )
     conn.row_factory = sqlite3.Row
+    _apply_pragmas(conn)
     return conn
 
 
+def _get_conn() -> sqlite3.Connection:
+    """读连接：每线程一条，WAL 下各自读快照，互不加锁。"""
+    key = (os.getpid(), str(DB_PATH))
+    conn = getattr(_tls, "conn", None)
+    if conn is not None and getattr(_tls, "key", None) == key:
+        return conn
+    conn = _connect()
+    _tls.conn = conn
+    _tls.key = key
+    return conn
+
+
+# 进程内所有写入共用一条写连接（check_same_thread=False），由 _write_lock 串行化：
+# 写线程在锁上排队，而不是各自持连接在 busy_timeout 里轮询 SQLite 文件锁
+_writer: Optional[tuple[tuple[int, str], sqlite3.Connection]] = None
+_write_lock = threading.Lock()
+
+
+def _get_write_conn() -> sqlite3.Connection:
+    """获取写连接并持有 _write_lock，必须与 _release_write_conn 成对调用。"""
+    global _writer
+    _write_lock.acquire()
+    try:
+        key = (os.getpid(), str(DB_PATH))
+        if _writer is None or _writer[0] != key:
+            _writer = (key, _connect(check_same_thread=False))
+        return _writer[1]
+    except BaseException:
+        _write_lock.release()
+        raise
+
+
+def _release_conn(conn: sqlite3.Connection) -> None:
+    """调用结束时归还线程连接：显式事务正常路径都已 commit，仍有未结束事务说明中途出错，回滚以免残留到下一次调用。"""
+    if conn.in_transaction:
+        conn.rollback()
+
+
+def _release_write_conn(conn: sqlite3.Connection) -> None:
+    try:
+        _release_conn(conn)
+    finally:
+        _write_lock.release()
+
+
 def init_db() -> None:
-    """创建 tasks 表及会员/积分相关表（若不存在）。"""
-    conn = _get_conn()
+    """创建 tasks 表及会员/积分相关表（若不存在），并载入会员档位缓存。"""
+    global _TIER_CACHE
+    conn = _get_write_conn()
     try:
+        conn.execute("BEGIN IMMEDIATE")
         conn.execute("""
             CREATE TABLE IF NOT EXISTS tasks (
                 id TEXT PRIMARY KEY,
@@ -44,14 +228,22 @@ def init_db() -> None:
         conn.execute(
             "CREATE INDEX IF NOT EXISTS idx_tasks_created_at ON tasks(created_at DESC)"
         )
+        conn.execute("DROP INDEX IF EXISTS idx_tasks_pipeline")
         conn.execute(
-            "CREATE INDEX IF NOT EXISTS idx_tasks_pipeline ON tasks(pipeline)"
+            "CREATE INDEX IF NOT EXISTS idx_tasks_pipeline_created ON tasks(pipeline, created_at DESC)"
         )
         # 短剧角色参考图与配音快照（JSON），刷新页面后可恢复
-        try:
+        task_cols = {r[1] for r in conn.execute("PRAGMA table_info(tasks)").fetchall()}
+        if "character_references" not in task_cols:
             conn.execute("ALTER TABLE tasks ADD COLUMN character_references TEXT")
-        except sqlite3.OperationalError:
-            pass  # 列已存在
+        # 列表页用的输入摘要，写入时算好，列表查询不再读整段 input
+        if "input_preview" not in task_cols:
+            conn.execute("ALTER TABLE tasks ADD COLUMN input_preview TEXT")
+            conn.execute(
+                "UPDATE tasks SET input_preview = "
+                f"CASE WHEN length(input) > {_INPUT_PREVIEW_CHARS} "
+                f"THEN substr(input, 1, {_INPUT_PREVIEW_CHARS}) || '...' ELSE input END"
+            )
         # ---------- 会员体系 ----------
         conn.execute("""
             CREATE TABLE IF NOT EXISTS membership_tiers (
@@ -116,6 +308,9 @@ def init_db() -> None:
         conn.execute(
             "CREATE INDEX IF NOT EXISTS idx_point_tx_user_created ON point_transactions(user_id, created_at DESC)"
         )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_point_tx_signin ON point_transactions(user_id, type, created_at)"
+        )
         conn.execute("""
             CREATE TABLE IF NOT EXISTS daily_usage (
                 user_id TEXT NOT NULL,
@@ -126,14 +321,33 @@ def init_db() -> None:
                 FOREIGN KEY (user_id) REFERENCES users(id)
             )
         """)
-        conn.commit()
         _seed_membership_tiers(conn)
+        conn.commit()
+        _TIER_CACHE = _load_tiers(conn)
     finally:
-        conn.close()
+        _release_write_conn(conn)
+
+
+# _now_iso 同一秒内复用已格式化的秒级前缀，仅拼接微秒
+_now_iso_sec: tuple[int, str] = (-1, "")
 
 
 def _now_iso() -> str:
-    return datetime.now(timezone.utc).isoformat()
+    """UTC 当前时间 ISO 字符串，格式与 datetime.now(timezone.utc).isoformat() 一致。"""
+    global _now_iso_sec
+    sec, us = divmod(time.time_ns() // 1000, 1_000_000)
+    cached = _now_iso_sec
+    if cached[0] != sec:
+        cached = _now_iso_sec = (sec, time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(sec)))
+    if us:
+        return f"{cached[1]}.{us:06d}+00:00"
+    return cached[1] + "+00:00"
+
+
+@functools.lru_cache(maxsize=4)
+def _next_day(day: str) -> str:
+    """'YYYY-MM-DD' 的下一天；同一天内的调用直接命中缓存。"""
+    return (date.fromisoformat(day) + timedelta(days=1)).isoformat()
 
 
 def create_task(
@@ -146,24 +360,26 @@ def create_task(
     character_references: Optional[dict[str, Any]] = None,
 ) -> str:
     """保存一条创作任务，返回 task_id。character_references 为短剧角色快照（含参考图 base64、配音音色），刷新后可恢复。"""
-    task_id = uuid4().hex
+    task_id = token_hex(16)
     now = _now_iso()
-    content_json = json.dumps(content_result, ensure_ascii=False)
-    video_json = json.dumps(video_result, ensure_ascii=False) if video_result else None
-    char_ref_json = json.dumps(character_references, ensure_ascii=False) if character_references else None
-    conn = _get_conn()
+    content_json = _dumps(content_result)
+    video_json = _dumps(video_result) if video_result else None
+    char_ref_json = _dumps(character_references) if character_references else None
+    conn = _get_write_conn()
     try:
         conn.execute(
             """
-            INSERT INTO tasks (id, pipeline, input, title, content_result, video_result, merged_download_url, character_references, created_at, updated_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            INSERT INTO tasks (id, pipeline, input, input_preview, title, content_result, video_result, merged_download_url, character_references, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             """,
-            (task_id, pipeline, input_text, title, content_json, video_json, merged_download_url, char_ref_json, now, now),
+            (
+                task_id, pipeline, input_text, _input_preview(input_text), title, content_json, video_json,
+                merged_download_url, char_ref_json, now, now,
+            ),
         )
-        conn.commit()
         return task_id
     finally:
-        conn.close()
+        _release_write_conn(conn)
 
 
 def list_tasks(
@@ -171,104 +387,67 @@ def list_tasks(
     limit: int = 50,
     offset: int = 0,
 ) -> list[dict[str, Any]]:
-    """分页列出任务摘要（不含 content_result / video_result 大字段）。"""
+    """分页列出任务摘要（不含 content_result / video_result 大字段；input 与 input_preview 均为截断后的输入摘要）。"""
     conn = _get_conn()
     try:
         if pipeline:
-            cursor = conn.execute(
-                """
-                SELECT id, pipeline, input, title, created_at, updated_at,
-                       merged_download_url
-                FROM tasks
-                WHERE pipeline = ?
-                ORDER BY created_at DESC
-                LIMIT ? OFFSET ?
-                """,
-                (pipeline, limit, offset),
-            )
+            row = conn.execute(_SQL_LIST_TASKS_BY_PIPELINE, (pipeline, limit, offset)).fetchone()
         else:
-            cursor = conn.execute(
-                """
-                SELECT id, pipeline, input, title, created_at, updated_at,
-                       merged_download_url
-                FROM tasks
-                ORDER BY created_at DESC
-                LIMIT ? OFFSET ?
-                """,
-                (limit, offset),
-            )
-        rows = cursor.fetchall()
-        return [
-            {
-                "id": r["id"],
-                "pipeline": r["pipeline"],
-                "input": r["input"],
-                "input_preview": (r["input"] or "")[:80] + ("..." if len(r["input"] or "") > 80 else ""),
-                "title": r["title"],
-                "created_at": r["created_at"],
-                "updated_at": r["updated_at"],
-                "merged_download_url": r["merged_download_url"],
-            }
-            for r in rows
-        ]
+            row = conn.execute(_SQL_LIST_TASKS, (limit, offset)).fetchone()
+        return _loads(row[0]) if row and row[0] else []
     finally:
-        conn.close()
+        _release_conn(conn)
 
 
 def get_task(task_id: str) -> Optional[dict[str, Any]]:
     """按 id 获取完整任务（含 content_result、video_result）。"""
     conn = _get_conn()
     try:
-        row = conn.execute(
-            "SELECT * FROM tasks WHERE id = ?", (task_id,)
-        ).fetchone()
+        row = conn.execute(_SQL_GET_TASK, (task_id,)).fetchone()
         if not row:
             return None
-        content_result = json.loads(row["content_result"]) if row["content_result"] else {}
-        video_result = json.loads(row["video_result"]) if row["video_result"] else None
-        char_ref = None
-        if "character_references" in row.keys() and row["character_references"]:
-            char_ref = json.loads(row["character_references"])
+        (
+            id_, pipeline, input_text, title, content_json, video_json,
+            merged_download_url, char_ref_json, created_at, updated_at,
+        ) = row
         return {
-            "id": row["id"],
-            "pipeline": row["pipeline"],
-            "input": row["input"],
-            "title": row["title"],
-            "content_result": content_result,
-            "video_result": video_result,
-            "merged_download_url": row["merged_download_url"],
-            "character_references": char_ref,
-            "created_at": row["created_at"],
-            "updated_at": row["updated_at"],
+            "id": id_,
+            "pipeline": pipeline,
+            "input": input_text,
+            "title": title,
+            "content_result": _loads(content_json) if content_json else {},
+            "video_result": _loads(video_json) if video_json else None,
+            "merged_download_url": merged_download_url,
+            "character_references": _loads(char_ref_json) if char_ref_json else None,
+            "created_at": created_at,
+            "updated_at": updated_at,
         }
     finally:
-        conn.close()
+        _release_conn(conn)
 
 
 def delete_task(task_id: str) -> bool:
     """删除一条任务，存在则返回 True。"""
-    conn = _get_conn()
+    conn = _get_write_conn()
     try:
         cur = conn.execute("DELETE FROM tasks WHERE id = ?", (task_id,))
-        conn.commit()
         return cur.rowcount > 0
     finally:
-        conn.close()
+        _release_write_conn(conn)
 
 
 def update_task_title(task_id: str, title: str) -> bool:
     """更新任务标题。"""
-    conn = _get_conn()
+    conn = _get_write_conn()
     try:
         now = _now_iso()
         cur = conn.execute(
             "UPDATE tasks SET title = ?, updated_at = ? WHERE id = ?",
             (title, now, task_id),
         )
-        conn.commit()
         return cur.rowcount > 0
     finally:
-        conn.close()
+        _release_write_conn(conn)
 
 
 def update_task(
@@ -281,39 +460,34 @@ def update_task(
     character_references: Optional[dict[str, Any]] = None,
 ) -> bool:
     """更新任务（仅更新传入的非 None 字段）。"""
-    conn = _get_conn()
+    conn = _get_write_conn()
     try:
         now = _now_iso()
-        updates: list[str] = ["updated_at = ?"]
+        values = (
+            title,
+            None if content_result is None else _dumps(content_result),
+            None if video_result is None else _dumps(video_result),
+            merged_download_url,
+            None if character_references is None else _dumps(character_references),
+        )
+        mask = 0
         params: list[Any] = [now]
-        if title is not None:
-            updates.append("title = ?")
-            params.append(title)
-        if content_result is not None:
-            updates.append("content_result = ?")
-            params.append(json.dumps(content_result, ensure_ascii=False))
-        if video_result is not None:
-            updates.append("video_result = ?")
-            params.append(json.dumps(video_result, ensure_ascii=False))
-        if merged_download_url is not None:
-            updates.append("merged_download_url = ?")
-            params.append(merged_download_url)
-        if character_references is not None:
-            updates.append("character_references = ?")
-            params.append(json.dumps(character_references, ensure_ascii=False))
+        for i, v in enumerate(values):
+            if v is not None:
+                mask |= 1 << i
+                params.append(v)
         params.append(task_id)
-        cur = conn.execute(
-            f"UPDATE tasks SET {', '.join(updates)} WHERE id = ?",
-            params,
-        )
-        conn.commit()
+        cur = conn.execute(_UPDATE_TASK_SQL[mask], params)
         return cur.rowcount > 0
     finally:
-        conn.close()
+        _release_write_conn(conn)
 
 
 # ---------- 会员体系 ----------
 
+# 档位表只在初始化或后台改价时变化：init_db 时整表载入内存，读档位不再访问 SQLite；改动档位后调用 _invalidate_tiers
+_TIER_CACHE: Optional[dict[str, dict[str, Any]]] = None
+
 DEFAULT_TIERS = [
     ("free", "免费", 0, 3, 5, 0, 0, "体验基础能力"),
     ("basic", "基础", 1, 10, 10, 1, 100, "日常轻度创作"),
@@ -328,27 +502,26 @@ def _seed_membership_tiers(conn: sqlite3.Connection) -> None:
     if row[0] > 0:
         return
     now = _now_iso()
-    for code, name, level, daily_quota, max_shots, can_export, price, desc in DEFAULT_TIERS:
-        conn.execute(
-            """
-            INSERT INTO membership_tiers (id, code, name, level, daily_task_quota, max_storyboard_shots,
-                can_export_merged_video, price_per_month_credits, description, created_at, updated_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            (uuid4().hex, code, name, level, daily_quota, max_shots, can_export, price, desc, now, now),
-        )
-    conn.commit()
+    conn.executemany(
+        """
+        INSERT INTO membership_tiers (id, code, name, level, daily_task_quota, max_storyboard_shots,
+            can_export_merged_video, price_per_month_credits, description, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        [(token_hex(16), *tier, now, now) for tier in DEFAULT_TIERS],
+    )
 
 
 def get_or_create_user_by_device(device_id: str) -> str:
     """按 device_id 获取或创建用户，返回 user_id。"""
-    conn = _get_conn()
+    conn = _get_write_conn()
     try:
         row = conn.execute("SELECT id FROM users WHERE device_id = ?", (device_id,)).fetchone()
         if row:
             return row["id"]
-        user_id = uuid4().hex
+        user_id = token_hex(16)
         now = _now_iso()
+        conn.execute("BEGIN IMMEDIATE")
         conn.execute(
             "INSERT INTO users (id, device_id, created_at, updated_at) VALUES (?, ?, ?, ?)",
             (user_id, device_id, now, now),
@@ -360,63 +533,74 @@ def get_or_create_user_by_device(device_id: str) -> str:
         conn.commit()
         return user_id
     finally:
-        conn.close()
+        _release_write_conn(conn)
+
+
+def _load_tiers(conn: sqlite3.Connection) -> dict[str, dict[str, Any]]:
+    rows = conn.execute(_SQL_LIST_TIERS).fetchall()
+    return {
+        r["code"]: {
+            "id": r["id"],
+            "code": r["code"],
+            "name": r["name"],
+            "level": r["level"],
+            "daily_task_quota": r["daily_task_quota"],
+            "max_storyboard_shots": r["max_storyboard_shots"],
+            "can_export_merged_video": bool(r["can_export_merged_video"]),
+            "price_per_month_credits": r["price_per_month_credits"],
+            "description": r["description"],
+            "created_at": r["created_at"],
+            "updated_at": r["updated_at"],
+        }
+        for r in rows
+    }
+
+
+def _tiers() -> dict[str, dict[str, Any]]:
+    global _TIER_CACHE
+    cache = _TIER_CACHE
+    if cache is None:
+        conn = _get_conn()
+        try:
+            cache = _TIER_CACHE = _load_tiers(conn)
+        finally:
+            _release_conn(conn)
+    return cache
+
+
+def _invalidate_tiers() -> None:
+    """档位表有改动（如后台改价）后调用，下次读取时重新载入。"""
+    global _TIER_CACHE
+    _TIER_CACHE = None
 
 
 def list_membership_tiers() -> list[dict[str, Any]]:
     """返回所有会员档位配置。"""
-    conn = _get_conn()
-    try:
-        rows = conn.execute(
-            "SELECT id, code, name, level, daily_task_quota, max_storyboard_shots, "
-            "can_export_merged_video, price_per_month_credits, description, created_at, updated_at "
-            "FROM membership_tiers ORDER BY level ASC"
-        ).fetchall()
-        return [
-            {
-                "id": r["id"],
-                "code": r["code"],
-                "name": r["name"],
-                "level": r["level"],
-                "daily_task_quota": r["daily_task_quota"],
-                "max_storyboard_shots": r["max_storyboard_shots"],
-                "can_export_merged_video": bool(r["can_export_merged_video"]),
-                "price_per_month_credits": r["price_per_month_credits"],
-                "description": r["description"],
-                "created_at": r["created_at"],
-                "updated_at": r["updated_at"],
-            }
-            for r in rows
-        ]
-    finally:
-        conn.close()
+    return [dict(t) for t in _tiers().values()]
+
+
+def _tier_from_row(row: sqlite3.Row) -> dict[str, Any]:
+    return {
+        "id": row["id"],
+        "code": row["code"],
+        "name": row["name"],
+        "level": row["level"],
+        "daily_task_quota": row["daily_task_quota"],
+        "max_storyboard_shots": row["max_storyboard_shots"],
+        "can_export_merged_video": bool(row["can_export_merged_video"]),
+        "price_per_month_credits": row["price_per_month_credits"],
+        "description": row["description"],
+    }
 
 
 def get_tier_by_code(tier_code: str) -> Optional[dict[str, Any]]:
     """按 code 获取档位配置。"""
-    conn = _get_conn()
-    try:
-        row = conn.execute(
-            "SELECT id, code, name, level, daily_task_quota, max_storyboard_shots, "
-            "can_export_merged_video, price_per_month_credits, description "
-            "FROM membership_tiers WHERE code = ?",
-            (tier_code,),
-        ).fetchone()
-        if not row:
-            return None
-        return {
-            "id": row["id"],
-            "code": row["code"],
-            "name": row["name"],
-            "level": row["level"],
-            "daily_task_quota": row["daily_task_quota"],
-            "max_storyboard_shots": row["max_storyboard_shots"],
-            "can_export_merged_video": bool(row["can_export_merged_video"]),
-            "price_per_month_credits": row["price_per_month_credits"],
-            "description": row["description"],
-        }
-    finally:
-        conn.close()
+    tier = _tiers().get(tier_code)
+    if tier is None:
+        return None
+    tier = dict(tier)
+    del tier["created_at"], tier["updated_at"]
+    return tier
 
 
 def get_user_effective_membership(user_id: str) -> Optional[dict[str, Any]]:
@@ -450,19 +634,20 @@ def get_user_effective_membership(user_id: str) -> Optional[dict[str, Any]]:
             "can_export_merged_video": bool(row["can_export_merged_video"]),
         }
     finally:
-        conn.close()
+        _release_conn(conn)
 
 
 def get_user_effective_tier(user_id: str) -> dict[str, Any]:
     """获取用户当前生效档位（含 free 默认）。返回与 get_tier_by_code 结构一致 + expires_at。"""
-    membership = get_user_effective_membership(user_id)
-    if membership:
-        tier = get_tier_by_code(membership["tier_code"])
-        if tier:
-            tier["expires_at"] = membership["expires_at"]
-            return tier
-    tier = get_tier_by_code("free")
-    if not tier:
+    conn = _get_conn()
+    try:
+        row = conn.execute(_SQL_GET_EFFECTIVE_TIER, (user_id, _now_iso())).fetchone()
+    finally:
+        _release_conn(conn)
+    if row:
+        tier = _tier_from_row(row)
+        tier["expires_at"] = row["expires_at"]
+    else:
         tier = {
             "code": "free",
             "name": "免费",
@@ -474,8 +659,6 @@ def get_user_effective_tier(user_id: str) -> dict[str, Any]:
             "description": "体验基础能力",
             "expires_at": None,
         }
-    else:
-        tier["expires_at"] = None
     return tier
 
 
@@ -488,17 +671,18 @@ def create_user_membership(
     tier = get_tier_by_code(tier_code)
     if not tier:
         return None
-    conn = _get_conn()
+    conn = _get_write_conn()
     try:
         now = _now_iso()
         from datetime import datetime, timedelta, timezone
         dt = datetime.fromisoformat(now.replace("Z", "+00:00"))
         expires = (dt + timedelta(days=months * 31)).isoformat().replace("+00:00", "Z")
+        conn.execute("BEGIN IMMEDIATE")
         conn.execute(
             "UPDATE user_memberships SET is_active = 0, updated_at = ? WHERE user_id = ?",
             (now, user_id),
         )
-        membership_id = uuid4().hex
+        membership_id = token_hex(16)
         conn.execute(
             """
             INSERT INTO user_memberships (id, user_id, tier_code, started_at, expires_at, is_active, created_at, updated_at)
@@ -509,7 +693,7 @@ def create_user_membership(
         conn.commit()
         return membership_id
     finally:
-        conn.close()
+        _release_write_conn(conn)
 
 
 # ---------- 积分体系 ----------
@@ -519,10 +703,10 @@ def get_user_balance(user_id: str) -> int:
     """获取用户积分余额。"""
     conn = _get_conn()
     try:
-        row = conn.execute("SELECT balance FROM user_points WHERE user_id = ?", (user_id,)).fetchone()
+        row = conn.execute(_SQL_GET_BALANCE, (user_id,)).fetchone()
         return int(row["balance"]) if row else 0
     finally:
-        conn.close()
+        _release_conn(conn)
 
 
 def add_point_transaction(
@@ -533,14 +717,12 @@ def add_point_transaction(
     description: Optional[str] = None,
 ) -> bool:
     """增加一条积分流水并更新余额。amount 可正可负。"""
-    conn = _get_conn()
+    conn = _get_write_conn()
     try:
         now = _now_iso()
-        tx_id = uuid4().hex
-        conn.execute(
-            "INSERT INTO point_transactions (id, user_id, amount, type, ref_id, description, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
-            (tx_id, user_id, amount, tx_type, ref_id, description, now),
-        )
+        tx_id = token_hex(16)
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(_SQL_INSERT_POINT_TX, (tx_id, user_id, amount, tx_type, ref_id, description, now))
         conn.execute(
             "UPDATE user_points SET balance = balance + ?, updated_at = ? WHERE user_id = ?",
             (amount, now, user_id),
@@ -551,41 +733,48 @@ def add_point_transaction(
         conn.rollback()
         return False
     finally:
-        conn.close()
+        _release_write_conn(conn)
 
 
 def deduct_points(user_id: str, amount: int, tx_type: str, ref_id: Optional[str] = None, description: Optional[str] = None) -> bool:
-    """扣减积分（amount 为正数），余额不足返回 False。"""
+    """扣减积分（amount 为正数），余额不足返回 False。余额判断与扣减在同一条条件 UPDATE 中完成，无并发超扣。"""
     if amount <= 0:
         return False
-    balance = get_user_balance(user_id)
-    if balance < amount:
+    conn = _get_write_conn()
+    try:
+        now = _now_iso()
+        conn.execute("BEGIN IMMEDIATE")
+        cur = conn.execute(_SQL_DEDUCT_BALANCE, (amount, now, user_id, amount))
+        if cur.rowcount == 0:
+            conn.rollback()
+            return False
+        conn.execute(_SQL_INSERT_POINT_TX, (token_hex(16), user_id, -amount, tx_type, ref_id, description, now))
+        conn.commit()
+        return True
+    except Exception:
+        conn.rollback()
         return False
-    return add_point_transaction(user_id, -amount, tx_type, ref_id, description)
+    finally:
+        _release_write_conn(conn)
 
 
 def has_signed_in_today(user_id: str) -> bool:
     """今日是否已签到。"""
     conn = _get_conn()
     try:
+        # created_at 为 ISO 字符串，直接绑定 [今日, 明日) 两个日期串做区间比较，SQL 中无 date() 调用，可走 idx_point_tx_signin
         today = _now_iso()[:10]
-        row = conn.execute(
-            "SELECT 1 FROM point_transactions WHERE user_id = ? AND type = 'sign_in' AND date(created_at) = date(?) LIMIT 1",
-            (user_id, today),
-        ).fetchone()
+        row = conn.execute(_SQL_HAS_SIGNED_IN, (user_id, today, _next_day(today))).fetchone()
         return row is not None
     finally:
-        conn.close()
+        _release_conn(conn)
 
 
 def list_point_transactions(user_id: str, limit: int = 50, offset: int = 0) -> list[dict[str, Any]]:
     """分页查询用户积分流水。"""
     conn = _get_conn()
     try:
-        rows = conn.execute(
-            "SELECT id, user_id, amount, type, ref_id, description, created_at FROM point_transactions WHERE user_id = ? ORDER BY created_at DESC LIMIT ? OFFSET ?",
-            (user_id, limit, offset),
-        ).fetchall()
+        rows = conn.execute(_SQL_LIST_POINT_TX, (user_id, limit, offset)).fetchall()
         return [
             {
                 "id": r["id"],
@@ -599,7 +788,7 @@ def list_point_transactions(user_id: str, limit: int = 50, offset: int = 0) -> l
             for r in rows
         ]
     finally:
-        conn.close()
+        _release_conn(conn)
 
 
 # ---------- 每日配额 ----------
@@ -610,46 +799,23 @@ def get_daily_usage(user_id: str) -> tuple[int, int]:
     conn = _get_conn()
     try:
         today = _now_iso()[:10]
-        row = conn.execute(
-            "SELECT content_count, video_count FROM daily_usage WHERE user_id = ? AND usage_date = ?",
-            (user_id, today),
-        ).fetchone()
+        row = conn.execute(_SQL_GET_DAILY_USAGE, (user_id, today)).fetchone()
         if not row:
             return 0, 0
         return int(row["content_count"]), int(row["video_count"])
     finally:
-        conn.close()
+        _release_conn(conn)
 
 
 def increment_daily_usage(user_id: str, is_video: bool = False) -> None:
-    """增加当日使用次数。is_video=True 为视频生成，否则为内容生成。"""
-    conn = _get_conn()
+    """增加当日使用次数。is_video=True 为视频生成，否则为内容生成。单条 UPSERT，无先查后写的竞态。"""
+    conn = _get_write_conn()
     try:
-        now = _now_iso()
-        today = now[:10]
-        row = conn.execute(
-            "SELECT content_count, video_count FROM daily_usage WHERE user_id = ? AND usage_date = ?",
-            (user_id, today),
-        ).fetchone()
-        if row:
-            if is_video:
-                conn.execute(
-                    "UPDATE daily_usage SET video_count = video_count + 1 WHERE user_id = ? AND usage_date = ?",
-                    (user_id, today),
-                )
-            else:
-                conn.execute(
-                    "UPDATE daily_usage SET content_count = content_count + 1 WHERE user_id = ? AND usage_date = ?",
-                    (user_id, today),
-                )
-        else:
-            conn.execute(
-                "INSERT INTO daily_usage (user_id, usage_date, content_count, video_count) VALUES (?, ?, ?, ?)",
-                (user_id, today, 0 if is_video else 1, 1 if is_video else 0),
-            )
-        conn.commit()
+        today = _now_iso()[:10]
+        content_inc, video_inc = (0, 1) if is_video else (1, 0)
+        conn.execute(_SQL_INCREMENT_DAILY_USAGE, (user_id, today, content_inc, video_inc, content_inc, video_inc))
     finally:
-        conn.close()
+        _release_write_conn(conn)
 
 
 def check_can_use_quota(user_id: str) -> tuple[bool, int, int]:
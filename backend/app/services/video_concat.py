@@ -1,10 +1,15 @@
 """将多段视频下载到本地备份后使用 ffmpeg 拼接成片，保存到 static/merged；支持 BGM + 配音混音。"""
+import atexit
+import functools
 import logging
 import os
 import shutil
 import subprocess
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Optional
 from uuid import uuid4
 
 import httpx
@@ -26,11 +31,43 @@ def _ensure_merged_dir() -> Path:
 # 单段下载超时（秒），外网/可灵等可能较慢，拉长并配合重试，避免 WinError 10060 导致素材不全
 DOWNLOAD_SEGMENT_TIMEOUT = float(os.getenv("DOWNLOAD_SEGMENT_TIMEOUT", "240"))
 DOWNLOAD_SEGMENT_RETRIES = max(0, int(os.getenv("DOWNLOAD_SEGMENT_RETRIES", "4")))
+# 多段视频并发下载数（共享一个 httpx.Client 的 keep-alive 连接池）
+DOWNLOAD_CONCURRENCY = max(1, int(os.getenv("DOWNLOAD_CONCURRENCY", "4") or 4))
 
 # 可灵等防盗链：下载视频时需带 Referer，否则 CDN 可能返回 403。可通过 DOWNLOAD_REFERER 覆盖
 DEFAULT_DOWNLOAD_REFERER = (os.getenv("DOWNLOAD_REFERER") or "").strip() or "https://api-beijing.klingai.com"
 
 
+_client: Optional[httpx.Client] = None
+_client_pid: Optional[int] = None
+_client_lock = threading.Lock()
+
+
+def _get_client() -> httpx.Client:
+    """返回共享 httpx.Client（懒创建；fork 后的子进程会重建）。各段下载复用 keep-alive 连接，免去每段重新 TCP+TLS 握手。"""
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+    with _client_lock:
+        if _client is None or _client_pid != pid:
+            _client = httpx.Client(
+                timeout=DOWNLOAD_SEGMENT_TIMEOUT,
+                follow_redirects=True,
+                limits=httpx.Limits(max_keepalive_connections=8, max_connections=8, keepalive_expiry=60.0),
+            )
+            _client_pid = pid
+    return _client
+
+
+def _close_client() -> None:
+    if _client is not None and _client_pid == os.getpid():
+        _client.close()
+
+
+atexit.register(_close_client)
+
+
 def _download_headers(url: str) -> dict:
     """下载用请求头，满足可灵防盗链（Referer）；非可灵 URL 也可通过 DOWNLOAD_REFERER 指定。"""
     referer = DEFAULT_DOWNLOAD_REFERER
@@ -45,10 +82,63 @@ def _download_headers(url: str) -> dict:
     return h
 
 
+_STREAM_CHUNK_BYTES = 256 * 1024
+_FILE_BUFFER_BYTES = 1024 * 1024
+
+
+def _stream_to_file(url: str, path: Path, headers: dict | None = None, timeout: float | None = None) -> int:
+    """流式下载 url 写入 path（分块写盘，内存占用与文件大小无关），返回写入字节数；失败时删除半截文件并抛出异常。"""
+    kwargs = {"headers": headers or None}
+    if timeout is not None:
+        kwargs["timeout"] = timeout
+    try:
+        with _get_client().stream("GET", url, **kwargs) as r:
+            if r.is_error:
+                r.read()  # 错误响应体很小，读出来便于日志记录
+            r.raise_for_status()
+            size = 0
+            with open(path, "wb", buffering=_FILE_BUFFER_BYTES) as f:
+                for chunk in r.iter_bytes(chunk_size=_STREAM_CHUNK_BYTES):
+                    f.write(chunk)
+                    size += len(chunk)
+        return size
+    except BaseException:
+        path.unlink(missing_ok=True)
+        raise
+
+
+def _download_segment(i: int, url: str, backup_dir: Path) -> Path | None:
+    """下载第 i 段到 backup_dir/seg_{i:03d}.mp4，失败按 DOWNLOAD_SEGMENT_RETRIES 退避重试；最终失败返回 None。"""
+    path = backup_dir / f"seg_{i:03d}.mp4"
+    last_err = None
+    headers = _download_headers(url)
+    for attempt in range(1 + DOWNLOAD_SEGMENT_RETRIES):
+        try:
+            _stream_to_file(url, path, headers)
+            return path
+        except Exception as e:
+            last_err = e
+            # 便于排查：记录 HTTP 状态码与片段索引
+            status = getattr(getattr(e, "response", None), "status_code", None)
+            body = ""
+            if hasattr(e, "response") and getattr(e.response, "text", None):
+                body = (e.response.text or "")[:200]
+            if attempt <= 1:
+                logger.warning(
+                    "download_segments_to_backup: segment %s attempt %s failed status=%s err=%s body=%s",
+                    i, attempt + 1, status, e, body,
+                )
+            if attempt < DOWNLOAD_SEGMENT_RETRIES:
+                time.sleep(2.0 * (attempt + 1))
+    logger.warning("download_segments_to_backup: segment %s 最终失败 err=%s", i, last_err)
+    return None
+
+
 def download_segments_to_backup(download_urls: list[str], job_id: str) -> list[Path]:
     """
     将多段视频 URL 下载到本地备份目录 static/merged/segments/{job_id}/seg_000.mp4 ...
     返回成功下载的本地路径列表（按顺序）；单段失败会重试若干次。
+    各段按 DOWNLOAD_CONCURRENCY 并发下载，共享同一连接池。
     可灵返回的 URL 为防盗链格式，请求时会带上 Referer，避免 403。
     若仍有片段失败，返回的列表长度会小于 download_urls 长度，调用方必须检查并拒绝使用部分结果。
     """
@@ -56,41 +146,20 @@ def download_segments_to_backup(download_urls: list[str], job_id: str) -> list[P
         return []
     backup_dir = SEGMENTS_BACKUP_DIR / job_id
     backup_dir.mkdir(parents=True, exist_ok=True)
-    local_paths: list[Path] = []
+    jobs: list[tuple[int, str]] = []
     for i, url in enumerate(download_urls):
         if not url or not str(url).strip():
             logger.warning("download_segments_to_backup: segment %s 无有效 URL，跳过", i)
             continue
-        url = url.strip()
-        path = backup_dir / f"seg_{i:03d}.mp4"
-        last_err = None
-        headers = _download_headers(url)
-        for attempt in range(1 + DOWNLOAD_SEGMENT_RETRIES):
-            try:
-                with httpx.Client(timeout=DOWNLOAD_SEGMENT_TIMEOUT, follow_redirects=True) as client:
-                    r = client.get(url, headers=headers or None)
-                    r.raise_for_status()
-                    path.write_bytes(r.content)
-                local_paths.append(path)
-                last_err = None
-                break
-            except Exception as e:
-                last_err = e
-                # 便于排查：记录 HTTP 状态码与片段索引
-                status = getattr(getattr(e, "response", None), "status_code", None)
-                body = ""
-                if hasattr(e, "response") and getattr(e.response, "text", None):
-                    body = (e.response.text or "")[:200]
-                if attempt <= 1:
-                    logger.warning(
-                        "download_segments_to_backup: segment %s attempt %s failed status=%s err=%s body=%s",
-                        i, attempt + 1, status, e, body,
-                    )
-                if attempt < DOWNLOAD_SEGMENT_RETRIES:
-                    time.sleep(2.0 * (attempt + 1))
-        if last_err is not None:
-            logger.warning("download_segments_to_backup: segment %s 最终失败 err=%s", i, last_err)
-    return local_paths
+        jobs.append((i, url.strip()))
+    if not jobs:
+        return []
+    if len(jobs) == 1:
+        results = [_download_segment(jobs[0][0], jobs[0][1], backup_dir)]
+    else:
+        with ThreadPoolExecutor(max_workers=min(DOWNLOAD_CONCURRENCY, len(jobs))) as ex:
+            results = list(ex.map(lambda job: _download_segment(job[0], job[1], backup_dir), jobs))
+    return [p for p in results if p is not None]
 
 
 def mix_audio_into_merged(
@@ -218,17 +287,12 @@ def single_segment_to_merged(download_url: str) -> str | None:
     if not download_url or not download_url.strip():
         return None
     try:
-        with httpx.Client(timeout=90.0, follow_redirects=True) as client:
-            r = client.get(download_url.strip())
-            r.raise_for_status()
-            content = r.content
-        if not content:
-            return None
         job_id = uuid4().hex
         backup_dir = SEGMENTS_BACKUP_DIR / job_id
         backup_dir.mkdir(parents=True, exist_ok=True)
         backup_path = backup_dir / "seg_000.mp4"
-        backup_path.write_bytes(content)
+        if not _stream_to_file(download_url.strip(), backup_path, timeout=90.0):
+            return None
         out_name = f"{uuid4().hex}.mp4"
         out_path = _ensure_merged_dir() / out_name
         shutil.copy2(backup_path, out_path)
@@ -249,17 +313,12 @@ def single_segment_to_merged_with_duration(
     if not download_url or not download_url.strip():
         return (None, [])
     try:
-        with httpx.Client(timeout=90.0, follow_redirects=True) as client:
-            r = client.get(download_url.strip())
-            r.raise_for_status()
-            content = r.content
-        if not content:
-            return (None, [])
         job_id = uuid4().hex
         backup_dir = SEGMENTS_BACKUP_DIR / job_id
         backup_dir.mkdir(parents=True, exist_ok=True)
         backup_path = backup_dir / "seg_000.mp4"
-        backup_path.write_bytes(content)
+        if not _stream_to_file(download_url.strip(), backup_path, timeout=90.0):
+            return (None, [])
         duration = _ffprobe_duration_sec(str(backup_path)) or 5.0
         # 可选：按目标时长裁切/补齐（用于短剧按镜配音对齐）
         if target_duration_sec is not None:
@@ -353,23 +412,73 @@ def concat_local_segments(
         return None
 
 
+@functools.lru_cache(maxsize=4096)
+def _ffprobe_duration_cached(path: str, mtime_ns: int, size: int) -> float:
+    """按 (路径, mtime, 大小) 缓存 ffprobe 结果，同一文件只起一次子进程；探测失败抛异常，不进缓存。"""
+    r = subprocess.run(
+        ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "default=nokey=1:noprint_wrappers=1", path],
+        capture_output=True,
+        text=True,
+        timeout=20,
+    )
+    if r.returncode != 0:
+        raise RuntimeError(f"ffprobe exit {r.returncode}")
+    return float((r.stdout or "").strip())
+
+
 def _ffprobe_duration_sec(path: str) -> float | None:
-    """返回视频时长（秒）；失败返回 None。"""
+    """返回视频时长（秒）；失败返回 None。文件未变时直接复用上次探测结果。"""
     try:
-        r = subprocess.run(
-            ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "default=nokey=1:noprint_wrappers=1", path],
-            capture_output=True,
-            text=True,
-            timeout=20,
-        )
-        if r.returncode != 0:
-            return None
-        s = (r.stdout or "").strip()
-        return float(s) if s else None
+        st = os.stat(path)
+        return _ffprobe_duration_cached(path, st.st_mtime_ns, st.st_size)
     except Exception:
         return None
 
 
+# concat demuxer 以 -c copy 拼接时要求各段视频流参数完全一致（MP4 只保留首段 avcC），逐项比对以下字段
+_STREAM_SIGNATURE_FIELDS = (
+    "codec_name", "profile", "level", "width", "height", "sample_aspect_ratio",
+    "pix_fmt", "r_frame_rate", "time_base", "extradata_hash",
+)
+
+
+@functools.lru_cache(maxsize=4096)
+def _ffprobe_stream_signature_cached(path: str, mtime_ns: int, size: int) -> tuple[str, ...]:
+    """首个视频流的参数签名（_STREAM_SIGNATURE_FIELDS 顺序，extradata 取 SHA256），与 _ffprobe_duration_cached 同样按文件版本缓存。"""
+    r = subprocess.run(
+        [
+            "ffprobe", "-v", "error", "-select_streams", "v:0", "-show_data_hash", "sha256",
+            "-show_entries", "stream=" + ",".join(_STREAM_SIGNATURE_FIELDS),
+            "-of", "default=noprint_wrappers=1", path,
+        ],
+        capture_output=True,
+        text=True,
+        timeout=20,
+    )
+    if r.returncode != 0:
+        raise RuntimeError(f"ffprobe exit {r.returncode}")
+    info = dict(line.split("=", 1) for line in (r.stdout or "").splitlines() if "=" in line)
+    if not info.get("extradata_hash"):
+        raise RuntimeError("ffprobe: no extradata")
+    return tuple(info.get(k, "") for k in _STREAM_SIGNATURE_FIELDS)
+
+
+def _stream_signature(path: str) -> tuple[str, ...] | None:
+    try:
+        st = os.stat(path)
+        return _ffprobe_stream_signature_cached(path, st.st_mtime_ns, st.st_size)
+    except Exception:
+        return None
+
+
+def _ffprobe_durations_batch(paths: list[Path]) -> list[float | None]:
+    """并发探测多个文件时长（ffprobe 子进程并行，不占 GIL），结果与 paths 顺序一致。"""
+    if len(paths) <= 1:
+        return [_ffprobe_duration_sec(str(p)) for p in paths]
+    with ThreadPoolExecutor(max_workers=min(8, len(paths))) as ex:
+        return list(ex.map(lambda p: _ffprobe_duration_sec(str(p)), paths))
+
+
 def _retime_video_to_duration(
     in_path: str | Path,
     out_path: str | Path,
@@ -377,12 +486,14 @@ def _retime_video_to_duration(
     fps: int = 30,
     preset: str = "veryfast",
     crf: str = "18",
+    threads: int | None = None,
 ) -> bool:
     """
     将视频裁切/延长到 target_sec：
     - 需要变短：用 -t 裁切
     - 需要变长：用 tpad 克隆最后一帧补齐
     输出统一编码参数，便于后续 concat copy 稳定。
+    threads：限制 libx264 线程数，多段并行编码时避免超额占用 CPU。
     """
     try:
         target_sec = float(target_sec)
@@ -413,8 +524,10 @@ def _retime_video_to_duration(
         preset,
         "-crf",
         crf,
-        out_path_s,
     ]
+    if threads:
+        cmd.extend(["-threads", str(threads)])
+    cmd.append(out_path_s)
     try:
         r = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
         return r.returncode == 0 and os.path.isfile(out_path_s)
@@ -422,6 +535,58 @@ def _retime_video_to_duration(
         return False
 
 
+def _segment_target(i: int, p: Path, target_durations: list[float]) -> float:
+    try:
+        target = float(target_durations[i]) if i < len(target_durations) else (_ffprobe_duration_sec(str(p)) or 5.0)
+    except Exception:
+        target = _ffprobe_duration_sec(str(p)) or 5.0
+    if target <= 0:
+        target = 5.0
+    return target
+
+
+def _retime_segment(i: int, p: Path, target: float, fps: int, threads: int | None) -> Path:
+    # 输出到同目录，避免跨盘符/相对路径导致 ffmpeg concat 限制
+    out_path = p.parent / f"retimed_{i:03d}.mp4"
+    ok = _retime_video_to_duration(p, out_path, target, fps=fps, threads=threads)
+    if not ok:
+        # 兜底：哪怕无法严格对齐，也尽量统一编码/去掉音轨，避免后续 concat copy 因流不一致失败
+        cur = _ffprobe_duration_sec(str(p)) or 5.0
+        ok = _retime_video_to_duration(p, out_path, cur, fps=fps, threads=threads)
+    return out_path if ok else p
+
+
+def _can_trim_all_by_copy(local_paths: list[Path], targets: list[float], fps: int) -> bool:
+    """
+    整批是否可全部用 -c copy 裁切：每段都只需变短（补齐 <= 0.04s），且所有段视频流签名完全一致并为 h264 + yuv420p + 目标帧率。
+    只要有一段需要重编码就整批重编码，保证送进 concat copy 的各段参数一致，不会把 copy 段与 libx264 段混拼。
+    """
+    durations = _ffprobe_durations_batch(local_paths)
+    if any(not cur or target - cur > 0.04 for cur, target in zip(durations, targets)):
+        return False
+    signatures = {_stream_signature(str(p)) for p in local_paths}
+    if len(signatures) != 1:
+        return False
+    sig = next(iter(signatures))
+    if sig is None:
+        return False
+    info = dict(zip(_STREAM_SIGNATURE_FIELDS, sig))
+    return info["codec_name"] == "h264" and info["pix_fmt"] == "yuv420p" and info["r_frame_rate"] == f"{fps}/1"
+
+
+def _trim_by_copy(in_path: Path, out_path: Path, target_sec: float) -> bool:
+    """-c copy 从片头截取 target_sec（不解码不编码）；起点为 0，无关键帧对齐问题，只截断片尾。"""
+    cmd = [
+        "ffmpeg", "-y", "-i", str(in_path), "-t", f"{target_sec:.3f}",
+        "-map", "0:v:0", "-an", "-c", "copy", str(out_path),
+    ]
+    try:
+        r = subprocess.run(cmd, capture_output=True, text=True, timeout=120)
+        return r.returncode == 0 and out_path.is_file()
+    except Exception:
+        return False
+
+
 def retime_local_segments_to_durations(
     local_paths: list[Path],
     target_durations: list[float],
@@ -430,26 +595,29 @@ def retime_local_segments_to_durations(
     """
     将本地分段视频按 target_durations 裁切/补齐为新分段文件，返回新路径列表（长度与 local_paths 一致）。
     若某段处理失败则回退为原文件路径。
+    整批只需裁切且各段流参数一致时全部 -c copy 截断；否则各段按 CPU 核数并行重编码，
+    每个 ffmpeg 分到的线程数随之收窄，总耗时约等于最慢一段。
     """
     if not local_paths:
         return []
-    out: list[Path] = []
-    for i, p in enumerate(local_paths):
-        try:
-            target = float(target_durations[i]) if i < len(target_durations) else (_ffprobe_duration_sec(str(p)) or 5.0)
-        except Exception:
-            target = _ffprobe_duration_sec(str(p)) or 5.0
-        if target <= 0:
-            target = 5.0
-        # 输出到同目录，避免跨盘符/相对路径导致 ffmpeg concat 限制
-        out_path = p.parent / f"retimed_{i:03d}.mp4"
-        ok = _retime_video_to_duration(p, out_path, target, fps=fps)
-        if not ok:
-            # 兜底：哪怕无法严格对齐，也尽量统一编码/去掉音轨，避免后续 concat copy 因流不一致失败
-            cur = _ffprobe_duration_sec(str(p)) or 5.0
-            ok = _retime_video_to_duration(p, out_path, cur, fps=fps)
-        out.append(out_path if ok else p)
-    return out
+    targets = [_segment_target(i, p, target_durations) for i, p in enumerate(local_paths)]
+    if _can_trim_all_by_copy(local_paths, targets, fps):
+        out = [p.parent / f"retimed_{i:03d}.mp4" for i, p in enumerate(local_paths)]
+        if all(_trim_by_copy(p, o, t) for p, o, t in zip(local_paths, out, targets)):
+            return out
+        logger.warning("retime_local_segments_to_durations: -c copy 裁切失败，整批改为重编码")
+    if len(local_paths) == 1:
+        return [_retime_segment(0, local_paths[0], targets[0], fps, None)]
+    cpus = os.cpu_count() or 4
+    workers = min(len(local_paths), cpus)
+    threads = max(1, cpus // workers)
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        return list(
+            ex.map(
+                lambda item: _retime_segment(item[0], item[1], targets[item[0]], fps, threads),
+                enumerate(local_paths),
+            )
+        )
 
 
 def concat_video_segments(
@@ -510,7 +678,7 @@ def concat_video_segments_with_durations(
             with_transitions = False
         logger.info(f"调整视频段时长为: {target_durations}")
         effective_paths = retime_local_segments_to_durations(local_paths, target_durations)
-    segment_durations = [_ffprobe_duration_sec(str(p)) or 5.0 for p in effective_paths]
+    segment_durations = [d or 5.0 for d in _ffprobe_durations_batch(effective_paths)]
     logger.info(f"调整后的视频段时长: {segment_durations}")
     merged = concat_local_segments(
         effective_paths,
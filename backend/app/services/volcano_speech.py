@@ -1,7 +1,9 @@
 """火山引擎豆包语音大模型 TTS（HTTP 一次性合成）。与 iflytek_speech 同接口：返回 (本地 mp3 路径, error_msg)。
 支持多情感音色：传入 emotion 时对支持情感的 voice_type 生效，增强代入感。"""
 import base64
+import functools
 import os
+import re
 import tempfile
 import uuid
 from typing import Optional, Tuple
@@ -103,6 +105,12 @@ EMOTION_KEYWORDS: list[tuple[list[str], str]] = [
 ]
 
 
+# 每类情绪的关键词编译成一条正则，按 EMOTION_KEYWORDS 顺序逐类 search（类内任一词命中即返回该情绪，与逐词判断结果一致）
+_EMOTION_KEYWORD_RES: list[tuple[re.Pattern[str], str]] = [
+    (re.compile("|".join(map(re.escape, keywords))), emotion) for keywords, emotion in EMOTION_KEYWORDS
+]
+
+
 def _voice_id_to_voice_type(voice_id: Optional[str]) -> tuple[str, bool, list[str]]:
     """将业务 voice_id（火山 voice_type、中文名、或 MiniMax 风格如 female-yujie/male-qn-jingying）映射到火山 voice_type。"""
     s = (voice_id or "").strip()
@@ -133,15 +141,18 @@ def _voice_id_to_voice_type(voice_id: Optional[str]) -> tuple[str, bool, list[st
     return VOLCANO_VOICE_OPTIONS[0][0], VOLCANO_VOICE_OPTIONS[0][4], VOLCANO_VOICE_OPTIONS[0][5]
 
 
+@functools.lru_cache(maxsize=1024)
 def infer_emotion_from_text(text: str) -> Optional[str]:
-    """从台词/文案推断情绪，返回火山 emotion 传参；关键词优先，再结合标点做轻度推断，避免全是 neutral。"""
+    """
+    从台词/文案推断情绪，返回火山 emotion 传参；关键词优先，再结合标点做轻度推断，避免全是 neutral。
+    同一句台词在情绪标注兜底与逐镜 TTS 中会各判一次，结果按文本缓存。
+    """
     if not text or not text.strip():
         return "neutral"
     t = text.strip()[:200]
-    for keywords, emotion in EMOTION_KEYWORDS:
-        for kw in keywords:
-            if kw in t:
-                return emotion
+    for pattern, emotion in _EMOTION_KEYWORD_RES:
+        if pattern.search(t):
+            return emotion
     # 无关键词时：感叹号多偏激动/兴奋，问号偏惊讶，省略号+短句偏冷淡/遗憾
     if "！" in t or "!" in t:
         return "excited"
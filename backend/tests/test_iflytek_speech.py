@@ -41,5 +41,69 @@ def test_iflytek_tts_simple():
         pass
 
 
+class _FakeWebSocket:
+    """按预设顺序回放音频帧的假 WebSocket，记录发送的文本帧。"""
+
+    def __init__(self, frames):
+        self.sent = []
+        self._frames = list(frames)
+
+    def send(self, payload):
+        self.sent.append(payload)
+
+    def settimeout(self, timeout):
+        pass
+
+    def recv(self):
+        return self._frames.pop(0) if self._frames else ""
+
+    def close(self):
+        pass
+
+
+def _audio_frame(seq, audio, status=1):
+    import base64
+    import json
+    return json.dumps({
+        "header": {"code": 0},
+        "payload": {"audio": {"seq": seq, "status": status, "audio": base64.b64encode(audio).decode("ascii")}},
+    })
+
+
+def test_iflytek_multi_chunk_keeps_every_frame(monkeypatch):
+    """超过 MAX_TEXT_BYTES 的文本分多个文本帧发送；各文本帧音频 seq 各自从 1 编号、有重复或乱序 seq 时，所有音频按序拼接，不丢帧。"""
+    from app.services import iflytek_speech
+
+    text = "你好，这是一段较长的配音文本。 " * 400
+    assert len(text.encode("utf-8")) > iflytek_speech.MAX_TEXT_BYTES
+    frames = [
+        _audio_frame(1, b"a1"), _audio_frame(2, b"a2"),
+        _audio_frame(1, b"b1"), _audio_frame(2, b"b2"), _audio_frame(2, b"b2x"),
+        _audio_frame(1, b"c1"), _audio_frame(3, b"c3"), _audio_frame(2, b"c2", status=2),
+    ]
+    ws = _FakeWebSocket(frames)
+
+    class _FakeModule:
+        WebSocketTimeoutException = TimeoutError
+
+        @staticmethod
+        def create_connection(url, timeout=None):
+            return ws
+
+    monkeypatch.setattr(iflytek_speech, "websocket", _FakeModule)
+    monkeypatch.setattr(iflytek_speech, "IFLYTEK_APP_ID", "app")
+    monkeypatch.setattr(iflytek_speech, "IFLYTEK_API_KEY", "key")
+    monkeypatch.setattr(iflytek_speech, "IFLYTEK_API_SECRET", "secret")
+    monkeypatch.setattr(iflytek_speech, "_build_auth_url", lambda: "wss://fake")
+
+    path, err = iflytek_speech.text_to_speech(text)
+    assert err is None
+    try:
+        assert len(ws.sent) > 1
+        assert Path(path).read_bytes() == b"a1a2b1b2b2xc1c2c3"
+    finally:
+        os.unlink(path)
+
+
 if __name__ == "__main__":
     test_iflytek_tts_simple()
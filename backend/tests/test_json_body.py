@@ -0,0 +1,46 @@
+"""测试 main._json_body：非法请求体返回 422（不回显原始 body），且路由在 OpenAPI 中保留 requestBody。"""
+import os
+import sys
+
+_backend_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _backend_root not in sys.path:
+    sys.path.insert(0, _backend_root)
+os.chdir(_backend_root)
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+
+client = TestClient(app)
+
+JSON_BODY_ROUTES = {
+    "/api/create": "CreateRequest",
+    "/api/video": "VideoRequest",
+    "/api/video/regenerate-shot": "RegenerateShotRequest",
+    "/api/video/concat-after-kling-tasks": "ConcatAfterKlingTasksRequest",
+}
+
+
+def test_non_utf8_body_returns_422():
+    """非 UTF-8 请求体：返回 422 校验错误，而不是默认 422 处理器解码 body 失败导致的 500。"""
+    r = client.post("/api/create", content=b"\xff\xfe{", headers={"Content-Type": "application/json"})
+    assert r.status_code == 422
+    assert "body" not in r.json()
+
+
+def test_invalid_body_not_echoed():
+    """JSON 解析失败时不回显整段原始请求体（大 base64 请求体不应原样返回）。"""
+    big = "A" * 200_000
+    r = client.post("/api/create", content=f'{{"input": "{big}', headers={"Content-Type": "application/json"})
+    assert r.status_code == 422
+    assert big not in r.text
+
+
+def test_openapi_keeps_request_bodies():
+    """_json_body 路由在 OpenAPI 中仍声明 requestBody，且引用的模型在 components 中。"""
+    schema = app.openapi()
+    for path, model_name in JSON_BODY_ROUTES.items():
+        body = schema["paths"][path]["post"]["requestBody"]
+        assert body["required"] is True
+        assert body["content"]["application/json"]["schema"] == {"$ref": f"#/components/schemas/{model_name}"}
+        assert model_name in schema["components"]["schemas"]